@@ -0,0 +1,291 @@
+"""
+WINDOWED ANALYTICS
+Vectorized checks for rules that a per-row condition cannot express:
+rolling-window sums per key (structuring, e.g. AML002), uniqueness via
+hash grouping (GEN003) and record age from parsed timestamps (GEN005).
+Everything is sort- or hash-based over whole columns, so tens of millions
+of rows stay in numpy.
+
+The rule engine asks plan_analytic() for rules whose condition did not
+compile; a rule can also spell out its check explicitly:
+
+    {"ruleid": "AML002", "analytic": {"type": "window_sum", "key": "UserId",
+     "time": "TransactionTime", "value": "NumberOfItemsPurchased * CostPerItem",
+     "window_hours": 24, "limit": 10000}}
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Words in a rule that name the grouping key, mapped to column-name fragments
+KEY_WORDS = {
+    "user": ("userid", "user_id", "user", "customer"),
+    "customer": ("customerid", "customer_id", "customer", "userid", "user"),
+    "account": ("accountid", "account_id", "account"),
+    "card": ("cardid", "card_id", "card"),
+}
+AMOUNT_COLUMNS = ("amount", "transactionamount", "value", "total")
+UNIT_HOURS = {"minute": 1 / 60, "min": 1 / 60, "hour": 1, "hr": 1, "h": 1, "day": 24, "d": 24}
+
+_WINDOW = re.compile(r"\b(?:within|in|over|during)\s+(?:a\s+|the\s+|any\s+)?(\d+(?:\.\d+)?)\s*-?\s*"
+                     r"(minute|min|hour|hr|h|day|d)s?\b")
+_LIMIT = re.compile(r"(?:under|below|less than|<)\s*\$?\s*([\d,]+(?:\.\d+)?)")
+_PRODUCT = re.compile(r"([A-Za-z_]\w*)\s*\*\s*([A-Za-z_]\w*)")
+_UNIQUE = re.compile(r"([A-Za-z_]\w*)\s+(?:must|should|has to|needs to)\s+be\s+unique|"
+                     r"unique\s*\(\s*([A-Za-z_]\w*)\s*\)|duplicate\s+([A-Za-z_]\w*)", re.I)
+_OLDER = re.compile(r"older than\s+(\d+(?:\.\d+)?)\s*(day|d|hour|h)s?\b")
+
+
+# --------------------------
+# PRIMITIVES
+# --------------------------
+def rolling_window(keys: np.ndarray, times: np.ndarray, values: np.ndarray, window: np.timedelta64):
+    """
+    Sum and count of values per key over the trailing time window
+
+    For each row, covers the rows with the same key whose time lies in
+    [time - window, time]. Rows are sorted once by (key, time); the window
+    start of every row is found with one searchsorted on a combined
+    key/time axis.
+
+    Returns:
+        tuple: (sums, counts, window start positions, sort order); sums,
+               counts and starts are in sorted order
+    """
+    codes = pd.factorize(keys)[0].astype(np.int64)
+    seconds = times.astype("datetime64[s]").astype(np.int64)
+    order = np.lexsort((seconds, codes))
+    codes, seconds, values = codes[order], seconds[order], values[order].astype(np.float64)
+    if not len(order):
+        empty = np.zeros(0)
+        return empty, empty.astype(np.int64), empty.astype(np.int64), order
+
+    width = int(window / np.timedelta64(1, "s"))
+    offset = seconds - seconds.min()
+    span = int(offset.max()) + width + 1
+    if (int(codes.max()) + 1) * span < 2 ** 62:
+        # Each key gets its own stretch of the axis, so windows never cross keys
+        axis = codes * span + offset
+        starts = np.searchsorted(axis, axis - width, side="left")
+    else:
+        # Too many keys for one int64 axis: search key by key
+        starts = np.empty(len(offset), dtype=np.int64)
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(codes)]):
+            starts[lo:hi] = lo + np.searchsorted(offset[lo:hi], offset[lo:hi] - width, side="left")
+
+    total = np.concatenate(([0.0], np.cumsum(values)))
+    positions = np.arange(len(order))
+    sums = total[positions + 1] - total[starts]
+    counts = positions - starts + 1
+    return sums, counts, starts, order
+
+
+def spread_windows(starts: np.ndarray, hits: np.ndarray) -> np.ndarray:
+    """Mark every sorted row inside a window that ends at a hit row"""
+    marks = np.zeros(len(starts) + 1, dtype=np.int64)
+    ends = np.flatnonzero(hits)
+    np.add.at(marks, starts[ends], 1)
+    np.add.at(marks, ends + 1, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def duplicated(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Rows whose values in `columns` occur more than once (hash grouping)"""
+    if len(columns) == 1:
+        codes = pd.factorize(df[columns[0]])[0]
+        counts = np.bincount(codes[codes >= 0], minlength=1)
+        return (codes >= 0) & (counts[np.maximum(codes, 0)] > 1)
+    return df.duplicated(subset=columns, keep=False).to_numpy()
+
+
+def age(times: np.ndarray, now) -> np.ndarray:
+    """Age of each timestamp as a timedelta64 array (NaT stays NaT)"""
+    return np.datetime64(pd.Timestamp(now).to_datetime64()) - times.astype("datetime64[ns]")
+
+
+# --------------------------
+# CHECKS
+# --------------------------
+def transaction_codes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Integer code per row, equal for the rows (line items) of one transaction
+
+    Rows without a transaction id, or tables without an id column, count
+    as one transaction each.
+    """
+    from ruleengine import find_transaction_id_column
+    id_column = find_transaction_id_column(df.columns)
+    if id_column is None:
+        return np.arange(len(df))
+    codes = pd.factorize(df[id_column])[0].astype(np.int64)
+    missing = np.flatnonzero(codes < 0)
+    codes[missing] = codes.max(initial=-1) + 1 + np.arange(len(missing))
+    return codes
+
+
+@dataclass
+class WindowSum:
+    """Several sub-limit transactions by one key within a window that together reach the limit"""
+    key: str
+    time: str
+    value: Any  # expression tree (see ruleengine.compile_condition)
+    window: np.timedelta64
+    limit: float
+    min_count: int = 2
+    columns: List[str] = field(default_factory=list)
+
+    def violations(self, evaluator) -> np.ndarray:
+        amounts = pd.to_numeric(pd.Series(evaluator.eval(self.value)), errors="coerce").to_numpy(np.float64)
+        times = evaluator.dates(self.time).to_numpy()
+        keys = evaluator.column(self.key).to_numpy()
+        mask = np.zeros(len(amounts), dtype=bool)
+        rows = np.flatnonzero(~np.isnan(amounts) & ~pd.isna(times))
+        if not len(rows):
+            return mask
+        # Line items of one transaction are one amount, so min_count counts transactions
+        _, first, inverse = np.unique(transaction_codes(evaluator.df)[rows], return_index=True,
+                                      return_inverse=True)
+        totals = np.bincount(inverse, weights=amounts[rows])
+        candidates = np.flatnonzero(totals < self.limit)
+        if not len(candidates):
+            return mask
+        leads = rows[first[candidates]]
+        sums, counts, starts, order = rolling_window(keys[leads], times[leads], totals[candidates], self.window)
+        hits = (counts >= self.min_count) & (sums >= self.limit)
+        flagged = np.zeros(len(totals), dtype=bool)
+        flagged[candidates[order[spread_windows(starts, hits)]]] = True
+        mask[rows[flagged[inverse]]] = True
+        return mask
+
+
+@dataclass
+class Unique:
+    """Values of the columns must not repeat"""
+    columns: List[str]
+
+    def violations(self, evaluator) -> np.ndarray:
+        return duplicated(evaluator.df, self.columns)
+
+
+@dataclass
+class OlderThan:
+    """Records whose timestamp is further back than max_age"""
+    time: str
+    max_age: np.timedelta64
+    columns: List[str] = field(default_factory=list)
+
+    def violations(self, evaluator) -> np.ndarray:
+        ages = age(evaluator.dates(self.time).to_numpy(), evaluator.now)
+        return ~np.isnat(ages) & (ages > self.max_age)
+
+
+# --------------------------
+# PLANNING
+# --------------------------
+def _column(name, columns):
+    lookup = {c.lower(): c for c in columns}
+    return lookup.get(str(name).lower())
+
+
+def _time_column(columns):
+    for column in columns:
+        if "time" in column.lower() or "date" in column.lower():
+            return column
+    return None
+
+
+def _key_column(text, columns):
+    """The column a rule groups by: 'by UserId', 'same user', 'per account'"""
+    for match in re.finditer(r"\b(?:same|by|per|each)\s+(?:the\s+same\s+)?([A-Za-z_]\w*)", text):
+        word = match.group(1)
+        column = _column(word, columns)
+        if column:
+            return column
+        for fragment in KEY_WORDS.get(word.lower().rstrip("s"), ()):
+            for column in columns:
+                if fragment in column.lower():
+                    return column
+    return None
+
+
+def _value_expression(text, columns):
+    """Amount expression: a column product named in the rule, or an amount column"""
+    for left, right in _PRODUCT.findall(text):
+        if _column(left, columns) and _column(right, columns):
+            return f"{_column(left, columns)} * {_column(right, columns)}"
+    for column in columns:
+        if column.lower() in AMOUNT_COLUMNS:
+            return column
+    return None
+
+
+def _window_sum(spec: Dict[str, Any], columns) -> Optional[WindowSum]:
+    from ruleengine import RuleCompileError, compile_condition
+    key, time = _column(spec.get("key"), columns), _column(spec.get("time") or _time_column(columns), columns)
+    if not key or not time or not spec.get("value") or spec.get("limit") is None:
+        return None
+    try:
+        tree, used = compile_condition(str(spec["value"]), columns)
+    except RuleCompileError:
+        return None
+    hours = float(spec.get("window_hours", 24))
+    return WindowSum(key=key, time=time, value=tree, window=np.timedelta64(int(hours * 3600), "s"),
+                     limit=float(spec["limit"]), min_count=int(spec.get("min_count", 2)),
+                     columns=list(dict.fromkeys([key, time] + used)))
+
+
+def plan_analytic(rule: Dict[str, Any], columns: Optional[List[str]]):
+    """
+    Pick the analytic check that implements a rule, if one does
+
+    Uses the rule's explicit 'analytic' spec when present, otherwise reads
+    its condition and description. Returns None for anything else.
+    """
+    if not columns:
+        return None
+    spec = rule.get("analytic")
+    if isinstance(spec, dict):
+        kind = spec.get("type")
+        if kind == "window_sum":
+            return _window_sum(spec, columns)
+        if kind == "unique":
+            found = [_column(c, columns) for c in spec.get("columns", [])]
+            return Unique(found) if found and all(found) else None
+        if kind == "older_than":
+            time = _column(spec.get("time") or _time_column(columns), columns)
+            return OlderThan(time, np.timedelta64(int(float(spec["days"]) * 86400), "s"), [time]) if time else None
+        return None
+
+    condition = str(rule.get("condition") or "")
+    text = f"{condition} {rule.get('description') or ''}"
+    lowered = text.lower()
+
+    match = _UNIQUE.search(text)
+    if match:
+        column = _column(next(g for g in match.groups() if g), columns)
+        if column:
+            return Unique([column])
+
+    window = _WINDOW.search(lowered)
+    limit = _LIMIT.search(lowered)
+    if window and limit:
+        hours = float(window.group(1)) * UNIT_HOURS[window.group(2)]
+        return _window_sum({
+            "key": _key_column(text, columns),
+            "time": _time_column(columns),
+            "value": _value_expression(text, columns),
+            "window_hours": hours,
+            "limit": float(limit.group(1).replace(",", "")),
+        }, columns)
+
+    older = _OLDER.search(lowered)
+    time = _time_column(columns)
+    if older and time:
+        hours = float(older.group(1)) * UNIT_HOURS[older.group(2)]
+        return OlderThan(time, np.timedelta64(int(hours * 3600), "s"), [time])
+    return None
@@ -0,0 +1,296 @@
+"""
+BATCH PROFILING CLI
+Headless entry point for large runs: profiles every transaction CSV in a
+directory or glob against one set of rules documents, across a process
+pool, and writes a JSONL record per file, a Parquet table of
+per-transaction verdicts per file and a run summary. Settings come from
+the command line and the environment, never from st.secrets.
+
+    python batchcli.py --rules docs/aml.pdf docs/kyc.docx --input "data/**/*.csv" --output runs/nightly
+    python batchcli.py ... --resume     # skip files already done in runs/nightly
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from llmclient import configure, get_setting
+
+logger = logging.getLogger("batchcli")
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = "results.jsonl"
+SUMMARY_FILE = "summary.json"
+TABLE_DIR = "transactions"
+DEFAULT_WORKERS = 4
+DEFAULT_API_CONCURRENCY = 4
+
+
+def find_inputs(patterns):
+    """Expand directories and globs into a sorted list of CSV paths"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.csv")
+        paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_done(output_dir):
+    """Path -> content hash of every file a previous run finished"""
+    done = {}
+    path = os.path.join(output_dir, RESULTS_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if record.get("status") == "done":
+                done[record["file"]] = record["sha256"]
+    return done
+
+
+def open_document(path):
+    with open(path, "rb") as f:
+        file_obj = BytesIO(f.read())
+    file_obj.name = os.path.basename(path)
+    return file_obj
+
+
+def _headless():
+    """Send the st.error/warning/info calls of the shared code to the log"""
+    import streamlit as st
+    st.error = logger.error
+    st.warning = logger.warning
+    st.info = logger.info
+
+
+def split_budget(workers, api_concurrency):
+    """
+    Processes to start and API requests each may have in flight
+
+    Every process needs at least one request slot, so there are never more
+    processes than api_concurrency; the total stays within the cap.
+    """
+    api_concurrency = max(1, api_concurrency)
+    workers = max(1, min(workers, api_concurrency))
+    return workers, api_concurrency // workers
+
+
+def init_worker(settings):
+    os.chdir(SRC_DIR)  # prompts and caches live next to the app
+    configure(use_secrets=False, **settings)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    _headless()
+
+
+def generate_all(rule_paths):
+    """Structured rules for each document (served from the rules cache when possible)"""
+    from rulesgeneration import generate_rules
+    generated = {}
+    for path in rule_paths:
+        result = generate_rules(open_document(path))
+        if result:
+            generated[os.path.basename(path)] = result
+            logger.info("rules for %s%s", os.path.basename(path), " (cached)" if result.get("cached") else "")
+        else:
+            logger.warning("no rules generated for %s; its text is sent instead", path)
+    return generated
+
+
+def process_file(path, digest, rule_paths, generated_results, batch, table_dir):
+    """Analyze one CSV; returns the JSONL record for it"""
+    from profiliing import analyze
+    from resultmodel import parse_analysis
+    from txnstore import load_transactions
+
+    started = time.time()
+    record = {"file": path, "sha256": digest, "status": "failed"}
+    try:
+        documents = {os.path.basename(p): open_document(p) for p in rule_paths}
+        transactions = load_transactions(path)
+        record["rows"] = transactions.num_rows
+        result = analyze(list(documents), transactions, batch=batch,
+                         documents=documents, generated_results=generated_results)
+        if result is None:
+            record["error"] = "analysis failed (see log)"
+            return record
+        data = result["analysis_data"]
+        model = parse_analysis(data)
+        if table_dir:
+            import pyarrow.parquet as pq
+            table_path = os.path.join(table_dir, f"{os.path.splitext(os.path.basename(path))[0]}-{digest[:12]}.parquet")
+            pq.write_table(model.to_table(), table_path)
+            record["table"] = table_path
+        record.update({
+            "status": "done",
+            "transactions": len(model),
+            "flagged": len(model.flagged_list),
+            "flagged_list": model.flagged_list,
+            "rules_list": model.rules_list(),
+            "usage": data.get("usage"),
+            "shards": data.get("shards"),
+            "local_rules_checked": data.get("local_rules_checked", 0),
+            "incremental": data.get("incremental"),
+            "cascade": data.get("cascade"),
+            "performance": result.get("performance"),
+        })
+    except Exception as e:
+        logger.exception("failed on %s", path)
+        record["error"] = str(e)
+    finally:
+        record["seconds"] = round(time.time() - started, 3)
+    return record
+
+
+def summarize(records, skipped, elapsed):
+    """Run totals: files, rows, throughput, tokens and time per stage"""
+    done = [r for r in records if r["status"] == "done"]
+    rows = sum(r.get("rows", 0) for r in done)
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    stages = {}
+    for r in done:
+        for key in tokens:
+            tokens[key] += int((r.get("usage") or {}).get(key) or 0)
+        for stage, timing in ((r.get("performance") or {}).get("stages") or {}).items():
+            stages[stage] = round(stages.get(stage, 0.0) + timing["seconds"], 3)
+    return {
+        "files": {"processed": len(records), "done": len(done),
+                  "failed": len(records) - len(done), "skipped": skipped},
+        "rows": rows,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 2) if elapsed else None,
+        "files_per_minute": round(60 * len(records) / elapsed, 2) if elapsed else None,
+        "tokens": tokens,
+        "stage_seconds": stages,
+        "flagged": sum(r.get("flagged", 0) for r in done),
+        "escalated_share": _escalated_share(done),
+    }
+
+
+def _escalated_share(done):
+    """Share of screened transactions that cascade mode escalated, over the whole run"""
+    screened = [r["cascade"] for r in done if r.get("cascade")]
+    total = sum(c["screened"] for c in screened)
+    return round(sum(c["escalated"] for c in screened) / total, 4) if total else None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profile transaction CSVs against rules documents")
+    parser.add_argument("--rules", nargs="+", required=True, help="rules documents (PDF/DOCX/TXT)")
+    parser.add_argument("--input", nargs="+", required=True, help="CSV files, directories or globs")
+    parser.add_argument("--output", required=True, help="directory for results.jsonl, Parquet and summary")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processes (at most --api-concurrency)")
+    parser.add_argument("--api-concurrency", type=int, default=DEFAULT_API_CONCURRENCY,
+                        help="API requests in flight across all processes")
+    parser.add_argument("--batch", action="store_true", help="shard each file into concurrent requests")
+    parser.add_argument("--generate-rules", action="store_true",
+                        help="extract structured rules first so they can be checked locally")
+    parser.add_argument("--resume", action="store_true", help="skip files already done in --output")
+    parser.add_argument("--no-parquet", action="store_true", help="only write results.jsonl")
+    parser.add_argument("--no-incremental", action="store_true",
+                        help="send every transaction, ignoring verdicts stored by earlier runs")
+    parser.add_argument("--cascade", action="store_true",
+                        help="screen every row first and send only suspicious ones to the main model")
+    parser.add_argument("--screen-model", help="fast model for the cascade screening pass "
+                                               "(without one --cascade has no effect)")
+    parser.add_argument("--replay", choices=["off", "record", "replay", "strict"],
+                        help="record model replies, answer repeats from them, or run offline from them")
+    parser.add_argument("--api-url")
+    parser.add_argument("--api-key")
+    parser.add_argument("--model")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Resolve paths before moving next to the prompts
+    rule_paths = [os.path.abspath(p) for p in args.rules]
+    inputs = find_inputs(args.input)
+    output_dir = os.path.abspath(args.output)
+    table_dir = None if args.no_parquet else os.path.join(output_dir, TABLE_DIR)
+    os.makedirs(table_dir or output_dir, exist_ok=True)
+
+    workers, per_process = split_budget(args.workers, args.api_concurrency)
+    if workers < args.workers:
+        logger.info("using %d process(es) so at most %d API request(s) are in flight", workers, args.api_concurrency)
+    configure(use_secrets=False, API_URL=args.api_url, API_KEY=args.api_key, MODEL=args.model,
+              LLM_REPLAY_MODE=args.replay, INCREMENTAL_ANALYSIS=False if args.no_incremental else None,
+              CASCADE_MODE=True if args.cascade else None, SCREEN_MODEL=args.screen_model)
+    # Each process gets its share of the API budget
+    settings = {
+        "API_URL": get_setting("API_URL"),
+        "API_KEY": get_setting("API_KEY"),
+        "MODEL": get_setting("MODEL"),
+        "LLM_MAX_CONCURRENCY": per_process,
+        "LLM_RATE_PER_SEC": float(get_setting("LLM_RATE_PER_SEC")) / workers,
+        "LLM_REPLAY_MODE": get_setting("LLM_REPLAY_MODE"),
+        "INCREMENTAL_ANALYSIS": get_setting("INCREMENTAL_ANALYSIS", True),
+        "CASCADE_MODE": get_setting("CASCADE_MODE", False),
+        "SCREEN_MODEL": get_setting("SCREEN_MODEL"),
+    }
+    init_worker(settings)
+
+    done = load_done(output_dir) if args.resume else {}
+    todo, skipped = [], 0
+    for path in inputs:
+        digest = file_digest(path)
+        if done.get(path) == digest:
+            skipped += 1
+        else:
+            todo.append((path, digest))
+    logger.info("%d file(s) to profile, %d skipped", len(todo), skipped)
+
+    generated = generate_all(rule_paths) if args.generate_rules else {}
+
+    started = time.time()
+    records = []
+    with open(os.path.join(output_dir, RESULTS_FILE), "a", encoding="utf-8") as results, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=init_worker, initargs=(settings,)) as pool:
+        futures = {pool.submit(process_file, path, digest, rule_paths, generated, args.batch, table_dir): (path, digest)
+                   for path, digest in todo}
+        for count, future in enumerate(as_completed(futures), start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker died or its record could not be sent back; the other files go on
+                path, digest = futures[future]
+                logger.error("failed on %s: %r", path, e)
+                record = {"file": path, "sha256": digest, "status": "failed",
+                          "error": str(e) or type(e).__name__, "seconds": None}
+            records.append(record)
+            results.write(json.dumps(record, default=str) + "\n")
+            results.flush()
+            logger.info("[%d/%d] %s %s (%ss)", count, len(todo), record["status"],
+                        os.path.basename(record["file"]), record["seconds"])
+
+    summary = summarize(records, skipped, time.time() - started)
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["files"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
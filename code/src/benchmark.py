@@ -0,0 +1,231 @@
+"""
+BENCHMARK SUITE
+Times every stage of a profiling run on synthetic data against the local
+mock chat endpoint: rules text extraction, CSV loading, prompt building,
+the request/response round trip, extract_json_from_string and dashboard
+data preparation. Each run is appended to a JSONL file together with the
+git commit, so runs can be compared across commits.
+
+    python benchmark.py --rows 1000 10000 100000 --latency 0.2
+    python benchmark.py --rows 1000000 --compare HEAD~1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from llmclient import configure
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(".cache", "benchmarks")
+RESULTS_FILE = "results.jsonl"
+DEFAULT_ROWS = [1000, 10000, 100000]
+STAGES = ["extract_text", "csv_load", "prompt_build", "request", "parse_json", "dashboard_prep"]
+
+RULE_TEXT = [
+    "GEN001 UserId cannot be negative except for the special value -1.",
+    "GEN002 TransactionTime must not be in the future.",
+    "GEN003 TransactionId must be unique.",
+    "GEN004 ItemDescription cannot be numerical.",
+    "GEN005 Transactions older than 365 days should trigger a data validation alert.",
+    "AML001 Transactions above $10,000 (NumberOfItemsPurchased * CostPerItem) must be reported.",
+    "AML002 Multiple transactions under $10,000 by the same UserId within 24 hours should be flagged.",
+    "AML003 Transactions originating from high-risk countries must be flagged.",
+]
+
+
+def git_commit():
+    """(commit hash, dirty flag) of the working tree, or (None, None) outside git"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=SRC_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def resolve_commit(ref):
+    try:
+        return subprocess.run(["git", "rev-parse", ref], cwd=SRC_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ref
+
+
+def rules_pdf(pages):
+    """A rules document of the given page count, as PDF bytes"""
+    from extraction import fitz
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = f"Section {page_number + 1}: Transaction Data Audit Rules\n\n" + "\n\n".join(RULE_TEXT * 4)
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=9)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def time_stage(func, repeat):
+    """Run func `repeat` times; returns (last result, timing stats in seconds)"""
+    runs, result = [], None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - started)
+    return result, {"median": statistics.median(runs), "min": min(runs), "runs": runs}
+
+
+def bench_size(rows, args, mock, pdf, data_dir):
+    """Time every stage for one table size"""
+    import txnstore
+    from dashboard import build_transaction_view
+    from extraction import extract_bytes, extract_pdf
+    from llmclient import chat_completion
+    from profiliing import build_payload, read_prompts, shard_csv
+    from promptbuilder import build_transaction_block, payload_tokens
+    from synthdata import write_csv
+    from util import extract_json_from_string
+
+    path = os.path.join(data_dir, f"tx-{rows}-{args.violation_rate}-{args.seed}.csv")
+    generated = 0.0
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        write_csv(path, rows, args.violation_rate, args.seed)
+        generated = time.perf_counter() - started
+
+    stages, metrics = {}, {"csv_bytes": os.path.getsize(path), "generate_seconds": generated}
+
+    # Cold extraction bypasses the memo; the warm figure is a memo hit
+    document, stages["extract_text"] = time_stage(lambda: extract_pdf(pdf), args.repeat)
+    extract_bytes(pdf, "rules.pdf")
+    _, warm = time_stage(lambda: extract_bytes(pdf, "rules.pdf"), args.repeat)
+    metrics["extract_text_memo_hit"] = warm["median"]
+
+    def load():
+        txnstore._tables.clear()
+        txnstore._file_keys.clear()
+        return txnstore.load_transactions(path).to_pandas()
+    df, stages["csv_load"] = time_stage(load, args.repeat)
+
+    prompt, system_prompt = read_prompts()
+
+    def build():
+        legend, compact = build_transaction_block(df, document)
+        return [build_payload(prompt, system_prompt, f"{legend}\n{shard}".strip(), document, "bench.csv")
+                for shard in shard_csv(compact)]
+    payloads, stages["prompt_build"] = time_stage(build, args.repeat)
+    metrics["shards"] = len(payloads)
+    metrics["prompt_tokens"] = sum(payload_tokens(p) for p in payloads)
+
+    mock.transactions = min(rows, args.max_response_transactions)
+    reply, stages["request"] = time_stage(lambda: chat_completion(payloads[0]), args.repeat)
+    content = reply["choices"][0]["message"]["content"]
+    metrics["response_bytes"] = len(content)
+
+    def parse():
+        # extract_json_from_string echoes what it parses; keep that out of the timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            return extract_json_from_string(content)
+    parsed, stages["parse_json"] = time_stage(parse, args.repeat)
+
+    _, stages["dashboard_prep"] = time_stage(lambda: build_transaction_view(parsed["analysis_data"]), args.repeat)
+    metrics["response_transactions"] = mock.transactions
+    return {"rows": rows, "stages": stages, "metrics": metrics}
+
+
+def load_runs(output_dir):
+    path = os.path.join(output_dir, RESULTS_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(run, baseline):
+    """Print per-stage medians of a run next to a baseline run"""
+    print(f"\nvs {str(baseline.get('commit'))[:10]} ({baseline['timestamp']})")
+    print(f"{'rows':>10} {'stage':<16} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    base = {r["rows"]: r["stages"] for r in baseline["results"]}
+    for result in run["results"]:
+        for stage in STAGES:
+            before = base.get(result["rows"], {}).get(stage)
+            now = result["stages"][stage]["median"]
+            if before:
+                ratio = now / before["median"] if before["median"] else float("inf")
+                print(f"{result['rows']:>10} {stage:<16} {before['median']:>10.4f} {now:>10.4f} {ratio:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the profiling pipeline")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="table sizes")
+    parser.add_argument("--violation-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", type=int, default=20, help="pages in the synthetic rules PDF")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock endpoint latency in seconds")
+    parser.add_argument("--max-response-transactions", type=int, default=5000,
+                        help="cap on transactions in each mock reply")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="directory for results.jsonl")
+    parser.add_argument("--data-dir", help="where synthetic CSVs are cached (default: a temp dir)")
+    parser.add_argument("--label", default="", help="free-text note stored with the run")
+    parser.add_argument("--compare", metavar="COMMIT",
+                        help="compare with the latest run recorded for this commit")
+    args = parser.parse_args(argv)
+
+    output_dir = os.path.abspath(args.output)
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    os.chdir(SRC_DIR)  # prompts live next to the app
+
+    from mockllm import MockLLM
+    mock = MockLLM(latency=args.latency)
+    configure(use_secrets=False, API_URL=mock.start(), API_KEY="benchmark", MODEL="mock",
+              LLM_RATE_PER_SEC=0, LLM_MAX_RETRIES=0)
+    pdf = rules_pdf(args.pages)
+
+    commit, dirty = git_commit()
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "label": args.label,
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "data_dir", "compare")},
+        "results": [],
+    }
+    for rows in args.rows:
+        result = bench_size(rows, args, mock, pdf, data_dir)
+        run["results"].append(result)
+        print(f"{rows:>10} rows  " + "  ".join(f"{stage}={result['stages'][stage]['median']:.4f}s"
+                                             for stage in STAGES))
+    mock.stop()
+
+    previous = load_runs(output_dir)
+    with open(os.path.join(output_dir, RESULTS_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+    if args.compare:
+        target = resolve_commit(args.compare)
+        matches = [r for r in previous if r.get("commit") and r["commit"].startswith(target)]
+        if matches:
+            compare(run, matches[-1])
+        else:
+            print(f"No recorded run for {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+UPLOAD BLOB STORE
+Content-addressed store for uploaded files on local disk. Session state
+keeps a small Blob handle instead of the upload bytes; a handle reads like
+a read-only binary file, served from a memory map of the stored file.
+Identical uploads from any session share one file. Stored files are
+evicted by age and by total size (least recently used first), except ones
+a live handle still points to, and mappings are closed least recently used
+first once their total size passes the memory high-water mark.
+"""
+
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from llmclient import get_setting
+from metrics import count
+
+DEFAULT_BLOB_DIR = os.path.join(".cache", "blobs")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # seconds since last use
+# Total size of memory-mapped blobs kept open between reads
+DEFAULT_HIGH_WATER = 256 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+
+
+class Blob:
+    """Handle on a stored upload that reads like a read-only binary file"""
+
+    def __init__(self, store: "BlobStore", digest: str, name: str, size: int):
+        self.store = store
+        self.digest = digest
+        self.name = name
+        self.size = size
+        self._position = 0
+
+    @property
+    def file_id(self) -> str:
+        # Same content, same id: lets txnstore reuse the parsed table
+        return self.digest
+
+    @property
+    def path(self) -> str:
+        return self.store.path(self.digest)
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self._position + size)
+        data = self.store.read(self.digest, self._position, end)
+        self._position += len(data)
+        return data
+
+    def getvalue(self) -> bytes:
+        return self.store.read(self.digest, 0, self.size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"Blob({self.name!r}, {self.digest[:12]}, {self.size} bytes)"
+
+
+class BlobStore:
+    """Stored uploads with LRU/age eviction on disk and a cap on mapped memory"""
+
+    def __init__(self, directory: str = DEFAULT_BLOB_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE, high_water: int = DEFAULT_HIGH_WATER):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.max_age = float(max_age)
+        self.high_water = int(high_water)
+        self.lock = threading.Lock()
+        self.handles = weakref.WeakSet()
+        self.mapped = OrderedDict()  # digest -> (file, mmap), least recently read first
+        self.mapped_bytes = 0
+        self.shared = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.blob")
+
+    def put(self, source, name: Optional[str] = None) -> Blob:
+        """
+        Store an upload (bytes or a readable file) and return a handle to it
+
+        Content already in the store is not written again.
+        """
+        name = name or getattr(source, "name", "") or "upload"
+        if isinstance(source, Blob):
+            return self._handle(source.digest, name, source.size)
+        if hasattr(source, "getvalue") or isinstance(source, (bytes, bytearray, memoryview)):
+            data = source.getvalue() if hasattr(source, "getvalue") else source
+            digest = hashlib.sha256(data).hexdigest()
+            written = not self._reuse(digest)
+            if written:
+                self._write(digest, data)
+            blob = self._handle(digest, name, len(data))
+        else:
+            blob, written = self._stream(source, name)
+        if written:
+            self.evict()  # after the handle exists, so the new blob is kept
+        return blob
+
+    def _stream(self, source, name):
+        """Copy a file object into the store while hashing it"""
+        if hasattr(source, "seek"):
+            source.seek(0)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        hasher, size = hashlib.sha256(), 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: source.read(READ_CHUNK), b""):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = hasher.hexdigest()
+        if self._reuse(digest):
+            os.remove(tmp)
+            return self._handle(digest, name, size), False
+        os.replace(tmp, self.path(digest))
+        count("cache_misses_total", cache="blobs")
+        return self._handle(digest, name, size), True
+
+    def open(self, digest: str, name: str = "") -> Optional[Blob]:
+        """Handle on already-stored content, or None if it is not (or no longer) stored"""
+        try:
+            size = os.path.getsize(self.path(digest))
+        except OSError:
+            return None
+        os.utime(self.path(digest))
+        return self._handle(digest, name or digest, size)
+
+    def _handle(self, digest, name, size):
+        blob = Blob(self, digest, name, size)
+        with self.lock:
+            self.handles.add(blob)
+        return blob
+
+    def _reuse(self, digest):
+        try:
+            os.utime(self.path(digest))  # mark as recently used
+        except OSError:
+            return False
+        with self.lock:
+            self.shared += 1
+        count("cache_hits_total", cache="blobs")
+        return True
+
+    def _write(self, digest, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path(digest))
+        count("cache_misses_total", cache="blobs")
+
+    # --------------------------
+    # READING
+    # --------------------------
+    def read(self, digest: str, start: int, end: int) -> bytes:
+        """Bytes [start, end) of a blob, read through a shared memory map"""
+        if end <= start:
+            return b""
+        with self.lock:
+            entry = self.mapped.get(digest)
+            if entry is None:
+                f = open(self.path(digest), "rb")
+                entry = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self.mapped[digest] = entry
+                self.mapped_bytes += len(entry[1])
+                self._unmap(keep=digest)
+            else:
+                self.mapped.move_to_end(digest)
+            return entry[1][start:end]
+
+    def _unmap(self, keep=None):
+        """Close least recently read mappings while above the high-water mark (lock held)"""
+        for digest in list(self.mapped):
+            if self.mapped_bytes <= self.high_water:
+                break
+            if digest == keep:
+                continue
+            f, mapping = self.mapped.pop(digest)
+            self.mapped_bytes -= len(mapping)
+            mapping.close()
+            f.close()
+
+    # --------------------------
+    # EVICTION
+    # --------------------------
+    def evict(self):
+        """Drop expired blobs, then least recently used ones above max_bytes; blobs with live handles stay"""
+        now = time.time()
+        with self.lock:
+            pinned = {blob.digest for blob in list(self.handles)}
+        entries, total = [], 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".blob"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest = name[:-len(".blob")]
+            if digest not in pinned and now - stat.st_mtime > self.max_age:
+                self._remove(digest)
+                continue
+            total += stat.st_size
+            if digest not in pinned:
+                entries.append((stat.st_mtime, stat.st_size, digest))
+        for _, size, digest in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(digest)
+            total -= size
+
+    def _remove(self, digest):
+        with self.lock:
+            entry = self.mapped.pop(digest, None)
+            if entry is not None:
+                self.mapped_bytes -= len(entry[1])
+                entry[1].close()
+                entry[0].close()
+        try:
+            os.remove(self.path(digest))
+            with self.lock:
+                self.evictions += 1
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Disk usage, mapped memory and how often an upload was already stored"""
+        files = [f for f in os.listdir(self.directory) if f.endswith(".blob")]
+        with self.lock:
+            return {
+                "entries": len(files),
+                "bytes": sum(os.path.getsize(os.path.join(self.directory, f)) for f in files),
+                "handles": len(self.handles),
+                "mapped_bytes": self.mapped_bytes,
+                "shared": self.shared,
+                "evictions": self.evictions,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store configured from settings"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore(
+                directory=get_setting("BLOB_STORE_DIR", DEFAULT_BLOB_DIR),
+                max_bytes=get_setting("BLOB_STORE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                max_age=get_setting("BLOB_STORE_MAX_AGE", DEFAULT_MAX_AGE),
+                high_water=get_setting("BLOB_MEMORY_HIGH_WATER", DEFAULT_HIGH_WATER),
+            )
+        return _store
@@ -0,0 +1,182 @@
+"""
+MODEL CASCADE
+Two-tier analysis for mostly clean data. A cheap screening model
+(SCREEN_MODEL) looks at every transaction; the local rule checks cannot
+clear a transaction for the rules left to the model, so without one
+analyze() skips the cascade. Only the transactions the screening model
+flags or cannot clear go to the escalation tier (ESCALATE_MODEL, by
+default MODEL) for the full explanations and remediation. Each tier has
+its own model, shard size and concurrency:
+
+    SCREEN_MODEL, SCREEN_SHARD_TOKENS, SCREEN_MAX_WORKERS
+    ESCALATE_MODEL, ESCALATE_SHARD_TOKENS, ESCALATE_MAX_WORKERS
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dataprofile import profile_of
+from llmclient import get_client, get_setting
+from metrics import span
+from promptbuilder import add_usage, build_transaction_block, check_payload, log_usage
+from ruleengine import find_transaction_id_column
+from txnstore import TransactionTable
+from util import estimate_tokens, extract_json_from_string
+
+# Screening replies are short, so its shards can be much larger
+TIER_DEFAULTS = {
+    "screen": {"shard_tokens": 12000, "workers": 8},
+    "escalate": {"shard_tokens": 3000, "workers": 4},
+}
+# Rows used to estimate the prompt tokens per row when sharding
+SAMPLE_ROWS = 200
+
+
+def tier_settings(tier: str) -> Dict[str, Any]:
+    """Model, shard token budget and concurrency of one tier"""
+    prefix = tier.upper()
+    model = get_setting(f"{prefix}_MODEL")
+    if not model and tier == "escalate":
+        model = get_setting("MODEL")
+    return {
+        "model": model or None,
+        "shard_tokens": int(get_setting(f"{prefix}_SHARD_TOKENS", TIER_DEFAULTS[tier]["shard_tokens"])),
+        "workers": int(get_setting(f"{prefix}_MAX_WORKERS", TIER_DEFAULTS[tier]["workers"])),
+    }
+
+
+def read_screening_prompt() -> str:
+    with open("screening_prompt.txt", "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def transaction_shards(df: pd.DataFrame, id_column: str, rows_per_shard: int) -> List[np.ndarray]:
+    """Row positions per shard, keeping all rows of one transaction in the same shard"""
+    codes = pd.factorize(df[id_column].astype(str))[0]
+    order = np.argsort(codes, kind="stable")
+    ordered = codes[order]
+    cuts = np.unique(np.searchsorted(ordered, ordered[np.arange(rows_per_shard, len(order), rows_per_shard)]))
+    return [part for part in np.split(order, cuts[cuts > 0]) if len(part)]
+
+
+def screen_with_model(
+    raw_files: list,
+    transactions: TransactionTable,
+    rules: list,
+    settings: Dict[str, Any],
+    documents: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+):
+    """
+    Ask the screening model which transactions need the detailed review
+
+    Shards whose request fails are escalated whole.
+
+    Returns:
+        tuple: (escalated transaction ids, usage, failed shard count)
+    """
+    from profiliing import build_payload, read_prompts, rules_text, table_context
+
+    prompt = read_screening_prompt()
+    _, systemPrompt = read_prompts()
+    id_column = find_transaction_id_column(transactions.columns)
+    ids = transactions.to_pandas([id_column])
+    with span("prompt_build", rows=len(ids), tier="screen"):
+        rules_content = rules_text(raw_files, rules, transactions.columns, documents=documents)
+        table_content = table_context(transactions, rules_content, rules)
+        _, sample = build_transaction_block(transactions.head(SAMPLE_ROWS), rules_content, rules)
+        per_row = max(1.0, estimate_tokens(sample) / max(1, min(len(ids), SAMPLE_ROWS)))
+        shards = transaction_shards(ids, id_column, max(1, int(settings["shard_tokens"] / per_row)))
+        payloads = []
+        for positions in shards:
+            # Only one shard of rows is converted at a time
+            legend, compact = build_transaction_block(transactions.take(positions), rules_content, rules)
+            payloads.append(build_payload(prompt, systemPrompt, f"{legend}\n{compact}".strip(), rules_content,
+                                          transactions.name, table_content, model=settings["model"]))
+        estimates = [check_payload(payload) for payload in payloads]
+    client = get_client()
+
+    def run_shard(payload, estimate):
+        api_response = client.chat(payload)
+        log_usage(f"{transactions.name} (screen)", estimate, api_response)
+        reply = extract_json_from_string(api_response['choices'][0]['message']['content'])
+        found = list(reply.get("suspicious_list") or []) + list(reply.get("uncertain_list") or [])
+        return {str(tx_id) for tx_id in found}, api_response.get('usage')
+
+    escalated, usage, failed = set(), None, 0
+    with ThreadPoolExecutor(max_workers=max(1, settings["workers"])) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, run_shard, payload, estimate): i
+                   for i, (payload, estimate) in enumerate(zip(payloads, estimates))}
+        for done, future in enumerate(as_completed(futures), start=1):
+            shard_ids = set(ids[id_column].iloc[shards[futures[future]]].astype(str))
+            try:
+                found, shard_usage = future.result()
+                escalated |= found & shard_ids
+                usage = add_usage(usage, shard_usage)
+            except Exception as e:
+                failed += 1
+                escalated |= shard_ids
+                st.warning(f"Screening shard {futures[future] + 1} failed, escalating it: {str(e)}")
+            if progress_callback:
+                progress_callback(done, len(payloads))
+    return escalated, usage, failed
+
+
+def screen_transactions(
+    raw_files: list,
+    transactions: TransactionTable,
+    rules: list,
+    documents: Optional[Dict[str, Any]] = None,
+    local_data: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+):
+    """
+    Run the screening tier over every transaction
+
+    Without SCREEN_MODEL, only the rules the local engine evaluated have
+    been checked (local_data); the raw documents and the rules it could not
+    evaluate still have to be applied to every transaction, so all of them
+    are escalated. A table without a transaction id column cannot be split
+    and is escalated whole.
+
+    Returns:
+        tuple: (TransactionTable of the escalated transactions, screening report)
+    """
+    id_column = find_transaction_id_column(transactions.columns)
+    settings = tier_settings("screen")
+    report = {
+        "screen_model": settings["model"] or "local rules",
+        "escalate_model": tier_settings("escalate")["model"],
+    }
+    if id_column is None:
+        total = transactions.num_rows
+        report.update(screened=total, escalated=total, share=1.0, note="no transaction id column")
+        return transactions, report
+
+    ids = transactions.to_pandas([id_column])[id_column].astype(str)
+    total = ids.nunique()
+    with span("screen", rows=len(ids), model=report["screen_model"]):
+        if settings["model"]:
+            escalated, usage, failed = screen_with_model(raw_files, transactions, rules, settings,
+                                                         documents, progress_callback)
+            report.update(usage=usage, failed_shards=failed)
+        elif raw_files or rules:
+            escalated = set(ids)
+            report.update(note="local rules cannot screen the rules left to the model")
+        else:
+            escalated = {str(tx_id) for tx_id in (local_data or {}).get("flagged_list", [])}
+    mask = ids.isin(escalated).to_numpy()
+    report.update(screened=total, escalated=int(ids[mask].nunique()),
+                  share=round(ids[mask].nunique() / total, 4) if total else 0.0)
+    if mask.all():
+        return transactions, report
+    subset = TransactionTable(f"{transactions.key}:escalated", transactions.name,
+                              df=transactions.take(np.flatnonzero(mask)), schema=transactions.schema)
+    # The escalation tier still sees the statistics of the whole table
+    subset.data_profile = profile_of(transactions)
+    return subset, report
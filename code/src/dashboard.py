@@ -10,7 +10,18 @@ from JSON data in the specified format.
 import streamlit as st
 import json
 import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
 from datetime import datetime
+from txnstore import get_transactions
+from resultmodel import parse_analysis
+from metrics import REGISTRY, span
+from dataprofile import profile_of
+from exports import FORMATS, INLINE_EXPORT_ROWS, export_bytes, export_name, job_inputs
+from jobqueue import FINISHED, get_job_queue
+from llmclient import get_setting
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import pickle
 
 def calculate_risk_level(risk_score):
     """Calculate risk level based on risk score"""
@@ -21,6 +32,280 @@ def calculate_risk_level(risk_score):
     else:
         return "Low"
 
+RISK_LEVELS = ["High", "Medium", "Low"]
+PAGE_SIZES = [10, 25, 50, 100]
+FLAGGED_PAGE_SIZE = 25
+SCORE_BINS = np.linspace(0, 100, 11)
+QUANTILES = [0.25, 0.5, 0.75, 0.9, 0.99]
+TOP_RULES = 20
+DISPLAY_COLUMNS = ["Transaction ID", "Risk Level", "Violated Rules", "Explanation", "Risk Score", "Flagged"]
+
+def rule_label(rule):
+    """Violated-rule entries may be plain ids or dicts with an id and origin"""
+    if isinstance(rule, dict):
+        return str(rule.get('ruleid') or rule.get('rule_id') or rule.get('id') or rule)
+    return str(rule)
+
+def build_transaction_view(data):
+    """
+    Build the display frame and lookup indexes for one analysis
+
+    Works straight from the columns of the result model, so no per-transaction
+    dicts are materialised.
+
+    Returns:
+        dict: 'result' (AnalysisResult), 'frame' (display DataFrame),
+              'positions' (transaction id -> row position),
+              'rule_rows' (rule id -> row positions violating it)
+    """
+    result = parse_analysis(data)
+    ids = pd.Series(result.ids, dtype=object).fillna('').astype(str)
+    labels = np.array([rule_label(rule.ruleid) for rule in result.rules] + [""], dtype=object)
+    violated = [", ".join(group) for group in
+                np.split(labels[result.violation_codes], result.violation_offsets[1:-1])] if len(result) else []
+    explanation_values = np.array(result.text['explanation'].values + [''], dtype=object)
+    explanations = explanation_values[result.text_codes['explanation']] if len(result) else []
+    score_values = pd.Series(result.scores)
+    flags = result.flags.copy()
+    # Rows whose score or flag did not fit the typed columns keep the old coercion
+    score_key, flag_key = result.key_names['risk_score'], result.key_names['flag']
+    for position, override in result.overrides.items():
+        if score_key in override:
+            score_values.iat[position] = pd.to_numeric(override[score_key], errors='coerce')
+        if flag_key in override:
+            flags[position] = bool(override[flag_key])
+    score_values = score_values.fillna(0)
+    frame = pd.DataFrame({
+        "Transaction ID": ids,
+        "Risk Level": np.select([score_values >= 70, score_values >= 30], ["High", "Medium"], "Low"),
+        "Violated Rules": violated,
+        "Explanation": explanations,
+        "Risk Score": score_values,
+        "Flagged": np.where(flags, "Yes", "No"),
+    })
+    segment_frame = pd.DataFrame(result.segments, columns=result.segment_names, index=frame.index)
+    rule_rows = {rule_label(rule): rows for rule, rows in result.rule_rows().items()}
+    positions = {}
+    for position, tx_id in enumerate(ids):
+        positions.setdefault(tx_id, position)
+    return {
+        'result': result,
+        'frame': frame,
+        'positions': positions,
+        'rule_rows': rule_rows,
+        'summary': summarize(frame, segment_frame, rule_rows),
+    }
+
+def summarize(frame, segment_frame, rule_rows):
+    """
+    Pre-aggregate everything the summary and charts need, once per analysis
+
+    Returns:
+        dict: risk-level counts, score histogram and quantiles, per-rule
+              violation counts and per-segment statistics
+    """
+    scores = frame['Risk Score'].to_numpy(dtype=float)
+    counts = frame['Risk Level'].value_counts()
+    histogram, edges = np.histogram(scores, bins=SCORE_BINS)
+    quantiles = (np.quantile(scores, QUANTILES) if len(scores) else np.zeros(len(QUANTILES)))
+    segment_stats = {}
+    for segment in segment_frame.columns:
+        values = segment_frame[segment].dropna().to_numpy(dtype=float)
+        if not len(values):
+            continue
+        segment_stats[segment] = {
+            'mean': float(values.mean()),
+            'max': float(values.max()),
+            'median': float(np.median(values)),
+            'p90': float(np.quantile(values, 0.9)),
+            'nonzero': int((values > 0).sum()),
+        }
+    rule_counts = sorted(((rule, len(rows)) for rule, rows in rule_rows.items()), key=lambda item: -item[1])
+    return {
+        'total': len(frame),
+        'flagged': int((frame['Flagged'] == "Yes").sum()),
+        'risk_counts': {level: int(counts.get(level, 0)) for level in RISK_LEVELS},
+        'histogram': {'counts': histogram.tolist(), 'edges': edges.tolist()},
+        'quantiles': {f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles)},
+        'rule_counts': rule_counts,
+        'segments': segment_stats,
+    }
+
+def render_charts(summary):
+    """Plotly charts drawn from the pre-binned summary, never from raw rows"""
+    chart_col1, chart_col2 = st.columns(2)
+    with chart_col1:
+        edges = summary['histogram']['edges']
+        labels = [f"{edges[i]:.0f}-{edges[i + 1]:.0f}" for i in range(len(edges) - 1)]
+        fig = go.Figure(go.Bar(x=labels, y=summary['histogram']['counts'], marker_color="#2c3e50"))
+        fig.update_layout(title="Risk Score Distribution", xaxis_title="Risk score", yaxis_title="Transactions",
+                          height=320, margin=dict(l=10, r=10, t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+    with chart_col2:
+        top_rules = summary['rule_counts'][:TOP_RULES]
+        fig = go.Figure(go.Bar(x=[count for _, count in top_rules], y=[rule for rule, _ in top_rules],
+                               orientation="h", marker_color="#e74c3c"))
+        fig.update_layout(title="Violations per Rule", xaxis_title="Transactions", height=320,
+                          yaxis=dict(autorange="reversed"), margin=dict(l=10, r=10, t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+    if summary['segments']:
+        segments = summary['segments']
+        fig = go.Figure([
+            go.Bar(name="Mean", x=list(segments), y=[v['mean'] for v in segments.values()]),
+            go.Bar(name="P90", x=list(segments), y=[v['p90'] for v in segments.values()]),
+            go.Bar(name="Max", x=list(segments), y=[v['max'] for v in segments.values()]),
+        ])
+        fig.update_layout(title="Risk Segments", barmode="group", height=320,
+                          margin=dict(l=10, r=10, t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_performance(performance):
+    """Stage timings of this analysis, plus the totals of this server process"""
+    if performance:
+        st.caption(f"Analysis took {performance['seconds']:.2f}s")
+        stages = pd.DataFrame([{"Stage": stage, "Seconds": round(timing['seconds'], 3), "Calls": timing['count']}
+                               for stage, timing in performance['stages'].items()])
+        if not stages.empty:
+            st.table(stages.sort_values("Seconds", ascending=False))
+        if performance.get('counters'):
+            st.table(pd.DataFrame([{"Counter": name, "Value": value}
+                                   for name, value in sorted(performance['counters'].items())]))
+    else:
+        st.info("No timings were recorded for this analysis")
+    with st.expander("Server totals"):
+        snapshot = REGISTRY.snapshot()
+        if snapshot['histograms']:
+            st.dataframe(pd.DataFrame(snapshot['histograms']), hide_index=True)
+        if snapshot['counters']:
+            st.dataframe(pd.DataFrame(snapshot['counters']), hide_index=True)
+        st.download_button("⬇️ Prometheus metrics", REGISTRY.render(), file_name="metrics.prom",
+                           mime="text/plain", key="metrics_download")
+
+def render_data_profile(transactions):
+    """Per-column statistics of the transaction file, with a histogram of one numeric column"""
+    profile = profile_of(transactions).to_dict()
+    st.caption(f"{profile['rows']} rows profiled in {profile['chunks']} chunk(s); distinct counts and "
+               "quantiles are estimates")
+    rows = []
+    for column in profile['columns']:
+        quantiles = column['quantiles']
+        rows.append({
+            "Column": column['name'],
+            "Type": column['dtype'],
+            "Nulls": column['nulls'],
+            "Invalid": column['invalid'],
+            "Distinct (~)": column['distinct'],
+            "Min": column['min'],
+            "Median (~)": quantiles.get('p50'),
+            "Max": column['max'],
+            "Mean": column['mean'],
+            "Top values": ", ".join(f"{value} ({count})" for value, count in column['top'][:3]),
+        })
+    st.dataframe(pd.DataFrame(rows).astype({"Min": str, "Median (~)": str, "Max": str, "Mean": str}),
+                 hide_index=True)
+    numeric = [c for c in profile['columns'] if c['histogram']['counts']]
+    if numeric:
+        names = [c['name'] for c in numeric]
+        chosen = numeric[names.index(st.selectbox("Histogram", names, key="profile_histogram"))]
+        edges, counts = chosen['histogram']['edges'], chosen['histogram']['counts']
+        fig = go.Figure(go.Bar(x=[(a + b) / 2 for a, b in zip(edges, edges[1:])], y=counts,
+                               width=[b - a for a, b in zip(edges, edges[1:])]))
+        fig.update_layout(title=chosen['name'], height=280, margin=dict(l=10, r=10, t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+
+EXPORT_LABELS = {"csv": "EXPORT CSV", "parquet": "EXPORT PARQUET", "pdf": "EXPORT PDF", "rules_csv": "EXPORT RULES"}
+EXPORT_KEYS = {"csv": "csv_export", "parquet": "parquet_export", "pdf": "pdf_export", "rules_csv": "rules_export"}
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.fragment(run_every=1.0)
+def export_progress(job_id):
+    """Poll an export job; the page reruns once it has finished"""
+    job = get_job_queue().status(job_id)
+    if job is None or job['status'] in FINISHED:
+        st.rerun(scope="app")
+    st.progress(min(1.0, job['progress']), text=f"Export · {job['status']}"
+                + (f" · {job['message']}" if job['message'] else ""))
+
+def export_job_button(result, fmt, flagged_only, source):
+    """Export button for big results: the file is written by a background job, then downloaded"""
+    queue = get_job_queue()
+    jobs = st.session_state.setdefault('export_jobs', {})
+    slot = f"{fmt}:{int(flagged_only)}"
+    job = queue.status(jobs[slot]) if slot in jobs else None
+    if job is None:
+        if st.button(EXPORT_LABELS[fmt], key=EXPORT_KEYS[fmt]):
+            ctx = get_script_run_ctx()
+            jobs[slot] = queue.submit("export", job_inputs(fmt, source, flagged_only),
+                                      files={"result.pkl": pickle.dumps(result)},
+                                      owner=ctx.session_id if ctx else "")
+            st.rerun()
+    elif job['status'] == 'done':
+        output = queue.result(job['id'])
+        st.download_button(f"⬇️ {output['file_name']}", data=lambda: read_file(output['path']),
+                           file_name=output['file_name'], mime=FORMATS[fmt][0], key=EXPORT_KEYS[fmt],
+                           on_click="ignore")
+    elif job['status'] in FINISHED:
+        st.error(f"Export {job['status']}: {job.get('error') or ''}")
+        if st.button("Retry", key=f"{EXPORT_KEYS[fmt]}_retry"):
+            del jobs[slot]
+            st.rerun()
+    else:
+        export_progress(job['id'])
+
+def render_exports(result, source):
+    """Download buttons for the transactions, the audit report and the rules"""
+    flagged_only = st.checkbox("Flagged transactions only", key="export_flagged_only")
+    inline = len(result) <= int(get_setting("EXPORT_INLINE_ROWS", INLINE_EXPORT_ROWS))
+    for column, fmt in zip(st.columns(len(EXPORT_LABELS)), EXPORT_LABELS):
+        with column:
+            if inline or fmt == "rules_csv":
+                # Generated on click, on a separate thread from the script run
+                st.download_button(EXPORT_LABELS[fmt],
+                                   data=lambda fmt=fmt: export_bytes(result, fmt, flagged_only, source),
+                                   file_name=export_name(source, fmt, flagged_only), mime=FORMATS[fmt][0],
+                                   key=EXPORT_KEYS[fmt], on_click="ignore")
+            else:
+                export_job_button(result, fmt, flagged_only, source)
+    if not inline:
+        st.caption(f"{len(result)} transactions: files are written in the background, then offered for download")
+
+def get_transaction_view(data):
+    """Return the view for the current analysis, building it only once"""
+    cached = st.session_state.get('transaction_view')
+    if cached is None or cached[0] is not data:
+        with span("dashboard_prep"):
+            cached = (data, build_transaction_view(data))
+        st.session_state.transaction_view = cached
+        st.session_state.export_jobs = {}  # exports of the previous result
+    return cached[1]
+
+def filter_positions(view, risk_levels, rule):
+    """Row positions matching the selected risk levels and violated rule"""
+    frame = view['frame']
+    mask = np.ones(len(frame), dtype=bool)
+    if risk_levels:
+        mask &= frame['Risk Level'].isin(risk_levels).to_numpy()
+    if rule and rule != "All":
+        rule_mask = np.zeros(len(frame), dtype=bool)
+        rule_mask[view['rule_rows'].get(rule, np.array([], dtype=int))] = True
+        mask &= rule_mask
+    return np.flatnonzero(mask)
+
+def sort_positions(frame, positions, column, descending):
+    """Order row positions by a display column"""
+    if column == "Risk Level":
+        keys = frame['Risk Score'].to_numpy()[positions]
+    else:
+        keys = frame[column].to_numpy()[positions]
+    order = np.argsort(keys, kind='stable')
+    if descending:
+        order = order[::-1]
+    return positions[order]
+
+@span("dashboard_render")
 def show_dashboard():
     """
     Main function to render the compliance dashboard
@@ -30,6 +315,9 @@ def show_dashboard():
     # DATA LOADING & VALIDATION
     # --------------------------
     data = st.session_state.analysis_result.get('analysis_data', {})
+    transactions = get_transactions(st.session_state.analysis_result.get('transaction_key', ''))
+    view = get_transaction_view(data)
+    result = view['result']
 
     # --------------------------
     # PAGE CONFIGURATION
@@ -81,14 +369,24 @@ def show_dashboard():
     
     # Create two columns for header content
     col1, col2 = st.columns([3, 2])
+    incremental = result.meta.get('incremental') or {}
+    reuse_note = (f"<br>{incremental['reused']} unchanged transaction(s) reused, "
+                  f"{incremental['evaluated']} sent for review" if incremental.get('reused') else "")
+    cascade = result.meta.get('cascade') or {}
+    if cascade:
+        reuse_note += (f"<br>{cascade['escalated']} of {cascade['screened']} transaction(s) "
+                       f"({cascade['share']:.1%}) escalated from {cascade['screen_model']} "
+                       f"to {cascade['escalate_model']}")
     with col1:
         # Show analyzed documents
         st.markdown(f"""
         <div class="subheader">
         <strong>Analysed</strong><br>
-        {data.get('rules_list', [{}])[0].get('origin', 'sample_regulation.txt').split(',')[0]}<br>
+        {str((result.rules[0].origin if result.rules else None) or 'sample_regulation.txt').split(',')[0]}<br>
         against<br>
-        Transaction Data
+        {st.session_state.analysis_result.get('transaction_name', 'Transaction Data')}
+        {f"({transactions.num_rows} rows)" if transactions else ""}
+        {reuse_note}
         </div>
         """, unsafe_allow_html=True)
     
@@ -107,22 +405,12 @@ def show_dashboard():
     # --------------------------
     st.markdown('<div class="section-title">Risk Summary</div>', unsafe_allow_html=True)
     
-    # Calculate risk counts from transactions
-    high_risk = 0
-    medium_risk = 0
-    low_risk = 0
-    
-    for tx in data.get('transactions_list', []):
-        risk_level = calculate_risk_level(tx.get('risk_score', 0))
-        if risk_level == "High":
-            high_risk += 1
-        elif risk_level == "Medium":
-            medium_risk += 1
-        else:
-            low_risk += 1
-    
-    total_transactions = len(data.get('transactions_list', []))
-    flagged_count = len(data.get('flagged_list', []))
+    # Risk counts come from the summary built once per analysis
+    summary = view['summary']
+    high_risk = summary['risk_counts']['High']
+    medium_risk = summary['risk_counts']['Medium']
+    low_risk = summary['risk_counts']['Low']
+    total_transactions = summary['total']
     
     # Display risk metrics in columns
     risk_col1, risk_col2, risk_col3, risk_col4 = st.columns(4)
@@ -139,32 +427,52 @@ def show_dashboard():
         st.markdown(f'<div class="risk-item">• Total Transactions: {total_transactions}</div>', 
                    unsafe_allow_html=True)
     
+    if total_transactions:
+        render_charts(summary)
+    
     st.markdown("---")
 
+    # --------------------------
+    # DATA PROFILE SECTION
+    # --------------------------
+    if transactions is not None and st.toggle("Show data profile", key="show_data_profile"):
+        st.markdown('<div class="section-title">Data Profile</div>', unsafe_allow_html=True)
+        render_data_profile(transactions)
+        st.markdown("---")
+
     # --------------------------
     # TRANSACTION ANALYSIS SECTION
     # --------------------------
     st.markdown('<div class="section-title">Transaction Analysis</div>', unsafe_allow_html=True)
     
-    # Prepare transaction data for display
-    transaction_display = []
-    for tx in data.get('transactions_list', []):
-        # Note: Corrected field name from 'voilated_rules_list' to 'violated_rules_list'
-        violated_rules = ", ".join(tx.get('voilated_rules_list', []))
-        risk_level = calculate_risk_level(tx.get('risk_score', 0))
-        
-        transaction_display.append({
-            "Transaction ID": tx.get('transaction_id', ''),
-            "Risk Level": risk_level,
-            "Violated Rules": violated_rules,
-            "Explanation": tx.get('explanation', ''),
-            "Risk Score": tx.get('risk_score', 0),
-            "Flagged": "Yes" if tx.get('flag', False) else "No"
-        })
-    
+    frame = view['frame']
+
+    # Filter, sort and page controls; only the selected page is rendered
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns([2, 2, 2, 1])
+    with filter_col1:
+        risk_filter = st.multiselect("Risk Level", RISK_LEVELS, default=[], key="tx_risk_filter")
+    with filter_col2:
+        rule_filter = st.selectbox("Violated Rule", ["All"] + sorted(view['rule_rows']), key="tx_rule_filter")
+    with filter_col3:
+        sort_column = st.selectbox("Sort by", ["Risk Score", "Transaction ID", "Risk Level"], key="tx_sort")
+    with filter_col4:
+        sort_desc = st.checkbox("Desc", value=True, key="tx_sort_desc")
+
+    positions = filter_positions(view, risk_filter, rule_filter)
+    positions = sort_positions(frame, positions, sort_column, sort_desc)
+
+    page_col1, page_col2 = st.columns([1, 1])
+    with page_col1:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key="tx_page_size")
+    page_count = max(1, -(-len(positions) // page_size))
+    with page_col2:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key="tx_page")
+    start = (int(page) - 1) * page_size
+    page_positions = positions[start:start + page_size]
+
     # Display transaction table if data exists
-    if transaction_display:
-        df = pd.DataFrame(transaction_display)
+    if len(page_positions):
+        page_df = frame.iloc[page_positions][DISPLAY_COLUMNS]
         
         # Color coding for risk levels
         def color_risk(val):
@@ -178,17 +486,21 @@ def show_dashboard():
             return 'color: #7f8c8d;'
         
         # Apply styling and display table
-        styled_df = df.style.applymap(color_risk, subset=['Risk Level'])
+        styled_df = page_df.style.map(color_risk, subset=['Risk Level'])
         st.table(styled_df)
+    elif total_transactions:
+        st.info("No transactions match the current filters")
     else:
         st.warning("No transaction data available")
     
     # Show entries count
-    st.markdown(f"*Showing 1 to {min(10, total_transactions)} of {total_transactions} entries*")
+    shown_to = start + len(page_positions)
+    filtered_note = f" (filtered from {total_transactions})" if len(positions) != total_transactions else ""
+    st.markdown(f"*Showing {start + 1 if len(page_positions) else 0} to {shown_to} "
+                f"of {len(positions)} entries{filtered_note}*")
     
     # Calculate and display median risk
-    risk_scores = [tx.get('risk_score', 0) for tx in data.get('transactions_list', [])]
-    median_risk = pd.Series(risk_scores).median() if risk_scores else 0
+    median_risk = summary['quantiles']['p50']
     st.markdown(f"**Median Risk Score:** {median_risk:.2f}")
     
     st.markdown("---")
@@ -198,20 +510,29 @@ def show_dashboard():
     # --------------------------
     st.markdown('<div class="section-title">Flagged Transactions</div>', unsafe_allow_html=True)
     
+    flagged_ids = result.flagged_list
+    flagged_pages = max(1, -(-len(flagged_ids) // FLAGGED_PAGE_SIZE))
+    flagged_page = 1
+    if flagged_pages > 1:
+        flagged_page = st.number_input("Flagged page", min_value=1, max_value=flagged_pages,
+                                       value=1, step=1, key="flagged_page")
+    flagged_start = (int(flagged_page) - 1) * FLAGGED_PAGE_SIZE
+    flagged_slice = flagged_ids[flagged_start:flagged_start + FLAGGED_PAGE_SIZE]
+    positions_by_id = view['positions']
+
     # Create tabs for different failure details
     tab1, tab2, tab3 = st.tabs(["Review Status", "Actions", "Results"])
     
     with tab1:  # Review Status
-        for tx_id in data.get('flagged_list', []):
+        for tx_id in flagged_slice:
             st.markdown(f"• **{tx_id}**: Needs Review")
     
     with tab2:  # Actions
-        for tx_id in data.get('flagged_list', []):
-            tx = next((t for t in data.get('transactions_list', []) 
-                      if t.get('transaction_id') == tx_id), None)
-            if tx:
+        for tx_id in flagged_slice:
+            position = positions_by_id.get(str(tx_id))
+            if position is not None:
                 st.markdown(f"• **{tx_id}**:")
-                remediation = tx.get('remediation', 'None')
+                remediation = result.text_value('remediation', position, 'None')
                 if isinstance(remediation, list):
                     for action in remediation:
                         st.markdown(f"  - {action}")
@@ -219,12 +540,14 @@ def show_dashboard():
                     st.markdown(f"  - {remediation}")
     
     with tab3:  # Results
-        for tx_id in data.get('flagged_list', []):
-            tx = next((t for t in data.get('transactions_list', []) 
-                      if t.get('transaction_id') == tx_id), None)
-            if tx:
-                st.markdown(f"• **{tx_id}**: Found {len(tx.get('voilated_rules_list', []))} violations")
+        for tx_id in flagged_slice:
+            position = positions_by_id.get(str(tx_id))
+            if position is not None:
+                st.markdown(f"• **{tx_id}**: Found {len(result.violated_codes(position))} violations")
     
+    if flagged_pages > 1:
+        st.caption(f"Showing flagged {flagged_start + 1} to {flagged_start + len(flagged_slice)} of {len(flagged_ids)}")
+
     st.markdown("---")
 
     # --------------------------
@@ -232,7 +555,7 @@ def show_dashboard():
     # --------------------------
     st.markdown('<div class="section-title">Applied Rules</div>', unsafe_allow_html=True)
     
-    rules_df = pd.DataFrame(data.get('rules_list', []))
+    rules_df = pd.DataFrame(result.rules_list())
     if not rules_df.empty:
         st.table(rules_df[['ruleid', 'description', 'severity']])
     else:
@@ -245,15 +568,18 @@ def show_dashboard():
     # --------------------------
     st.markdown('<div class="section-title">Export Options</div>', unsafe_allow_html=True)
     
-    # Export buttons in columns
-    col1, col2 = st.columns(2)
-    with col1:
-        st.button("EXPORT CSV", key="csv_export")
-    with col2:
-        st.button("EXPORT PDF", key="pdf_export")
+    render_exports(result, st.session_state.analysis_result.get('transaction_name', 'analysis'))
     
     st.markdown("---")
 
+    # --------------------------
+    # PERFORMANCE SECTION (optional)
+    # --------------------------
+    if st.session_state.get('show_performance'):
+        st.markdown('<div class="section-title">Performance</div>', unsafe_allow_html=True)
+        render_performance(st.session_state.analysis_result.get('performance'))
+        st.markdown("---")
+
     # --------------------------
     # FOOTER SECTION
     # --------------------------
@@ -0,0 +1,395 @@
+"""
+STREAMING DATA PROFILE
+Per-column statistics of a transaction file computed chunk by chunk in
+bounded memory: null and invalid counts, min/max/mean, distinct counts
+(HyperLogLog), quantiles and histograms (t-digest) and the most frequent
+values (a bounded heavy-hitter counter). Every sketch merges with another
+of its kind, so partial profiles of chunks, files or processes combine
+into one. The compact form is shown in the dashboard and sent as prompt
+context.
+
+    python dataprofile.py transactions.csv
+    python dataprofile.py part-*.csv --workers 4 --merge --json
+"""
+
+import argparse
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ruleengine import parse_datetimes
+from schemainfer import SAMPLE_BYTES, Schema, column_type, infer_schema
+
+CHUNK_ROWS = 100_000
+HLL_PRECISION = 14          # 2**14 one-byte registers, ~0.8% standard error
+DIGEST_COMPRESSION = 200    # t-digest delta: at most ~delta/2 centroids
+TOPK_CAPACITY = 1000        # values tracked by the heavy-hitter counter
+TOP_VALUES = 10
+HISTOGRAM_BINS = 20
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+NUMERIC_TYPES = ("integer", "float")
+
+
+# --------------------------
+# SKETCHES
+# --------------------------
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (split so each half is exact in float64)"""
+    high = values >> np.uint64(11)
+    low = values & np.uint64(0x7FF)
+    return np.where(high > 0, np.frexp(high.astype(np.float64))[1] + 11, np.frexp(low.astype(np.float64))[1])
+
+
+class HyperLogLog:
+    """Distinct-count sketch over 64-bit hashes"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        rest = hashes << np.uint64(self.precision)
+        rank = np.minimum(65 - _bit_length(rest), 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            raw = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(raw))
+
+
+class TDigest:
+    """Quantile sketch: weighted centroids, finer towards both tails"""
+
+    def __init__(self, compression: float = DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def add(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self._compress(np.concatenate((self.means, values)),
+                       np.concatenate((self.weights, np.ones(len(values)))))
+
+    def merge(self, other: "TDigest"):
+        if not len(other.means):
+            return
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress(np.concatenate((self.means, other.means)), np.concatenate((self.weights, other.weights)))
+
+    def _compress(self, means, weights):
+        # Centroids whose middle falls in the same unit of the k1 scale merge into one
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        middle = (cumulative - weights / 2) / cumulative[-1]
+        k = np.floor(self.compression / (2 * math.pi) * np.arcsin(2 * middle - 1))
+        groups = np.concatenate(([0], np.cumsum(np.diff(k) != 0)))
+        self.weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / self.weights
+
+    def _positions(self):
+        return np.cumsum(self.weights) - self.weights / 2
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not len(self.means):
+            return None
+        total = self.count
+        return float(np.interp(q * total, np.r_[0, self._positions(), total],
+                               np.r_[self.minimum, self.means, self.maximum]))
+
+    def cdf(self, x: np.ndarray) -> np.ndarray:
+        total = self.count
+        return np.interp(x, np.r_[self.minimum, self.means, self.maximum],
+                         np.r_[0, self._positions(), total]) / total
+
+    def histogram(self, bins: int = HISTOGRAM_BINS) -> Dict[str, List[float]]:
+        """Equal-width bins between min and max, counts read off the digest"""
+        if not len(self.means):
+            return {"edges": [], "counts": []}
+        if self.minimum == self.maximum:
+            return {"edges": [self.minimum, self.maximum], "counts": [int(self.count)]}
+        edges = np.linspace(self.minimum, self.maximum, bins + 1)
+        counts = np.diff(self.cdf(edges)) * self.count
+        return {"edges": edges.tolist(), "counts": np.rint(counts).astype(int).tolist()}
+
+
+class TopK:
+    """
+    Bounded frequent-value counter
+
+    Keeps the `capacity` largest counts. Dropping a value can make later
+    counts of it too low by at most `error`, which reports the largest
+    count ever dropped (0 means every count is exact).
+    """
+
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="float64")
+        self.error = 0.0
+
+    def add_counts(self, counts: pd.Series):
+        if len(counts) > self.capacity:
+            # Trim first, so the merge below stays at most 2 * capacity values
+            counts = counts.nlargest(self.capacity + 1)
+            self.error += float(counts.iloc[-1])
+            counts = counts.iloc[:-1]
+        merged = self.counts.add(counts, fill_value=0) if len(self.counts) else counts.astype("float64")
+        if len(merged) > self.capacity:
+            merged = merged.sort_values(ascending=False, kind="stable")
+            self.error += float(merged.iloc[self.capacity])
+            merged = merged.iloc[:self.capacity]
+        self.counts = merged
+
+    def add(self, values: pd.Series):
+        self.add_counts(values.value_counts(sort=False))
+
+    def merge(self, other: "TopK"):
+        self.error += other.error
+        self.add_counts(other.counts)
+
+    def top(self, k: int = TOP_VALUES) -> List[tuple]:
+        return [(value, int(count)) for value, count in self.counts.nlargest(k).items()]
+
+
+# --------------------------
+# COLUMN AND TABLE PROFILES
+# --------------------------
+def _hashes(values: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+class ColumnProfile:
+    """Running statistics of one column; numbers for numeric/datetime columns, text lengths otherwise"""
+
+    def __init__(self, name: str, dtype: str):
+        self.name = name
+        self.dtype = dtype
+        self.count = 0
+        self.nulls = 0
+        self.invalid = 0
+        self.total = 0.0
+        self.distinct = HyperLogLog()
+        self.top = TopK()
+        self.digest = TDigest()
+
+    def update(self, raw: pd.Series):
+        self.count += len(raw)
+        if pd.api.types.is_object_dtype(raw) or pd.api.types.is_string_dtype(raw):
+            text = raw.astype("string").str.strip()
+            empty = (text.isna() | (text == "")).to_numpy()
+        else:
+            text = None
+            empty = raw.isna().to_numpy()
+        self.nulls += int(empty.sum())
+        present = raw[~empty]
+
+        if self.dtype in NUMERIC_TYPES:
+            numbers = pd.to_numeric(present, errors="coerce").astype("float64")
+            valid = numbers.notna().to_numpy()
+            keys = numbers[valid]
+            measure = keys.to_numpy()
+        elif self.dtype == "datetime":
+            parsed = parse_datetimes(present)
+            valid = parsed.notna().to_numpy()
+            keys = present[valid].astype(str) if text is not None else parsed[valid]
+            measure = parsed[valid].to_numpy().astype("datetime64[s]").astype(np.int64).astype(np.float64)
+        else:
+            keys = (text[~empty] if text is not None else present.astype(str)).astype(object)
+            valid = np.ones(len(keys), dtype=bool)
+            measure = keys.str.len().to_numpy(dtype=np.float64)
+
+        self.invalid += int(len(valid) - valid.sum())
+        self.total += float(measure.sum())
+        self.digest.add(measure)
+        self.distinct.add_hashes(_hashes(keys))
+        self.top.add(keys)
+
+    def merge(self, other: "ColumnProfile"):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.invalid += other.invalid
+        self.total += other.total
+        self.distinct.merge(other.distinct)
+        self.top.merge(other.top)
+        self.digest.merge(other.digest)
+
+    def _value(self, number):
+        if number is None or (isinstance(number, float) and not math.isfinite(number)):
+            return None
+        if self.dtype == "datetime":
+            return str(pd.Timestamp(int(number), unit="s"))
+        if self.dtype == "integer" and float(number).is_integer():
+            return int(number)
+        return round(float(number), 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        measured = self.digest.count
+        return {
+            "name": self.name,
+            "dtype": self.dtype,
+            "measure": "value" if self.dtype in NUMERIC_TYPES + ("datetime",) else "length",
+            "count": self.count,
+            "nulls": self.nulls,
+            "invalid": self.invalid,
+            "distinct": self.distinct.estimate() if self.count > self.nulls else 0,
+            "min": self._value(self.digest.minimum) if measured else None,
+            "max": self._value(self.digest.maximum) if measured else None,
+            "mean": self._value(self.total / measured) if measured else None,
+            "quantiles": {f"p{int(q * 100):02d}": self._value(self.digest.quantile(q)) for q in QUANTILES}
+                         if measured else {},
+            "histogram": self.digest.histogram() if self.dtype in NUMERIC_TYPES else {"edges": [], "counts": []},
+            "top": [(str(int(value)) if self.dtype == "integer" else str(value), count)
+                    for value, count in self.top.top()],
+            "top_error": int(self.top.error),
+        }
+
+
+class DataProfile:
+    """Profiles of every column of a table, built from any number of chunks"""
+
+    def __init__(self, schema: Optional[Schema] = None):
+        self.types = {c.name: c.dtype for c in schema.columns} if schema else {}
+        self.rows = 0
+        self.chunks = 0
+        self.columns: Dict[str, ColumnProfile] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        self.chunks += 1
+        for name in chunk.columns:
+            key = str(name)
+            if key not in self.columns:
+                dtype = self.types.get(key) or column_type(chunk[name].head(2000).astype(str))[0]
+                self.columns[key] = ColumnProfile(key, dtype)
+            self.columns[key].update(chunk[name])
+
+    def merge(self, other: "DataProfile") -> "DataProfile":
+        self.rows += other.rows
+        self.chunks += other.chunks
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "chunks": self.chunks,
+                "columns": [column.to_dict() for column in self.columns.values()]}
+
+    def to_prompt(self, columns: Optional[List[str]] = None) -> str:
+        """One compact line per column ('~' marks sketch estimates)"""
+        lines = [f"DATA PROFILE (all {self.rows} rows, computed locally; ~ = estimate):"]
+        for column in self.columns.values():
+            if columns is not None and column.name not in columns:
+                continue
+            stats = column.to_dict()
+            parts = [f"{stats['nulls']} null", f"{stats['invalid']} invalid", f"~{stats['distinct']} distinct"]
+            if stats["min"] is not None:
+                label = "" if stats["measure"] == "value" else "length "
+                quantiles = stats["quantiles"]
+                parts.append(f"{label}min {stats['min']} / p50 ~{quantiles.get('p50')} / "
+                             f"p99 ~{quantiles.get('p99')} / max {stats['max']}")
+            if stats["top"] and stats["top"][0][1] > 1:
+                parts.append("top " + ", ".join(f"{str(value)[:24]} ({count})" for value, count in stats["top"][:3]))
+            lines.append(f"{column.name}: " + "; ".join(parts))
+        return "\n".join(lines)
+
+
+# --------------------------
+# ENTRY POINTS
+# --------------------------
+def profile_frames(frames: Iterable[pd.DataFrame], schema: Optional[Schema] = None) -> DataProfile:
+    profile = DataProfile(schema)
+    for frame in frames:
+        profile.update(frame)
+    return profile
+
+
+def profile_file(path: str, chunk_rows: int = CHUNK_ROWS) -> DataProfile:
+    """Profile a CSV on disk, holding one chunk of rows in memory at a time"""
+    with open(path, "rb") as f:
+        schema = infer_schema(f.read(SAMPLE_BYTES))
+    names = None if schema.has_header else schema.names
+    # Columns are typed per chunk by pandas; values that do not parse leave a
+    # column as text and are counted as invalid against the schema type
+    reader = pd.read_csv(path, sep=schema.delimiter, header=0 if names is None else None, names=names,
+                         chunksize=chunk_rows)
+    return profile_frames(reader, schema)
+
+
+def _table_chunks(transactions, chunk_rows: int):
+    if transactions.table is not None:
+        for start in range(0, transactions.num_rows, chunk_rows):
+            yield transactions.table.slice(start, chunk_rows).to_pandas()
+    else:
+        df = transactions.to_pandas()
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+
+def profile_of(transactions, chunk_rows: int = CHUNK_ROWS) -> DataProfile:
+    """Profile of a parsed TransactionTable, computed once per table"""
+    profile = getattr(transactions, "data_profile", None)
+    if profile is None:
+        from metrics import span
+        from schemainfer import schema_of
+        with span("data_profile", rows=transactions.num_rows):
+            profile = profile_frames(_table_chunks(transactions, chunk_rows), schema_of(transactions))
+        transactions.data_profile = profile
+    return profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile transaction CSVs in bounded memory")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1, help="files profiled in parallel processes")
+    parser.add_argument("--merge", action="store_true", help="combine all files into one profile")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        profiles = list(pool.map(profile_file, args.paths, [args.chunk_rows] * len(args.paths)))
+    named = list(zip(args.paths, profiles))
+    if args.merge:
+        merged = DataProfile()
+        for profile in profiles:
+            merged.merge(profile)
+        named = [("merged", merged)]
+    for name, profile in named:
+        if args.json:
+            print(json.dumps(dict(profile.to_dict(), file=name), default=str))
+        else:
+            print(f"== {name} ==\n{profile.to_prompt()}\n")
+
+
+if __name__ == "__main__":
+    main()
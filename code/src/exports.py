@@ -0,0 +1,319 @@
+"""
+RESULT EXPORTS
+Writes an analysis result to CSV, Parquet or a paginated PDF audit report,
+plus the rules as CSV or JSON. Transactions are converted in chunks of rows
+straight from the column-wise AnalysisResult, so no export holds more than
+one chunk of rendered text at a time. Large results are exported by the
+'export' background job and served from its job directory.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+import textwrap
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF < 1.24
+    except ImportError:
+        fitz = None
+
+from metrics import span
+from resultmodel import TEXT_FIELDS, AnalysisResult, parse_analysis
+
+EXPORT_CHUNK_ROWS = 50_000
+# Results with more transactions than this are exported by a background job
+INLINE_EXPORT_ROWS = 20_000
+# Flagged transactions listed in the PDF report (highest risk first)
+PDF_MAX_TRANSACTIONS = 2_000
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "pdf": ("application/pdf", "pdf"),
+    "rules_csv": ("text/csv", "csv"),
+    "rules_json": ("application/json", "json"),
+}
+RULE_COLUMNS = ["ruleid", "description", "condition", "severity", "origin", "remarks"]
+
+
+def export_name(name: str, fmt: str, flagged_only: bool = False) -> str:
+    stem = os.path.splitext(os.path.basename(name or "analysis"))[0]
+    kind = "rules" if fmt.startswith("rules") else ("flagged" if flagged_only else "transactions")
+    return f"{stem}-{kind}.{FORMATS[fmt][1]}"
+
+
+def combined_flags(result: AnalysisResult) -> np.ndarray:
+    """Flag of every transaction: its own flag, or being listed in flagged_list"""
+    flagged = result.flags.copy()
+    if result.flagged_list:
+        listed = {str(v) for v in result.flagged_list}
+        flagged |= pd.Series(result.ids, dtype=object).astype(str).isin(listed).to_numpy()
+    return flagged
+
+
+def selected_positions(result: AnalysisResult, flagged_only: bool = False) -> np.ndarray:
+    """Row positions to export: every transaction, or the flagged ones"""
+    if not flagged_only:
+        return np.arange(len(result))
+    return np.flatnonzero(combined_flags(result))
+
+
+def _chunks(positions: np.ndarray, chunk_rows: int) -> Iterator[np.ndarray]:
+    # An empty selection still yields one (empty) chunk so a header gets written
+    for start in range(0, len(positions), chunk_rows) if len(positions) else [0]:
+        yield positions[start:start + chunk_rows]
+
+
+def table_chunks(result: AnalysisResult, positions: np.ndarray, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator:
+    """Tables of the rows at `positions`, with the combined flag in the 'flag' column"""
+    if pa is None:
+        raise ImportError("pyarrow is required for table output")
+    flags = combined_flags(result)
+    for chunk in _chunks(positions, chunk_rows):
+        table = result.to_table(chunk)
+        yield table.set_column(table.schema.get_field_index("flag"), "flag", pa.array(flags[chunk]))
+
+
+def frame_chunks(result: AnalysisResult, positions: np.ndarray,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """DataFrames with the columns of table_chunks; built with pandas alone when pyarrow is missing"""
+    if pa is not None:
+        for table in table_chunks(result, positions, chunk_rows):
+            yield table.to_pandas()
+        return
+    flags = combined_flags(result)
+    for chunk in _chunks(positions, chunk_rows):
+        rows = chunk.tolist()
+        frame = pd.DataFrame({
+            "transaction_id": [None if v is None else str(v) for v in result.ids[chunk]],
+            "risk_score": result.scores[chunk],
+            "flag": flags[chunk],
+            "violated_rules": [[str(rule) for rule in result.violated_rules(i)] for i in rows],
+        })
+        for name in TEXT_FIELDS:
+            values = [result.text_value(name, i, None) for i in rows]
+            frame[name] = [json.dumps(v) if isinstance(v, (list, dict)) else None if v is None else str(v)
+                           for v in values]
+        for i, segment in enumerate(result.segment_names):
+            frame[segment] = result.segments[chunk, i]
+        yield frame
+
+
+# --------------------------
+# TRANSACTIONS
+# --------------------------
+def write_csv(result: AnalysisResult, path: str, flagged_only: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Transactions as CSV; violated rules are joined with '; '"""
+    positions = selected_positions(result, flagged_only)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, frame in enumerate(frame_chunks(result, positions, chunk_rows)):
+            frame["violated_rules"] = frame["violated_rules"].map(lambda rules: "; ".join(rules))
+            frame.to_csv(f, header=(i == 0), index=False)
+    return path
+
+
+def write_parquet(result: AnalysisResult, path: str, flagged_only: bool = False,
+                  chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Transactions as Parquet, one row group per chunk; rules and flagged ids go in the metadata"""
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet export")
+    positions = selected_positions(result, flagged_only)
+    metadata = {b"rules_list": json.dumps(result.rules_list(), default=str).encode("utf-8"),
+                b"flagged_list": json.dumps([str(v) for v in result.flagged_list]).encode("utf-8")}
+    writer = None
+    try:
+        for table in table_chunks(result, positions, chunk_rows):
+            if writer is None:
+                schema = table.schema.with_metadata(metadata)
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+# --------------------------
+# RULES
+# --------------------------
+def rules_csv(rules: List[Any]) -> str:
+    """Rules as CSV text (known columns first, any others after)"""
+    rows = [r if isinstance(r, dict) else {"ruleid": r} for r in rules]
+    extra = sorted({k for r in rows for k in r} - set(RULE_COLUMNS))
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=RULE_COLUMNS + extra, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in row.items()})
+    return out.getvalue()
+
+
+def rules_json(rules: List[Any]) -> str:
+    return json.dumps({"rules_list": rules}, indent=1, default=str)
+
+
+# --------------------------
+# PDF REPORT
+# --------------------------
+class _Report:
+    """Line-based PDF writer that starts a new page when one is full"""
+
+    WIDTH, HEIGHT = 842, 595  # A4 landscape
+    MARGIN = 36
+    GREY = (0.5, 0.5, 0.5)
+
+    def __init__(self, title: str):
+        self.doc = fitz.open()
+        self.title = title
+        self.fonts = {False: fitz.Font("helv"), True: fitz.Font("hebo")}
+        self.page = None
+        self.writer = None
+        self.y = 0.0
+
+    def _flush(self):
+        # One TextWriter per page: inserting line by line re-parses the page each time
+        if self.page is not None:
+            self.writer.write_text(self.page)
+
+    def _new_page(self):
+        self._flush()
+        self.page = self.doc.new_page(width=self.WIDTH, height=self.HEIGHT)
+        self.writer = fitz.TextWriter(self.page.rect)
+        header = fitz.TextWriter(self.page.rect, color=self.GREY)
+        header.append((self.MARGIN, self.MARGIN - 12), self.title, font=self.fonts[False], fontsize=7)
+        header.write_text(self.page)
+        self.y = self.MARGIN + 6
+
+    def line(self, text: str = "", size: float = 8, bold: bool = False, indent: float = 0):
+        # Helvetica averages about half the font size per character
+        width = max(20, int((self.WIDTH - 2 * self.MARGIN - indent) / (size * 0.5)))
+        for part in textwrap.wrap(str(text), width) or [""]:
+            if self.page is None or self.y + size * 1.4 > self.HEIGHT - self.MARGIN:
+                self._new_page()
+            self.y += size * 1.4
+            self.writer.append((self.MARGIN + indent, self.y), part, font=self.fonts[bold], fontsize=size)
+
+    def gap(self, points: float = 6):
+        self.y += points
+
+    def save(self, path: str):
+        if self.page is None:
+            self._new_page()
+        self._flush()
+        total = len(self.doc)
+        for number, page in enumerate(self.doc, start=1):
+            footer = fitz.TextWriter(page.rect, color=self.GREY)
+            footer.append((self.WIDTH - self.MARGIN - 60, self.HEIGHT - self.MARGIN / 2),
+                          f"Page {number} of {total}", font=self.fonts[False], fontsize=7)
+            footer.write_text(page)
+        self.doc.save(path, garbage=1, deflate=True)
+        self.doc.close()
+
+
+def write_pdf(result: AnalysisResult, path: str, source: str = "", max_transactions: int = PDF_MAX_TRANSACTIONS):
+    """Audit report: summary, applied rules, then flagged transactions by descending risk"""
+    if fitz is None:
+        raise ImportError("PyMuPDF is required for PDF export")
+    from dashboard import RISK_LEVELS, calculate_risk_level
+
+    report = _Report(f"Compliance audit report · {source}".rstrip(" ·"))
+    report.line("Compliance Audit Report", size=16, bold=True)
+    report.line(f"Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}" + (f" for {source}" if source else ""))
+    report.gap()
+
+    flagged = selected_positions(result, flagged_only=True)
+    scores = np.nan_to_num(result.scores, nan=0.0)
+    levels = {level: 0 for level in RISK_LEVELS}
+    for score in scores.tolist():
+        levels[calculate_risk_level(score)] += 1
+    report.line("Summary", size=12, bold=True)
+    report.line(f"Transactions checked: {len(result)}")
+    report.line(f"Flagged transactions: {len(flagged)}")
+    report.line(" · ".join(f"{level} risk: {count}" for level, count in levels.items()))
+    if result.meta.get("risk_scoring_definition"):
+        report.line(f"Risk scoring: {result.meta['risk_scoring_definition']}")
+    report.gap()
+
+    report.line("Applied Rules", size=12, bold=True)
+    for rule in result.rules_list():
+        rule = rule if isinstance(rule, dict) else {"ruleid": rule}
+        report.line(f"{rule.get('ruleid', '')} [{rule.get('severity') or '-'}] {rule.get('description') or ''}",
+                    bold=False)
+        if rule.get("origin"):
+            report.line(f"Origin: {rule['origin']}", size=7, indent=12)
+    report.gap()
+
+    shown = flagged[np.argsort(-scores[flagged], kind="stable")][:max_transactions]
+    report.line("Flagged Transactions", size=12, bold=True)
+    if len(flagged) > len(shown):
+        report.line(f"The {len(shown)} highest-risk of {len(flagged)} flagged transactions are listed; "
+                    "the CSV or Parquet export has all of them.", size=7)
+    for start in range(0, len(shown), EXPORT_CHUNK_ROWS):
+        table = result.to_table(shown[start:start + EXPORT_CHUNK_ROWS]).to_pylist()
+        for row in table:
+            score = row["risk_score"]
+            report.gap(2)
+            report.line(f"{row['transaction_id']} · risk {0 if score is None else int(score)} "
+                        f"({calculate_risk_level(score or 0)}) · rules: {', '.join(row['violated_rules']) or '-'}",
+                        bold=True)
+            for name in ("explanation", "remediation", "suggestions"):
+                if row.get(name):
+                    report.line(f"{name.title()}: {row[name][:600]}", size=7, indent=12)
+    if not len(shown):
+        report.line("No transactions were flagged.")
+    report.save(path)
+    return path
+
+
+# --------------------------
+# ENTRY POINTS
+# --------------------------
+def export(data, fmt: str, path: str, flagged_only: bool = False, source: str = "") -> str:
+    """Write an analysis result (dict or AnalysisResult) to `path` in one of FORMATS"""
+    result = parse_analysis(data) if not isinstance(data, AnalysisResult) else data
+    with span("export", format=fmt, rows=len(result)):
+        if fmt == "csv":
+            return write_csv(result, path, flagged_only)
+        if fmt == "parquet":
+            return write_parquet(result, path, flagged_only)
+        if fmt == "pdf":
+            return write_pdf(result, path, source)
+        if fmt in ("rules_csv", "rules_json"):
+            text = rules_csv(result.rules_list()) if fmt == "rules_csv" else rules_json(result.rules_list())
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            return path
+    raise ValueError(f"unknown export format: {fmt}")
+
+
+def export_bytes(data, fmt: str, flagged_only: bool = False, source: str = "") -> bytes:
+    """Export to a temporary file and return its bytes (for small, inline downloads)"""
+    fd, path = tempfile.mkstemp(suffix=f".{FORMATS[fmt][1]}")
+    os.close(fd)
+    try:
+        export(data, fmt, path, flagged_only, source)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def job_inputs(fmt: str, source: str, flagged_only: bool = False) -> Dict[str, Any]:
+    """Inputs of an 'export' background job"""
+    return {"format": fmt, "source": source, "flagged_only": flagged_only,
+            "file_name": export_name(source, fmt, flagged_only)}
@@ -0,0 +1,143 @@
+"""
+DOCUMENT TEXT EXTRACTION
+Single extraction service for rules documents and transaction files:
+PyMuPDF fast path (PyPDF2 fallback), page extraction spread over a process
+pool for large PDFs, and an in-memory memo of extracted text keyed by the
+hash of the file bytes.
+"""
+
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from docx import Document
+
+from metrics import count, span
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF < 1.24
+    except ImportError:
+        fitz = None
+
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+# PDFs with at least this many pages are split across worker processes
+PARALLEL_PAGE_THRESHOLD = 64
+MAX_WORKERS = max(1, min(8, multiprocessing.cpu_count()))
+# Memo budget, in characters of extracted text
+MEMO_MAX_CHARS = 64 * 1024 * 1024
+
+_memo = OrderedDict()
+_memo_chars = 0
+_memo_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def file_hash(content: bytes) -> str:
+    """SHA-256 of the file bytes"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _memo_get(key):
+    with _memo_lock:
+        text = _memo.get(key)
+        if text is not None:
+            _memo.move_to_end(key)
+        return text
+
+
+def _memo_put(key, text):
+    global _memo_chars
+    with _memo_lock:
+        if key in _memo:
+            return
+        _memo[key] = text
+        _memo_chars += len(text)
+        while _memo_chars > MEMO_MAX_CHARS and len(_memo) > 1:
+            _, old = _memo.popitem(last=False)
+            _memo_chars -= len(old)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps workers independent of the Streamlit server threads
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _extract_pages(content: bytes, start: int, stop: int) -> str:
+    """Extract pages [start, stop) with PyMuPDF (runs in a worker process)"""
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        return "\n".join(doc[i].get_text() for i in range(start, stop))
+
+
+def extract_pdf(content: bytes) -> str:
+    """Extract PDF text, in parallel page ranges for large documents"""
+    if fitz is None:
+        import PyPDF2
+        pdf = PyPDF2.PdfReader(BytesIO(content))
+        return "\n".join([page.extract_text() or "" for page in pdf.pages])
+
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if page_count < PARALLEL_PAGE_THRESHOLD or MAX_WORKERS == 1:
+            return "\n".join(page.get_text() for page in doc)
+
+    step = -(-page_count // MAX_WORKERS)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_pages, content, start, stop) for start, stop in ranges]
+    return "\n".join(future.result() for future in futures)
+
+
+def extract_bytes(content: bytes, name: str) -> str:
+    """Extract text from file bytes, using the memo when the bytes were seen before"""
+    lower = name.lower()
+    kind = "pdf" if lower.endswith(".pdf") else "docx" if lower.endswith(".docx") else "text"
+    key = f"{kind}:{file_hash(content)}"
+    text = _memo_get(key)
+    if text is not None:
+        count("cache_hits_total", cache="extraction")
+        return text
+    count("cache_misses_total", cache="extraction")
+
+    if kind == "pdf":
+        text = extract_pdf(content)
+    elif kind == "docx":
+        doc = Document(BytesIO(content))
+        text = "\n".join([para.text for para in doc.paragraphs])
+    else:
+        # Try UTF-8 first, then fallback to latin-1
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            text = content.decode('latin-1')
+    _memo_put(key, text)
+    return text
+
+
+def extract_text(file_obj):
+    """Extract text from PDF, DOCX, or plain text files"""
+    try:
+        if hasattr(file_obj, "seek"):
+            file_obj.seek(0)
+        content = file_obj.read()
+        with span("extract_text", file=file_obj.name, bytes=len(content)):
+            return extract_bytes(content, file_obj.name)
+    except Exception as e:
+        if st is not None:
+            st.error(f"Error reading {file_obj.name}: {str(e)}")
+        return None
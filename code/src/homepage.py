@@ -8,23 +8,129 @@ import json
 import os
 import requests
 from util import *
-from profiliing import profile
-from rulesgeneration import generate_rules
+from profiliing import analyze
+from rulescache import get_rules_cache
+from txnstore import load_transactions
+from resultmodel import parse_analysis
+from jobqueue import FINISHED, get_job_queue
+from blobstore import get_blob_store
+from replaystore import replay_mode
+from ruleengine import parse_rules
+from exports import rules_csv, rules_json
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import time
 from dashboard import show_dashboard
 
+# --------------------------
+# BACKGROUND JOBS
+# --------------------------
+def session_owner():
+    """Owner id used to share the job workers fairly between sessions"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else ""
+
+def track_job(job_id):
+    """Remember a job in the URL so a refresh can re-attach to it"""
+    ids = st.query_params.get_all("job")
+    if job_id not in ids:
+        st.query_params["job"] = ids + [job_id]
+
+def untrack_job(job_id):
+    st.query_params["job"] = [i for i in st.query_params.get_all("job") if i != job_id]
+    if st.session_state.get('analysis_job') == job_id:
+        st.session_state.analysis_job = None
+    for filename, rule_job in list(st.session_state.rule_jobs.items()):
+        if rule_job == job_id:
+            del st.session_state.rule_jobs[filename]
+
+def attach_jobs():
+    """Re-attach to the jobs listed in the URL (e.g. after a page refresh)"""
+    st.session_state.setdefault('rule_jobs', {})
+    st.session_state.setdefault('analysis_job', None)
+    queue = get_job_queue()
+    for job_id in st.query_params.get_all("job"):
+        job = queue.status(job_id)
+        if job is None:
+            untrack_job(job_id)
+        elif job['kind'] == 'analysis':
+            st.session_state.analysis_job = job_id
+        elif job['kind'] == 'rules':
+            filename = job['inputs']['document']
+            st.session_state.rule_jobs.setdefault(filename, job_id)
+            if filename not in st.session_state.uploaded_rules:
+                # The upload is gone after a refresh; the job kept a copy
+                st.session_state.uploaded_rules[filename] = {
+                    "file": get_blob_store().put(queue.open_input(job_id, filename), filename),
+                    "processed": False,
+                    "selected": False
+                }
+
+def finish_job(job):
+    """Move a finished job's result into the session"""
+    queue = get_job_queue()
+    untrack_job(job['id'])
+    if job['status'] != 'done':
+        st.session_state.job_errors = st.session_state.get('job_errors', []) + [
+            f"{job['kind'].title()} job {job['status']}: {job.get('error') or ''}"]
+        return
+    result = queue.result(job['id'])
+    if job['kind'] == 'rules':
+        filename = job['inputs']['document']
+        st.session_state.generated_results[filename] = result
+        if filename in st.session_state.uploaded_rules:
+            st.session_state.uploaded_rules[filename]['processed'] = True
+    elif job['kind'] == 'analysis':
+        result['analysis_data'] = parse_analysis(result.get('analysis_data'))
+        st.session_state.analysis_result = result
+        st.session_state["page"] = "dashboard"
+
+@st.fragment(run_every=1.0)
+def job_monitor():
+    """Poll the tracked jobs without blocking the rest of the page"""
+    queue = get_job_queue()
+    job_ids = list(st.session_state.rule_jobs.values())
+    if st.session_state.analysis_job:
+        job_ids.append(st.session_state.analysis_job)
+    finished = False
+    for job_id in job_ids:
+        job = queue.status(job_id)
+        if job is None:
+            continue
+        if job['status'] in FINISHED:
+            finish_job(job)
+            finished = True
+            continue
+        label = job['inputs'].get('document') or job['inputs'].get('transaction_file', '')
+        st.progress(min(1.0, job['progress']), text=f"{job['kind'].title()} · {label} · {job['status']}"
+                    + (f" · {job['message']}" if job['message'] else ""))
+    if finished:
+        st.rerun(scope="app")
+
+def raw_response(analysis_data):
+    """The analysis reply as JSON text, for showing it when processing fails"""
+    return json.dumps(analysis_data, default=lambda value: value.to_dict() if hasattr(value, 'to_dict') else str(value))
+
 # Main app
 def home_page():
     st.title("Financial Rules Analyzer")
     st.write("Upload rules documents and transaction files for analysis")
+
+    attach_jobs()
+    for message in st.session_state.pop('job_errors', []):
+        st.error(message)
+    if st.session_state.rule_jobs or st.session_state.analysis_job:
+        st.caption("Running in the background; it is safe to refresh this page")
+        job_monitor()
     
     # Section 1: Upload Rules Files
     st.header("📁 Upload Rules Documents (PDF/DOCX)")
+    # The uploader gets a fresh key once its files are stored, which releases the upload bytes
+    st.session_state.setdefault('upload_round', 0)
     new_files = st.file_uploader(
         "Select files",
         type=["pdf", "docx"],
         accept_multiple_files=True,
-        key="rules_uploader",
+        key=f"rules_uploader_{st.session_state.upload_round}",
         label_visibility="collapsed"
     )
     
@@ -32,11 +138,15 @@ def home_page():
         for file in new_files:
             if file.name not in st.session_state.uploaded_rules:
                 st.session_state.uploaded_rules[file.name] = {
-                    "file": file,
+                    "file": get_blob_store().put(file),
                     "processed": False,
                     "selected": False
                 }
-        st.success(f"Added {len(new_files)} new file(s)")
+        st.session_state.upload_notice = f"Added {len(new_files)} new file(s)"
+        st.session_state.upload_round += 1
+        st.rerun()
+    if 'upload_notice' in st.session_state:
+        st.success(st.session_state.pop('upload_notice'))
     
     # Section 2: Manage Uploaded Files
     st.header("📋 Uploaded Rules Documents")
@@ -61,13 +171,15 @@ def home_page():
                 st.write(filename)
             
             with col2:
-                if st.button("Generate Rules", key=f"gen_{filename}"):
-                    with st.spinner(f"Processing {filename}..."):
-                        result = generate_rules(data['file'])
-                        if result:
-                            st.session_state.generated_results[filename] = result
-                            st.session_state.uploaded_rules[filename]['processed'] = True
-                            st.rerun()
+                if filename in st.session_state.rule_jobs:
+                    st.write("⏳ Generating...")
+                elif st.button("Generate Rules", key=f"gen_{filename}"):
+                    job_id = get_job_queue().submit(
+                        "rules", {"document": filename},
+                        files={filename: data['file']}, owner=session_owner())
+                    st.session_state.rule_jobs[filename] = job_id
+                    track_job(job_id)
+                    st.rerun()
             
             with col3:
                 if data['processed']:
@@ -118,80 +230,171 @@ def home_page():
             if 'usage' in result:
                 st.write("**API Usage Statistics:**")
                 st.json(result['usage'])
+            if result.get('cached'):
+                stats = get_rules_cache().stats()
+                st.caption(f"Served from rules cache (hits: {stats['hits']}, misses: {stats['misses']})")
         else:
             st.warning("No analysis content available")
         
-        # Download button
+        # Download buttons
         if 'content' in result:
-            st.download_button(
-                label="⬇️ Download Results",
-                data=result['content'],
-                file_name=f"analysis_{st.session_state.viewing_file}.md",
-                key=f"dl_{st.session_state.viewing_file}"
-            )
+            stem = os.path.splitext(st.session_state.viewing_file)[0]
+            structured = parse_rules(result['content'])
+            dl_col1, dl_col2, dl_col3 = st.columns(3)
+            with dl_col1:
+                st.download_button(
+                    label="⬇️ Download Results",
+                    data=result['content'],
+                    file_name=f"analysis_{st.session_state.viewing_file}.md",
+                    key=f"dl_{st.session_state.viewing_file}"
+                )
+            if structured:
+                with dl_col2:
+                    st.download_button("⬇️ Rules CSV", data=rules_csv(structured), file_name=f"{stem}-rules.csv",
+                                       mime="text/csv", key=f"dl_csv_{st.session_state.viewing_file}")
+                with dl_col3:
+                    st.download_button("⬇️ Rules JSON", data=rules_json(structured), file_name=f"{stem}-rules.json",
+                                       mime="application/json", key=f"dl_json_{st.session_state.viewing_file}")
     
     # Section 4: Transaction Data
     st.header("💳 Upload Transaction Data (CSV)")
-    transaction_file = st.file_uploader(
+    uploaded_csv = st.file_uploader(
         "Select CSV file",
         type=["csv"],
-        key="txn_uploader",
+        key=f"txn_uploader_{st.session_state.upload_round}",
         label_visibility="collapsed"
     )
+    if uploaded_csv:
+        st.session_state.transaction_blob = get_blob_store().put(uploaded_csv)
+        st.session_state.upload_round += 1
+        st.rerun()
     
+    transaction_file = st.session_state.get("transaction_blob")  # stored upload of the last CSV
+    transactions = None
     if transaction_file:
         try:
-            df = pd.read_csv(transaction_file)
-            st.success("CSV file loaded successfully")
+            # Parsed once per file content and shared with analysis and dashboard
+            transactions = load_transactions(transaction_file)
+            st.success(f"{transaction_file.name} loaded successfully ({transactions.num_rows} rows)")
             with st.expander("View Transaction Data"):
-                st.dataframe(df.head())
+                st.dataframe(transactions.head())
         except Exception as e:
             st.error(f"Error reading CSV: {str(e)}")
     
+    batch_mode = st.checkbox(
+        "Batch mode (split large transaction files into concurrent requests)",
+        key="batch_mode"
+    )
+
+    stream_mode = st.checkbox(
+        "Stream results as they arrive",
+        value=True,
+        key="stream_mode"
+    )
+
+    background_mode = st.checkbox(
+        "Run in the background (safe to refresh the page)",
+        value=True,
+        key="background_mode"
+    )
+
+    cascade_mode = st.checkbox(
+        "Cascade: screen every row with the fast model, escalate only suspicious rows",
+        key="cascade_mode"
+    )
+
+    reuse_replies = st.checkbox(
+        "Reuse saved model replies for identical requests (instant re-runs)",
+        value=True,
+        key="reuse_replies"
+    )
+
+    # Not a widget key: it has to survive the switch to the dashboard page
+    st.session_state.show_performance = st.checkbox(
+        "Show stage timings on the results page",
+        value=st.session_state.get('show_performance', False)
+    )
+
     # Then modify the Analyze Button section in home_page():
-    if st.button("🔍 Analyze Selected Files", type="primary", use_container_width=True):
+    if st.button("🔍 Analyze Selected Files", type="primary", use_container_width=True,
+                 disabled=bool(st.session_state.analysis_job)):
         if not st.session_state.selected_files:
             st.warning("Please select at least one rules file")
-        elif not transaction_file:
+        elif not transactions:
             st.warning("Please upload transaction data CSV")
+        elif background_mode:
+            selected = st.session_state.selected_files
+            files = {filename: st.session_state.uploaded_rules[filename]['file'] for filename in selected}
+            files[transaction_file.name] = transaction_file
+            job_id = get_job_queue().submit("analysis", {
+                "selected_files": list(selected),
+                "transaction_file": transaction_file.name,
+                "batch": batch_mode,
+                "stream": stream_mode,
+                "replay": reuse_replies,
+                "cascade": cascade_mode,
+                "generated_results": {name: st.session_state.generated_results[name]
+                                      for name in selected if name in st.session_state.generated_results},
+            }, files=files, owner=session_owner())
+            st.session_state.analysis_job = job_id
+            track_job(job_id)
+            st.rerun()
         else:
             progress_bar = st.progress(0)
             status_text = st.empty()
+            live_results = st.empty()
 
             with st.spinner("est:3mins,please don't refresh..."):
-                status_text.text("Preparing files...")
-                time.sleep(0.5)
+                status_text.text("Checking rules locally...")
                 progress_bar.progress(10)
 
-                status_text.text("Extracting rules content...")
-                time.sleep(0.5)
-                progress_bar.progress(30)
+                def shard_progress(done, total):
+                    status_text.text(f"Hang on,Sending to DeepSeek API..... ({done}/{total} shards)")
+                    progress_bar.progress(40 + int(50 * done / total))
 
-                status_text.text("Processing transaction data...")
-                time.sleep(0.5)
-                progress_bar.progress(50)
+                # Partial results pushed in as the streamed reply is parsed
+                live = {'rule': 0, 'transaction': 0, 'flagged': [], 'shown_at': 0.0}
+                expected_rows = max(1, transactions.num_rows)
 
-                status_text.text("Hang on,Sending to DeepSeek API.....")
-                api_response = profile(
-                    selected_files=st.session_state.selected_files,
-                    transaction_file=transaction_file
-                )
-                progress_bar.progress(80)
+                def show_event(kind, item):
+                    if kind == 'local':
+                        live['rule'] += len(item['rules_list'])
+                        live['flagged'].extend(item['flagged_list'])
+                        status_text.text("Local checks done, Hang on,Sending to DeepSeek API.....")
+                        progress_bar.progress(40)
+                    elif kind == 'flagged':
+                        live['flagged'].append(item)
+                    else:
+                        live[kind] += 1
+                    if kind == 'transaction':
+                        progress_bar.progress(40 + int(50 * min(1.0, live['transaction'] / expected_rows)))
+                    now = time.monotonic()
+                    if now - live['shown_at'] >= 0.25:
+                        live['shown_at'] = now
+                        recent = ", ".join(str(tx_id) for tx_id in live['flagged'][-5:])
+                        live_results.markdown(
+                            f"**Rules:** {live['rule']} · **Transactions checked:** {live['transaction']} · "
+                            f"**Flagged:** {len(live['flagged'])}" + (f" (latest: {recent})" if recent else "")
+                        )
 
+                status_text.text("Hang on,Sending to DeepSeek API.....")
+                with replay_mode("replay" if reuse_replies else None):
+                    analysis_data = analyze(
+                        selected_files=st.session_state.selected_files,
+                        transaction_file=transactions,
+                        batch=batch_mode,
+                        cascade=cascade_mode,
+                        progress_callback=shard_progress,
+                        on_event=show_event if stream_mode and not batch_mode else None
+                    )
                 status_text.text("Processing results...")
-                time.sleep(0.5)
                 progress_bar.progress(90)
 
-                if api_response is None:
+                if analysis_data is None:
                     progress_bar.progress(100)
                     status_text.error("Analysis failed - please check the logs")
-                    time.sleep(2)
-                    status_text.empty()
-                    progress_bar.empty()
                 else:
                     try:
-                        content=api_response['choices'][0]['message']['content']
-                        analysis_data =extract_json_from_string(content) 
                         try:
                             st.session_state.analysis_result = analysis_data
 
@@ -204,14 +407,15 @@ def home_page():
                                     'failure_rate': round((flagged/total)*100, 2) if total > 0 else 0
                                 }
 
-                            analysis_data['transaction_file'] = transaction_file
+                            # Keep the compact result model in the session, not the raw dicts
+                            analysis_data['analysis_data'] = parse_analysis(analysis_data.get('analysis_data'))
+                            # Keep a handle to the shared table, not the upload itself
+                            analysis_data['transaction_key'] = transactions.key
+                            analysis_data['transaction_name'] = transactions.name
                             analysis_data['rules_documents']=st.session_state.selected_files
 
                             progress_bar.progress(100)
                             status_text.success("Analysis complete!")
-                            time.sleep(1)
-                            status_text.empty()
-                            progress_bar.empty()
 
                             st.session_state["page"] = "dashboard"
                             st.session_state.analysis_result=analysis_data
@@ -220,15 +424,9 @@ def home_page():
                         except json.JSONDecodeError:
                             progress_bar.progress(100)
                             status_text.error("Invalid analysis response format")
-                            st.text_area("Raw API Response", value=content, height=300)
-                            time.sleep(2)
-                            status_text.empty()
-                            progress_bar.empty()
+                            st.text_area("Raw API Response", value=raw_response(analysis_data), height=300)
 
                     except Exception as e:
                         progress_bar.progress(100)
                         status_text.error(f"Error processing API response: {str(e)}")
-                        st.text_area("Raw API Response", value=content, height=300)
-                        time.sleep(2)
-                        status_text.empty()
-                        progress_bar.empty()
\ No newline at end of file
+                        st.text_area("Raw API Response", value=raw_response(analysis_data), height=300)
@@ -0,0 +1,391 @@
+"""
+BACKGROUND JOBS
+A small job queue so long analyses and rule generation run outside the
+Streamlit script thread. Jobs, their inputs and their results are kept in
+SQLite plus a directory per job, so a page refresh (or a server restart)
+does not lose a paid API call: the UI re-attaches to a job by its id.
+One bounded worker pool is shared by every session; queued jobs are taken
+from the owner with the fewest running jobs first, so one user's batch
+does not starve everybody else. Finished jobs are dropped, with their
+directory, once they are older than JOB_MAX_AGE.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+from llmclient import get_setting
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_DIR = os.path.join(".cache", "jobs")
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # seconds since a job finished
+FINISHED = ("done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    inputs TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created);
+"""
+
+HANDLERS: Dict[str, Callable[["JobContext"], Any]] = {}
+
+
+def job_handler(kind: str):
+    """Register the function that runs jobs of one kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobErrors(logging.Handler):
+    """
+    Root log handler that collects the errors logged on job worker threads
+
+    st.error() shows nothing outside the script thread, so the modules
+    running a job also log their errors; the ones logged while a job runs
+    become its error message. Records still reach stderr when logging is
+    not configured otherwise.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.collecting: Dict[int, List[str]] = {}
+
+    def emit(self, record):
+        messages = self.collecting.get(record.thread)
+        if messages is not None:
+            messages.append(record.getMessage())
+        if all(isinstance(h, JobErrors) for h in logging.getLogger().handlers) and logging.lastResort:
+            logging.lastResort.handle(record)
+
+    def collect(self) -> List[str]:
+        """Start collecting for the current thread; returns the list that fills up"""
+        messages = self.collecting[threading.get_ident()] = []
+        return messages
+
+    def stop(self):
+        self.collecting.pop(threading.get_ident(), None)
+
+
+_errors = JobErrors()
+
+
+class JobContext:
+    """What a handler sees: the job's inputs, its files and a progress hook"""
+
+    def __init__(self, queue: "JobQueue", job: Dict[str, Any]):
+        self.queue = queue
+        self.id = job['id']
+        self.inputs = job['inputs']
+        self.directory = queue.job_dir(self.id)
+
+    def path(self, name: str) -> str:
+        """Path of an input file saved with the job (keeps its original name)"""
+        return os.path.join(self.directory, "inputs", os.path.basename(name))
+
+    def open_file(self, name: str) -> BytesIO:
+        return self.queue.open_input(self.id, name)
+
+    def report(self, progress: float, message: str = ""):
+        self.queue.update(self.id, progress=progress, message=message)
+
+
+class JobQueue:
+    """SQLite-backed job queue with a shared, bounded pool of worker threads"""
+
+    def __init__(self, directory: str = DEFAULT_JOB_DIR, workers: int = DEFAULT_JOB_WORKERS,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.workers = max(1, int(workers))
+        self.max_age = float(max_age)
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "jobs.sqlite"), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.threads: List[threading.Thread] = []
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            # Jobs that were running when the previous process died start over
+            self.db.execute("UPDATE jobs SET status = 'queued', message = 'requeued after restart' "
+                            "WHERE status = 'running'")
+            self.db.commit()
+        if _errors not in logging.getLogger().handlers:
+            logging.getLogger().addHandler(_errors)
+        self.prune()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    # --------------------------
+    # SUBMITTING AND POLLING
+    # --------------------------
+    def submit(self, kind: str, inputs: Dict[str, Any], files: Optional[Dict[str, Any]] = None,
+               owner: str = "") -> str:
+        """
+        Persist a job and its input files and queue it
+
+        Returns:
+            str: job id to poll or re-attach to
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f"unknown job kind: {kind}")
+        self.prune()
+        job_id = uuid.uuid4().hex
+        input_dir = os.path.join(self.job_dir(job_id), "inputs")
+        os.makedirs(input_dir, exist_ok=True)
+        for name, content in (files or {}).items():
+            with open(os.path.join(input_dir, os.path.basename(name)), "wb") as f:
+                if isinstance(content, (bytes, bytearray)):
+                    f.write(content)
+                else:
+                    content.seek(0)
+                    shutil.copyfileobj(content, f)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO jobs (id, kind, owner, status, inputs, created, updated) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, owner, json.dumps(inputs, default=str), now, now))
+            self.db.commit()
+        self._start_workers()
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job row as a dict (inputs decoded), or None if unknown"""
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['inputs'] = json.loads(job['inputs'])
+        return job
+
+    def jobs(self, owner: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs, optionally for one owner"""
+        query = "SELECT id, kind, owner, status, progress, message, error, created, updated FROM jobs"
+        args: tuple = ()
+        if owner is not None:
+            query += " WHERE owner = ?"
+            args = (owner,)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY created DESC LIMIT ?", args + (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def open_input(self, job_id: str, name: str) -> BytesIO:
+        """A saved input file as an in-memory file object carrying its original name"""
+        with open(os.path.join(self.job_dir(job_id), "inputs", os.path.basename(name)), "rb") as f:
+            file_obj = BytesIO(f.read())
+        file_obj.name = name
+        return file_obj
+
+    def result(self, job_id: str) -> Optional[Any]:
+        """The stored result of a finished job"""
+        path = os.path.join(self.job_dir(job_id), "result.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id))
+            self.db.commit()
+        return cursor.rowcount > 0
+
+    def update(self, job_id: str, **fields):
+        """Set status/progress/message/error on a job"""
+        fields['updated'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", tuple(fields.values()) + (job_id,))
+            self.db.commit()
+
+    def prune(self):
+        """Drop finished jobs older than max_age, with their inputs and results"""
+        placeholders = ",".join("?" * len(FINISHED))
+        with self.lock:
+            rows = self.db.execute(f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND updated < ?",
+                                   FINISHED + (time.time() - self.max_age,)).fetchall()
+            self.db.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in rows])
+            self.db.commit()
+        for row in rows:
+            shutil.rmtree(self.job_dir(row['id']), ignore_errors=True)
+
+    # --------------------------
+    # WORKERS
+    # --------------------------
+    def _start_workers(self):
+        with self.wakeup:
+            self.threads = [t for t in self.threads if t.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-worker-{len(self.threads)}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the next queued job, fairest owner first"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM jobs AS j WHERE status = 'queued' ORDER BY "
+                "(SELECT COUNT(*) FROM jobs AS r WHERE r.owner = j.owner AND r.status = 'running'), created "
+                "LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?",
+                            (time.time(), row['id']))
+            self.db.commit()
+        job = dict(row)
+        job['inputs'] = json.loads(job['inputs'])
+        return job
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(timeout=5)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        context = JobContext(self, job)
+        observe("job_queue_seconds", time.time() - job['created'], kind=job['kind'])
+        errors = _errors.collect()
+        try:
+            result = HANDLERS[job['kind']](context)
+            path = os.path.join(context.directory, "result.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(result, f, default=str)
+            os.replace(f"{path}.tmp", path)
+            self.update(job['id'], status="done", progress=1.0, message="")
+        except Exception as e:
+            # The errors logged on the way say more than "analysis failed"
+            error = "; ".join(dict.fromkeys(errors)) or str(e)
+            logger.error("job %s (%s) failed: %s\n%s", job['id'], job['kind'], e, traceback.format_exc())
+            self.update(job['id'], status="failed", error=error)
+        finally:
+            _errors.stop()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide queue, so every session shares one worker pool"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                directory=get_setting("JOB_DIR", DEFAULT_JOB_DIR),
+                workers=int(get_setting("JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+                max_age=get_setting("JOB_MAX_AGE", DEFAULT_MAX_AGE),
+            )
+            # Pick up anything left queued by a previous process
+            _queue._start_workers()
+        return _queue
+
+
+# --------------------------
+# JOB KINDS
+# --------------------------
+@job_handler("analysis")
+def run_analysis(context: JobContext) -> Dict[str, Any]:
+    """Run analyze() on the saved rules documents and transaction file"""
+    from profiliing import analyze
+    from replaystore import replay_mode
+    from txnstore import load_transactions
+
+    inputs = context.inputs
+    documents = {name: context.open_file(name) for name in inputs['selected_files']}
+    transactions = load_transactions(context.path(inputs['transaction_file']))
+    expected_rows = max(1, transactions.num_rows)
+    seen = {'transaction': 0}
+
+    def on_progress(done, total):
+        context.report(0.1 + 0.85 * done / total, f"{done}/{total} shards")
+
+    def on_event(kind, item):
+        if kind == 'local':
+            context.report(0.1, "Local checks done")
+        elif kind == 'transaction':
+            seen['transaction'] += 1
+            if seen['transaction'] % 25 == 0:
+                context.report(0.1 + 0.85 * min(1.0, seen['transaction'] / expected_rows),
+                               f"{seen['transaction']} transactions checked")
+
+    context.report(0.05, "Checking rules locally")
+    with replay_mode("replay" if inputs.get('replay') else None):
+        result = analyze(
+            selected_files=inputs['selected_files'],
+            transaction_file=transactions,
+            batch=inputs.get('batch', False),
+            progress_callback=on_progress,
+            on_event=on_event if inputs.get('stream') and not inputs.get('batch') else None,
+            documents=documents,
+            generated_results=inputs.get('generated_results', {}),
+            cascade=inputs.get('cascade'),
+        )
+    if result is None:
+        raise RuntimeError("analysis failed")
+    result['transaction_key'] = transactions.key
+    result['transaction_name'] = transactions.name
+    result['rules_documents'] = inputs['selected_files']
+    return result
+
+
+@job_handler("rules")
+def run_rules(context: JobContext) -> Dict[str, Any]:
+    """Run generate_rules() on one saved document"""
+    from rulesgeneration import generate_rules
+
+    context.report(0.1, f"Generating rules for {context.inputs['document']}")
+    result = generate_rules(context.open_file(context.inputs['document']))
+    if result is None:
+        raise RuntimeError(f"rule generation failed for {context.inputs['document']}")
+    return result
+
+
+@job_handler("export")
+def run_export(context: JobContext) -> Dict[str, Any]:
+    """Write a saved analysis result to a file in the job directory"""
+    import pickle
+    from exports import export
+
+    inputs = context.inputs
+    with open(context.path("result.pkl"), "rb") as f:
+        result = pickle.load(f)  # written by this app when the job was submitted
+    context.report(0.1, f"Writing {inputs['file_name']}")
+    path = export(result, inputs['format'], os.path.join(context.directory, inputs['file_name']),
+                  flagged_only=inputs.get('flagged_only', False), source=inputs.get('source', ''))
+    return {"path": path, "file_name": inputs['file_name'], "size": os.path.getsize(path)}
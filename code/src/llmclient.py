@@ -0,0 +1,304 @@
+"""
+SHARED LLM CLIENT
+One pooled HTTP session for every chat-completion call made by the app,
+with a concurrency limit, a token-bucket rate limiter, retries with
+jittered exponential backoff and separate connect/read timeouts.
+Replies can be recorded and replayed from disk (see replaystore).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import count, record_usage, span
+
+try:
+    import streamlit as st
+except ImportError:  # headless use (batch jobs, benchmarks)
+    st = None
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+DEFAULTS = {
+    "LLM_MAX_CONCURRENCY": 4,     # requests in flight at once
+    "LLM_RATE_PER_SEC": 2.0,      # sustained request rate
+    "LLM_BURST": 4,               # token-bucket capacity
+    "LLM_MAX_RETRIES": 4,
+    "LLM_BACKOFF_BASE": 1.0,      # seconds, doubled per attempt
+    "LLM_BACKOFF_MAX": 30.0,
+    "LLM_CONNECT_TIMEOUT": 5.0,
+    "LLM_READ_TIMEOUT": 180.0,
+    "LLM_REPLAY_MODE": "off",     # off | record | replay | strict
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Set by configure() for headless runs (CLI, benchmarks)
+_overrides: Dict[str, Any] = {}
+_use_secrets = True
+
+
+def configure(use_secrets: bool = True, **settings):
+    """Override settings for this process; use_secrets=False ignores st.secrets"""
+    global _use_secrets
+    _use_secrets = use_secrets
+    _overrides.update({name: value for name, value in settings.items() if value is not None})
+
+
+def get_setting(name, default=None):
+    """Read a setting from overrides, st.secrets, the environment, then the default"""
+    if name in _overrides:
+        return _overrides[name]
+    if st is not None and _use_secrets:
+        try:
+            if name in st.secrets:
+                return st.secrets[name]
+        except Exception:
+            pass  # no secrets.toml available
+    if name in os.environ:
+        return os.environ[name]
+    return DEFAULTS.get(name, default)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class LLMClient:
+    """Pooled, rate-limited client for an OpenAI-style chat-completion endpoint"""
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        model: Optional[str] = None,
+        max_concurrency: int = DEFAULTS["LLM_MAX_CONCURRENCY"],
+        rate_per_sec: float = DEFAULTS["LLM_RATE_PER_SEC"],
+        burst: int = DEFAULTS["LLM_BURST"],
+        max_retries: int = DEFAULTS["LLM_MAX_RETRIES"],
+        backoff_base: float = DEFAULTS["LLM_BACKOFF_BASE"],
+        backoff_max: float = DEFAULTS["LLM_BACKOFF_MAX"],
+        connect_timeout: float = DEFAULTS["LLM_CONNECT_TIMEOUT"],
+        read_timeout: float = DEFAULTS["LLM_READ_TIMEOUT"],
+    ):
+        self.api_url = api_url
+        self.model = model
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.timeout = (float(connect_timeout), float(read_timeout))
+        self.semaphore = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.bucket = TokenBucket(rate_per_sec, burst)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, int(max_concurrency)))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+
+    def _backoff(self, attempt, response=None):
+        """Seconds to wait before the next attempt (full jitter, honours Retry-After)"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(self.backoff_max, float(retry_after))
+                except ValueError:
+                    pass
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def post(self, payload: Dict[str, Any], **kwargs) -> requests.Response:
+        """POST a payload with rate limiting and retries; returns the final response"""
+        last_error = None
+        with span("llm_request", model=payload.get("model")):
+            for attempt in range(self.max_retries + 1):
+                self.bucket.acquire()
+                response = None
+                try:
+                    with self.semaphore:
+                        response = self.session.post(self.api_url, json=payload, timeout=self.timeout, **kwargs)
+                    count("llm_requests_total", status=response.status_code)
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response
+                    last_error = requests.exceptions.HTTPError(
+                        f"{response.status_code} from {self.api_url}", response=response)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    count("llm_requests_total", status="error")
+                    last_error = e
+                if attempt < self.max_retries:
+                    count("llm_retries_total")
+                    time.sleep(self._backoff(attempt, response))
+            raise last_error
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a chat-completion payload and return the decoded JSON reply"""
+        from replaystore import ReplayMiss, current_mode, fingerprint, get_replay_store
+        if self.model and "model" not in payload:
+            payload = dict(payload, model=self.model)
+        mode = current_mode()
+        if mode != "off":
+            store, key = get_replay_store(), fingerprint(payload)
+            if mode != "record":
+                reply = store.get(key)
+                if reply is not None:
+                    return reply
+                if mode == "strict":
+                    raise ReplayMiss(key)
+        reply = self.post(payload).json()
+        # Only tokens actually spent are counted, not replayed ones
+        record_usage(reply.get("usage"))
+        if mode != "off":
+            store.put(key, payload, reply)
+        return reply
+
+    def stream(self, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Send a payload with stream=True and yield each server-sent chunk
+
+        Retries only happen before the first byte of the reply; the
+        concurrency slot is held until the stream is consumed or closed.
+        With record/replay on, saved replies are played back as chunks and
+        completed live streams are saved.
+        """
+        from replaystore import ReplayMiss, current_mode, fingerprint, get_replay_store, replay_chunks
+        payload = dict(payload, stream=True)
+        if self.model and "model" not in payload:
+            payload["model"] = self.model
+        mode = current_mode()
+        if mode != "off":
+            store, key = get_replay_store(), fingerprint(payload)
+            if mode != "record":
+                reply = store.get(key)
+                if reply is not None:
+                    yield from replay_chunks(reply)
+                    return
+                if mode == "strict":
+                    raise ReplayMiss(key)
+        pieces, usage = [], None
+        for chunk in self._stream(payload):
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            if mode != "off":
+                for choice in chunk.get("choices", []):
+                    pieces.append((choice.get("delta") or {}).get("content") or "")
+            yield chunk
+        record_usage(usage)
+        if mode != "off":
+            store.put(key, payload, {
+                "choices": [{"message": {"role": "assistant", "content": "".join(pieces)}}],
+                "usage": usage,
+            })
+
+    def _stream(self, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Live streamed request with retries before the first byte"""
+        last_error = None
+        with span("llm_stream", model=payload.get("model")):
+            for attempt in range(self.max_retries + 1):
+                self.bucket.acquire()
+                response = None
+                with self.semaphore:
+                    try:
+                        response = self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True)
+                    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                        count("llm_requests_total", status="error")
+                        last_error = e
+                    if response is not None:
+                        count("llm_requests_total", status=response.status_code)
+                    if response is not None and response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        with response:
+                            yield from _server_sent_events(response)
+                        return
+                    if response is not None:
+                        last_error = requests.exceptions.HTTPError(
+                            f"{response.status_code} from {self.api_url}", response=response)
+                        response.close()
+                if attempt < self.max_retries:
+                    count("llm_retries_total")
+                    time.sleep(self._backoff(attempt, response))
+            raise last_error
+
+
+def _server_sent_events(response) -> Iterator[Dict[str, Any]]:
+    """Decode 'data: {...}' lines of an OpenAI-style event stream"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or line.startswith(":"):
+            continue
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Return the process-wide client, creating it from settings on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                api_url=get_setting("API_URL"),
+                api_key=get_setting("API_KEY"),
+                model=get_setting("MODEL"),
+                max_concurrency=get_setting("LLM_MAX_CONCURRENCY"),
+                rate_per_sec=get_setting("LLM_RATE_PER_SEC"),
+                burst=get_setting("LLM_BURST"),
+                max_retries=get_setting("LLM_MAX_RETRIES"),
+                backoff_base=get_setting("LLM_BACKOFF_BASE"),
+                backoff_max=get_setting("LLM_BACKOFF_MAX"),
+                connect_timeout=get_setting("LLM_CONNECT_TIMEOUT"),
+                read_timeout=get_setting("LLM_READ_TIMEOUT"),
+            )
+        return _client
+
+
+def chat_completion(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Send a chat-completion payload through the shared client"""
+    return get_client().chat(payload)
+
+
+def stream_chat_completion(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Stream a chat-completion through the shared client, chunk by chunk"""
+    return get_client().stream(payload)
@@ -0,0 +1,271 @@
+"""
+PIPELINE METRICS
+Lightweight instrumentation for the analysis pipeline: timed spans around
+each stage, counters for tokens, requests, retries and cache hits, one
+structured JSON log line per event and a Prometheus text-format export.
+A trace groups the spans of one run (an analysis, a rule generation) so
+its stage timings can be shown next to the result.
+
+    with span("extract_text", file=name):
+        ...
+    count("cache_hits_total", cache="rules")
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+PREFIX = "auditor_"
+DEFAULT_PROM_FILE = os.path.join(".cache", "metrics", "metrics.prom")
+# Histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+HELP = {
+    "stage_seconds": "Wall time of each pipeline stage",
+    "run_seconds": "Wall time of a whole run",
+    "job_queue_seconds": "Time a background job waited before a worker took it",
+    "llm_requests_total": "Chat-completion HTTP attempts by outcome",
+    "llm_retries_total": "Chat-completion attempts that were retried",
+    "llm_tokens_total": "Tokens reported by the API",
+    "prompt_tokens_estimated_total": "Prompt tokens estimated locally before sending",
+    "prompt_tokens_reported_total": "Prompt tokens the API reported for the same requests",
+    "cache_hits_total": "Cache lookups served from the cache",
+    "cache_misses_total": "Cache lookups that missed",
+}
+
+
+def _label_key(labels: Dict[str, Any]) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _label_text(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    """Process-wide counters and histograms, safe to update from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, Dict[str, Any]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "max": 0.0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            histogram["max"] = max(histogram["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and histogram summaries as plain dicts"""
+        with self.lock:
+            counters = [{"name": name, **dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, **dict(labels), "count": h["count"], "sum": h["sum"],
+                           "mean": h["sum"] / h["count"] if h["count"] else 0.0, "max": h["max"]}
+                          for (name, labels), h in sorted(self.histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(h, buckets=list(h["buckets"]))) for key, h in self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+            lines.append(f"{PREFIX}{name}{_label_text(labels)} {value:g}")
+        for (name, labels), h in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for bound, bucket in zip(BUCKETS, h["buckets"]):
+                le = 'le="%g"' % bound
+                lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, le)} {bucket}")
+            inf = 'le="+Inf"'
+            lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, inf)} {h['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {h['sum']:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+
+
+class Trace:
+    """Stage timings and counters of one run"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+
+    def add_span(self, stage: str, seconds: float):
+        with self.lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0})
+            entry["seconds"] += seconds
+            entry["count"] += 1
+
+    def add(self, name: str, value: float):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0.0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "name": self.name,
+                "seconds": round(time.perf_counter() - self.started, 6),
+                "stages": {stage: {"seconds": round(entry["seconds"], 6), "count": entry["count"]}
+                           for stage, entry in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+# Worker threads see the trace when started with contextvars.copy_context().run
+_current: ContextVar[Optional[Trace]] = ContextVar("metrics_trace", default=None)
+_log_file_ready = False
+_log_file_lock = threading.Lock()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def _attach_log_file():
+    """Also write the JSON lines to METRICS_LOG_FILE when that setting is given"""
+    global _log_file_ready
+    with _log_file_lock:
+        if _log_file_ready:
+            return
+        _log_file_ready = True
+        from llmclient import get_setting
+        path = get_setting("METRICS_LOG_FILE")
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+
+
+def emit(event: str, **fields):
+    """Write one structured JSON log line"""
+    if not _log_file_ready:
+        _attach_log_file()
+    trace = _current.get()
+    record = {"ts": round(time.time(), 3), "event": event}
+    if trace is not None:
+        record["trace"] = trace.name
+    record.update(fields)
+    logger.info(json.dumps(record, default=str))
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """Time a block as one pipeline stage (also usable as a decorator)"""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        REGISTRY.observe("stage_seconds", seconds, stage=stage)
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(stage, seconds)
+        emit("span", stage=stage, seconds=round(seconds, 6), failed=failed, **fields)
+
+
+def count(name: str, value: float = 1.0, **labels):
+    """Add to a counter (and to the current trace, under name/label values)"""
+    REGISTRY.inc(name, value, **labels)
+    trace = _current.get()
+    if trace is not None:
+        trace.add("/".join([name] + [str(v) for _, v in _label_key(labels)]), value)
+
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def record_usage(usage: Optional[Dict[str, Any]]):
+    """Count the prompt and completion tokens of one API reply"""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = int(usage.get(f"{kind}_tokens") or 0)
+        if tokens:
+            count("llm_tokens_total", tokens, kind=kind)
+
+
+@contextmanager
+def trace(name: str):
+    """Group the spans and counters of one run; exports metrics when it ends"""
+    run = Trace(name)
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        summary = run.to_dict()
+        REGISTRY.observe("run_seconds", summary["seconds"], run=name)
+        emit("trace", **summary)
+        write_prometheus()
+
+
+def write_prometheus(path: Optional[str] = None) -> Optional[str]:
+    """Write the registry in Prometheus text format (node-exporter textfile style)"""
+    if path is None:
+        from llmclient import get_setting
+        path = get_setting("METRICS_PROM_FILE", DEFAULT_PROM_FILE)
+    if not path:
+        return None
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render())
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("could not write %s: %s", path, e)
+        return None
+    return path
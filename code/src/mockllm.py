@@ -0,0 +1,147 @@
+"""
+MOCK CHAT-COMPLETION SERVER
+Local stand-in for the DeepSeek/OpenAI-style chat endpoint, for benchmarks
+and offline runs. Latency and reply size are configurable; replies are
+well-formed 'analysis_data' JSON, plain or streamed as server-sent events;
+screening requests (cascade.py) get a suspicious/uncertain id list.
+
+    python mockllm.py --port 8765 --latency 2.0 --transactions 500
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_CHUNK_CHARS = 64
+
+
+def analysis_reply(transactions: int, rules: int = 8) -> str:
+    """An 'analysis_data' reply with the given number of transactions"""
+    rule_ids = [f"GEN{i:03d}" for i in range(1, rules + 1)]
+    return json.dumps({"analysis_data": {
+        "rules_list": [{"ruleid": rule, "description": f"Synthetic rule {rule}", "origin": "mock",
+                        "severity": "High" if i % 2 else "Medium", "remarks": ""}
+                       for i, rule in enumerate(rule_ids)],
+        "transactions_list": [{
+            "transaction_id": str(6_000_000 + i),
+            "voilated_rules_list": [rule_ids[i % rules]] if i % 5 == 0 else [],
+            "flag": i % 5 == 0,
+            "risk_score": (i * 37) % 100,
+            "explanation": "Synthetic verdict" if i % 5 == 0 else "",
+            "remediation": ["Review transaction"] if i % 5 == 0 else [],
+            "remarks": "",
+            "risk_segments": {"credit_risk": i % 7, "transaction_risk": (i * 37) % 100,
+                              "market_risk": 0, "operational_risk": i % 3},
+            "sugggestions": "",
+        } for i in range(transactions)],
+        "flagged_list": [str(6_000_000 + i) for i in range(0, transactions, 5)],
+    }})
+
+
+def screening_reply(transactions: int) -> str:
+    """A screening-tier reply: every 5th transaction suspicious, every 7th uncertain"""
+    return json.dumps({
+        "suspicious_list": [str(6_000_000 + i) for i in range(0, transactions, 5)],
+        "uncertain_list": [str(6_000_000 + i) for i in range(3, transactions, 7)],
+    })
+
+
+class MockLLM:
+    """Threaded mock server; start() returns the base URL"""
+
+    def __init__(self, latency: float = 0.0, transactions: int = 20, port: int = 0,
+                 host: str = "127.0.0.1", status: int = 200):
+        self.latency = latency
+        self.transactions = transactions
+        self.status = status
+        self.requests = 0
+        self.request_bytes = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                mock.requests += 1
+                mock.request_bytes += len(body)
+                payload = json.loads(body or b"{}")
+                time.sleep(mock.latency)
+                if mock.status != 200:
+                    self.send_response(mock.status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if "suspicious_list" in json.dumps(payload.get("messages", [])):
+                    content = screening_reply(mock.transactions)
+                else:
+                    content = analysis_reply(mock.transactions)
+                usage = {"prompt_tokens": len(body) // 4, "completion_tokens": len(content) // 4}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if payload.get("stream"):
+                    self._stream(content, usage)
+                else:
+                    self._send(json.dumps({
+                        "choices": [{"message": {"role": "assistant", "content": content}}],
+                        "usage": usage,
+                    }).encode())
+
+            def _send(self, data):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, content, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [{"choices": [{"delta": {"content": content[i:i + STREAM_CHUNK_CHARS]}}]}
+                          for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+                events.append({"choices": [], "usage": usage})
+                for event in events:
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/chat/completions"
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock chat-completion endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each reply")
+    parser.add_argument("--transactions", type=int, default=20, help="transactions per reply")
+    args = parser.parse_args(argv)
+    mock = MockLLM(args.latency, args.transactions, args.port)
+    print(f"Serving {mock.url} (set API_URL to this)")
+    mock.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
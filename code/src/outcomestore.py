@@ -0,0 +1,274 @@
+"""
+INCREMENTAL OUTCOME STORE
+Per-transaction verdicts from the model, kept in SQLite under a hash of
+the rule set that produced them, so a re-run only sends the transactions
+that are new or changed. A transaction is identified by the fingerprints
+of its normalized rows: adding, removing or editing any of its rows makes
+it new again. Identical verdict bodies are stored once.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from llmclient import get_setting
+from metrics import count
+from resultmodel import KEY_ALIASES, transaction_id
+
+DEFAULT_OUTCOME_PATH = os.path.join(".cache", "outcomes", "outcomes.sqlite")
+DEFAULT_MAX_AGE = 90 * 24 * 3600  # seconds
+# Odd 64-bit constant used to mix row hashes before they are summed
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rulesets (
+    ruleset TEXT PRIMARY KEY,
+    rules TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    ruleset TEXT NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    entry INTEGER,
+    flagged INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (ruleset, fingerprint)
+) WITHOUT ROWID;
+"""
+
+
+def ruleset_hash(parts: Iterable[str]) -> str:
+    """Hash of everything that decides a verdict: prompts, model, rules, columns"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """
+    uint64 hash of every row after normalization
+
+    Columns are taken in name order, numbers as float64 and everything else
+    as whitespace-stripped text, so re-exports of the same data hash alike.
+    """
+    normalized = {}
+    for column in sorted(df.columns):
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            normalized[column] = values.astype("float64")
+        else:
+            normalized[column] = values.astype(str).str.strip()
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+
+
+def transaction_fingerprints(df: pd.DataFrame, id_column: str):
+    """
+    Fingerprint each transaction from the rows that share its id
+
+    Returns:
+        tuple: (transaction ids as str, int64 fingerprints, row -> transaction index)
+    """
+    codes, ids = pd.factorize(df[id_column].astype(str), sort=False)
+    with np.errstate(over="ignore"):
+        mixed = row_fingerprints(df) * _MIX
+        mixed ^= mixed >> np.uint64(29)
+    combined = np.zeros(len(ids), dtype=np.uint64)
+    np.add.at(combined, codes, mixed)  # order-independent, wraps on overflow
+    return [str(i) for i in ids], combined.view(np.int64), codes
+
+
+class OutcomeStore:
+    """SQLite-backed map of (rule set, transaction fingerprint) -> verdict"""
+
+    def __init__(self, path: str = DEFAULT_OUTCOME_PATH, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = float(max_age)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+        self.prune()
+
+    def rules(self, ruleset: str) -> Optional[Dict[str, Any]]:
+        """rules_list (and scoring definition) stored with a rule set"""
+        with self.lock:
+            row = self.db.execute("SELECT rules FROM rulesets WHERE ruleset = ?", (ruleset,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lookup(self, ruleset: str, fingerprints: np.ndarray) -> Dict[int, tuple]:
+        """fingerprint -> (verdict dict or None, flagged) for the stored ones"""
+        with self.lock:
+            rows = self.db.execute("SELECT fingerprint, entry, flagged FROM outcomes WHERE ruleset = ?",
+                                   (ruleset,)).fetchall()
+        if not rows:
+            return {}
+        stored = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        wanted = np.flatnonzero(np.isin(stored, fingerprints))
+        entry_ids = sorted({rows[i][1] for i in wanted if rows[i][1] is not None})
+        bodies = {}
+        with self.lock:
+            for start in range(0, len(entry_ids), 500):
+                chunk = entry_ids[start:start + 500]
+                bodies.update(self.db.execute(
+                    f"SELECT id, body FROM entries WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+        decoded = {entry_id: json.loads(body) for entry_id, body in bodies.items()}
+        return {rows[i][0]: (decoded.get(rows[i][1]), bool(rows[i][2])) for i in wanted}
+
+    def save(self, ruleset: str, rules: Dict[str, Any], outcomes: List[tuple]):
+        """Store the rules of a rule set and (fingerprint, verdict or None, flagged) tuples"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO rulesets (ruleset, rules, updated) VALUES (?, ?, ?)",
+                            (ruleset, json.dumps(rules, default=str), now))
+            encode = json.JSONEncoder(sort_keys=True, separators=(",", ":"), default=str).encode
+            entry_ids = {}
+            rows = []
+            for fingerprint, entry, flagged in outcomes:
+                entry_id = None
+                if entry is not None:
+                    body = encode(entry)
+                    entry_id = entry_ids.get(body)
+                    if entry_id is None:
+                        digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+                        self.db.execute("INSERT OR IGNORE INTO entries (digest, body) VALUES (?, ?)", (digest, body))
+                        entry_id = self.db.execute("SELECT id FROM entries WHERE digest = ?", (digest,)).fetchone()[0]
+                        entry_ids[body] = entry_id
+                rows.append((ruleset, int(fingerprint), entry_id, int(bool(flagged)), now))
+            rows.sort(key=lambda row: row[1])  # key order makes the B-tree inserts sequential
+            self.db.executemany(
+                "INSERT OR REPLACE INTO outcomes (ruleset, fingerprint, entry, flagged, updated) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            self.db.commit()
+
+    def prune(self):
+        """Drop outcomes older than max_age and verdict bodies nobody uses"""
+        cutoff = time.time() - self.max_age
+        with self.lock:
+            self.db.execute("DELETE FROM outcomes WHERE updated < ?", (cutoff,))
+            self.db.execute("DELETE FROM rulesets WHERE updated < ?", (cutoff,))
+            self.db.execute("DELETE FROM entries WHERE id NOT IN (SELECT DISTINCT entry FROM outcomes "
+                            "WHERE entry IS NOT NULL)")
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            rulesets = self.db.execute("SELECT COUNT(*) FROM rulesets").fetchone()[0]
+            outcomes = self.db.execute("SELECT COUNT(*) FROM outcomes").fetchone()[0]
+            entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"rulesets": rulesets, "outcomes": outcomes, "entries": entries}
+
+
+class Delta:
+    """One table split into transactions with stored verdicts and ones still to evaluate"""
+
+    def __init__(self, store: OutcomeStore, ruleset: str, df: pd.DataFrame, id_column: str):
+        self.store = store
+        self.ruleset = ruleset
+        self.df = df
+        self.ids, self.fingerprints, self.codes = transaction_fingerprints(df, id_column)
+        self.found = store.lookup(ruleset, self.fingerprints)
+        self.rules = store.rules(ruleset) if self.found else None
+        if self.rules is None:
+            self.found = {}
+        hit = np.fromiter((fp in self.found for fp in self.fingerprints.tolist()),
+                          dtype=bool, count=len(self.fingerprints))
+        self.pending = np.flatnonzero(~hit)        # transaction indexes to evaluate
+        self.pending_rows = ~hit[self.codes]       # row mask of those transactions
+        count("cache_hits_total", len(self.fingerprints) - len(self.pending), cache="outcomes")
+        count("cache_misses_total", len(self.pending), cache="outcomes")
+
+    @property
+    def reused(self) -> int:
+        return len(self.fingerprints) - len(self.pending)
+
+    def pending_frame(self) -> pd.DataFrame:
+        """Rows of the new or changed transactions"""
+        return self.df[self.pending_rows].reset_index(drop=True)
+
+    def cached_data(self) -> Dict[str, Any]:
+        """Stored verdicts of the unchanged transactions, as 'analysis_data'"""
+        data = dict(self.rules or {}, transactions_list=[], flagged_list=[])
+        data.setdefault("rules_list", [])
+        for tx_id, fp in zip(self.ids, self.fingerprints.tolist()):
+            if fp not in self.found:
+                continue
+            entry, flagged = self.found[fp]
+            if entry is not None:
+                data["transactions_list"].append(dict(entry, transaction_id=tx_id))
+            if flagged:
+                data["flagged_list"].append(tx_id)
+        return data
+
+    def restrict(self, llm_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop verdicts on transactions that were not sent (the stored ones win)"""
+        llm_data = dict(llm_data.get("analysis_data", llm_data))
+        pending = {self.ids[index] for index in self.pending.tolist()}
+        llm_data["transactions_list"] = [tx for tx in llm_data.get("transactions_list", [])
+                                         if str(transaction_id(tx)) in pending]
+        llm_data["flagged_list"] = [tx_id for tx_id in llm_data.get("flagged_list", []) if str(tx_id) in pending]
+        return llm_data
+
+    def save(self, llm_data: Dict[str, Any]):
+        """
+        Store the verdicts the model returned for the pending transactions
+
+        Only transactions the reply mentions (in transactions_list or
+        flagged_list) are stored; the model often answers for a subset, and
+        the ones it left out have not been checked, so they stay pending.
+        """
+        llm_data = llm_data.get("analysis_data", llm_data)
+        entries = {str(transaction_id(tx)): tx for tx in llm_data.get("transactions_list", [])}
+        flagged = {str(tx_id) for tx_id in llm_data.get("flagged_list", [])}
+        outcomes = []
+        for index in self.pending.tolist():
+            tx_id = self.ids[index]
+            entry = entries.get(tx_id)
+            if entry is None and tx_id not in flagged:
+                continue
+            if entry is not None:
+                entry = {key: value for key, value in entry.items()
+                         if key not in KEY_ALIASES["transaction_id"]}
+            outcomes.append((self.fingerprints[index], entry, tx_id in flagged))
+        rules = {"rules_list": llm_data.get("rules_list", [])}
+        if "risk_scoring_definition" in llm_data:
+            rules["risk_scoring_definition"] = llm_data["risk_scoring_definition"]
+        if self.rules:
+            # Rules seen in earlier runs stay listed
+            known = {json.dumps(r, sort_keys=True, default=str) for r in rules["rules_list"]}
+            rules["rules_list"] += [r for r in self.rules.get("rules_list", [])
+                                    if json.dumps(r, sort_keys=True, default=str) not in known]
+        self.store.save(self.ruleset, rules, outcomes)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_outcome_store() -> OutcomeStore:
+    """Return the process-wide store configured from settings"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutcomeStore(
+                get_setting("OUTCOME_STORE_PATH", DEFAULT_OUTCOME_PATH),
+                max_age=get_setting("OUTCOME_MAX_AGE", DEFAULT_MAX_AGE),
+            )
+        return _store
@@ -1,103 +1,537 @@
 import streamlit as st
-import requests
 import json
-from io import BytesIO
-import PyPDF2
-from docx import Document
-from typing import Optional, Dict, Any
+import logging
+import contextvars
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, Callable
+from ruleengine import compile_rules, evaluate_rules, find_transaction_id_column, parse_rules
+from util import estimate_tokens, extract_json_from_string, merge_analysis
+from retrieval import relevant_sections
+from promptbuilder import (PromptTooLarge, add_usage, build_transaction_block, check_payload, log_usage,
+                           referenced_columns)
+from schemainfer import schema_of
+from dataprofile import profile_of
+from llmclient import chat_completion, get_client, get_setting, stream_chat_completion
+from streamparse import AnalysisStreamParser
+from extraction import extract_text, file_hash
+from txnstore import TransactionTable, load_transactions
+from outcomestore import Delta, get_outcome_store, ruleset_hash
+from resultmodel import transaction_id
+from rulescatalog import get_rules_catalog
+from rulesgeneration import catalog_rules
+from metrics import current_trace, span, trace
+
+logger = logging.getLogger(__name__)
+
+# Batch mode: approximate tokens of transaction rows per request, and
+# how many shard requests may be in flight at once
+DEFAULT_SHARD_TOKENS = 3000
+DEFAULT_MAX_WORKERS = 4
+# Token budget for rules document text; larger documents are cut down to
+# the sections relevant to the transaction columns
+RULES_TOKEN_BUDGET = 6000
+
+def read_prompts():
+    """Read the profiling and system prompts"""
+    with open("profiling_prompt.txt", "r", encoding='utf-8') as f:
+        prompt = f.read().strip()
+    with open("system_prompt.txt", "r", encoding='utf-8') as f:
+        systemPrompt = f.read().strip()
+    return prompt, systemPrompt
+
+
+def rules_text(
+    selected_files: list,
+    rules: Optional[list] = None,
+    headers: Optional[list] = None,
+    token_budget: int = RULES_TOKEN_BUDGET,
+    documents: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Join the text of the selected rules documents and any structured rules
+
+    When headers are given, each document is reduced to the sections most
+    relevant to those columns, within its share of token_budget. Documents
+    come from `documents` (name -> file object) when given, otherwise from
+    the uploads in the session.
+    """
+    if documents is None:
+        documents = {name: data['file'] for name, data in st.session_state.uploaded_rules.items()}
+    rules_content = []
+    per_document = token_budget // max(1, len(selected_files))
+    for filename in selected_files:
+        if filename in documents:
+            file_obj = documents[filename]
+            file_obj.seek(0)
+            content = extract_text(file_obj)
+            if content and headers:
+                content = relevant_sections(content, headers, per_document)
+            if content:
+                rules_content.append(f"=== {filename} ===\n{content}")
+    if rules:
+        rules_content.append("=== STRUCTURED RULES ===\n" + json.dumps(rules, indent=1))
+    return "\n\n".join(rules_content)
+
+
+def build_payload(prompt, systemPrompt, transaction_content, rules_content, file_name, table_content="",
+                  model=None):
+    """Build the chat-completion request for one block of transaction rows (model defaults to MODEL)"""
+    if table_content:
+        transaction_content = f"{table_content}\n\n{transaction_content}"
+    return {
+        "model": model or get_setting("MODEL"),
+        "messages": [{
+            "role":"system",
+            "content":systemPrompt
+        },
+            {
+            "role": "user",
+            "content": f"{prompt}\n\nTRANSACTION DATA:\n{transaction_content}\n\nRULES DOCUMENTS:\n" +
+                      rules_content,
+            "file_name": file_name
+        }],
+        "temperature": 0.7,
+        "max_tokens": 8000,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def table_context(transactions, rules_content: str, rules: Optional[list] = None) -> str:
+    """Inferred schema and data profile of the columns that go into the prompt"""
+    columns = referenced_columns(transactions.columns, rules_content, rules)
+    return f"{schema_of(transactions).to_prompt(columns)}\n\n{profile_of(transactions).to_prompt(columns)}"
 
-def extract_text(file_obj):
-    """Extract text from PDF, DOCX, or plain text files"""
-    try:
-        content = file_obj.read()
-        
-        if file_obj.name.lower().endswith('.pdf'):
-            pdf = PyPDF2.PdfReader(BytesIO(content))
-            return "\n".join([page.extract_text() for page in pdf.pages])
-        elif file_obj.name.lower().endswith('.docx'):
-            doc = Document(BytesIO(content))
-            return "\n".join([para.text for para in doc.paragraphs])
-        else:
-            # Try UTF-8 first, then fallback to latin-1
-            try:
-                return content.decode('utf-8')
-            except UnicodeDecodeError:
-                return content.decode('latin-1')
-    except Exception as e:
-        st.error(f"Error reading {file_obj.name}: {str(e)}")
-        return None
 
 def profile(
     selected_files: list,
-    transaction_file
+    transaction_file,
+    rules: Optional[list] = None,
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    documents: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Send transaction data and selected rules to DeepSeek API
     
     Args:
         selected_files: List of selected document names
-        transaction_file: Uploaded CSV file object
+        transaction_file: Uploaded CSV file object or parsed TransactionTable
+        rules: Structured rules to send instead of raw document text
+        on_event: If given, the reply is streamed and this is called with
+            ('rule' | 'transaction' | 'flagged', item) as each one completes
+        documents: Rules documents by name (defaults to the session uploads)
+        model: Model to ask (defaults to the MODEL setting)
         
     Returns:
         dict: API response JSON or None if failed
     """
     try:
         # 1. Read the prompt
-        with open("profiling_prompt.txt", "r", encoding='utf-8') as f:
-            prompt = f.read().strip()
-        with open("system_prompt.txt", "r", encoding='utf-8') as f:
-            systemPrompt = f.read().strip()
+        prompt, systemPrompt = read_prompts()
         
         # 2. Process transaction data
-        transaction_file.seek(0)
-        transaction_content = extract_text(transaction_file)
-        if not transaction_content:
-            raise ValueError("Failed to read transaction file")
+        transactions = load_transactions(transaction_file)
         
         # 3. Process selected rules documents
-        rules_content = []
-        for filename in selected_files:
-            if filename in st.session_state.uploaded_rules:
-                file_obj = st.session_state.uploaded_rules[filename]['file']
-                file_obj.seek(0)
-                content = extract_text(file_obj)
-                if content:
-                    rules_content.append(f"=== {filename} ===\n{content}")
-        
-        # 4. Prepare API request
-        payload = {
-            "model": st.secrets["MODEL"],
-            "messages": [{
-                "role":"system",
-                "content":systemPrompt
-            },
-                {
-                "role": "user",
-                "content": f"{prompt}\n\nTRANSACTION DATA:\n{transaction_content}\n\nRULES DOCUMENTS:\n" + 
-                          "\n\n".join(rules_content),
-                "file_name": transaction_file.name,
-                "file_content": transaction_content
-            }],
-            "temperature": 0.7,
-            "max_tokens": 8000,
-            "response_format": {"type": "json_object"}
-        }
+        with span("prompt_build", rows=transactions.num_rows):
+            rules_content = rules_text(selected_files, rules, transactions.columns, documents=documents)
+            legend, compact = build_transaction_block(transactions.to_pandas(), rules_content, rules)
+            table_content = table_context(transactions, rules_content, rules)
+
+            # 4. Prepare API request
+            payload = build_payload(prompt, systemPrompt, f"{legend}\n{compact}".strip(),
+                                    rules_content, transactions.name, table_content, model)
+            estimate = check_payload(payload)
         
         # 5. Send request
-        response = requests.post(
-            st.secrets["API_URL"],
-            headers={
-                "Authorization": f"Bearer {st.secrets['API_KEY']}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        api_response=response.json()
+        if on_event is None:
+            api_response = chat_completion(payload)
+        else:
+            api_response = stream_profile(payload, on_event)
+        log_usage(transactions.name, estimate, api_response)
         print(api_response)
         return api_response
         
+    except PromptTooLarge:
+        raise
     except Exception as e:
+        logger.exception("Analysis failed: %s", e)
         st.error(f"Analysis failed: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def stream_profile(payload, on_event):
+    """Stream a completion, emitting parsed elements, and return it in the non-streamed shape"""
+    parser = AnalysisStreamParser()
+    pieces, usage = [], None
+    for chunk in stream_chat_completion(payload):
+        if chunk.get('usage'):
+            usage = chunk['usage']
+        for choice in chunk.get('choices', []):
+            text = (choice.get('delta') or {}).get('content')
+            if text:
+                pieces.append(text)
+                for kind, item in parser.feed(text):
+                    on_event(kind, item)
+    return {
+        "choices": [{"message": {"role": "assistant", "content": "".join(pieces)}}],
+        "usage": usage,
+    }
+
+
+def shard_csv(transaction_content: str, token_budget: int = DEFAULT_SHARD_TOKENS) -> list:
+    """
+    Split CSV text into row shards that each fit in a token budget
+
+    The header line is repeated at the top of every shard so each request
+    can be understood on its own.
+    """
+    lines = []
+    for line in transaction_content.splitlines():
+        # Quoted fields may span lines; keep such records together
+        if lines and lines[-1].count('"') % 2:
+            lines[-1] += "\n" + line
+        else:
+            lines.append(line)
+    if not lines:
+        return []
+    header, rows = lines[0], [line for line in lines[1:] if line.strip()]
+    header_tokens = estimate_tokens(header)
+    shards, current, current_tokens = [], [], header_tokens
+    for row in rows:
+        row_tokens = estimate_tokens(row)
+        if current and current_tokens + row_tokens > token_budget:
+            shards.append("\n".join([header] + current))
+            current, current_tokens = [], header_tokens
+        current.append(row)
+        current_tokens += row_tokens
+    if current or not shards:
+        shards.append("\n".join([header] + current))
+    return shards
+
+
+def profile_batch(
+    selected_files: list,
+    transaction_file,
+    rules: Optional[list] = None,
+    token_budget: int = DEFAULT_SHARD_TOKENS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    documents: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Send the transaction file to DeepSeek API in row shards and merge the results
+
+    Args:
+        selected_files: List of selected document names
+        transaction_file: Uploaded CSV file object or parsed TransactionTable
+        rules: Structured rules to send instead of raw document text
+        token_budget: Approximate token size of the transaction rows per shard
+        max_workers: Maximum number of requests in flight at once
+        progress_callback: Called with (shards done, total shards) after each shard
+        documents: Rules documents by name (defaults to the session uploads)
+        model: Model to ask (defaults to the MODEL setting)
+
+    Returns:
+        dict: merged 'analysis_data' or None if failed
+    """
+    try:
+        prompt, systemPrompt = read_prompts()
+
+        transactions = load_transactions(transaction_file)
+
+        # Everything touching st.* is resolved here, worker threads only do I/O
+        with span("prompt_build", rows=transactions.num_rows):
+            rules_content = rules_text(selected_files, rules, transactions.columns, documents=documents)
+            legend, compact = build_transaction_block(transactions.to_pandas(), rules_content, rules)
+            shards = shard_csv(compact, token_budget)
+            table_content = table_context(transactions, rules_content, rules)
+            payloads = [build_payload(prompt, systemPrompt, f"{legend}\n{shard}".strip(),
+                                      rules_content, transactions.name, table_content, model)
+                        for shard in shards]
+            estimates = [check_payload(payload) for payload in payloads]
+        client = get_client()
+
+        def run_shard(payload, estimate):
+            api_response = client.chat(payload)
+            log_usage(transactions.name, estimate, api_response)
+            content = api_response['choices'][0]['message']['content']
+            return extract_json_from_string(content), api_response.get('usage')
+
+        results = [None] * len(payloads)
+        usage = None
+        failures = []
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # Each shard runs in a copy of this context so its spans land in the current trace
+            futures = {pool.submit(contextvars.copy_context().run, run_shard, payload, estimate): i
+                       for i, (payload, estimate) in enumerate(zip(payloads, estimates))}
+            for done, future in enumerate(as_completed(futures), start=1):
+                index = futures[future]
+                try:
+                    results[index], shard_usage = future.result()
+                    usage = add_usage(usage, shard_usage)
+                except Exception as e:
+                    failures.append(f"shard {index + 1}: {str(e)}")
+                if progress_callback:
+                    progress_callback(done, len(payloads))
+
+        if failures:
+            logger.warning("%d of %d shard(s) failed: %s", len(failures), len(payloads), "; ".join(failures))
+            st.warning(f"{len(failures)} of {len(payloads)} shard(s) failed: " + "; ".join(failures))
+        if all(result is None for result in results):
+            raise ValueError("every shard failed")
+        merged = merge_analysis(*results)
+        merged['shards'] = {'total': len(payloads), 'failed': len(failures)}
+        merged['usage'] = usage
+        return merged
+
+    except Exception as e:
+        logger.exception("Analysis failed: %s", e)
+        st.error(f"Analysis failed: {str(e)}")
+        return None
+
+
+def structured_rules(filename, generated_results=None, document=None, columns=None):
+    """
+    Return the structured rules for a document, if any
+
+    With the document file, the rules come from the rules catalog entry for
+    that exact version, narrowed to the ones referencing `columns`; rules
+    generated in this session but not catalogued yet are added first.
+    """
+    if generated_results is None:
+        generated_results = st.session_state.get('generated_results', {})
+    result = generated_results.get(filename)
+    if document is not None:
+        document.seek(0)
+        content = document.read()
+        document.seek(0)
+        if result and 'content' in result:
+            catalog_rules(content, filename, result)
+        found = get_rules_catalog().rules(file_hash(content), columns)
+        if found is not None:
+            return found
+    if not result or 'content' not in result:
+        return []
+    return parse_rules(result['content'])
+
+
+@trace("analysis")
+def analyze(
+    selected_files: list,
+    transaction_file,
+    batch: bool = False,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    documents: Optional[Dict[str, Any]] = None,
+    generated_results: Optional[Dict[str, Any]] = None,
+    incremental: Optional[bool] = None,
+    cascade: Optional[bool] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Check rules locally where possible and send only the rest to DeepSeek API
+
+    Documents that already have generated rules (in the rules catalog or
+    this session) are checked by the local rule engine, using only their
+    rules that concern the transaction columns; rules that cannot be
+    compiled, plus any documents without generated rules, go to the model
+    through profile(), or through profile_batch() when batch is set. With
+    on_event, local results are reported first ('local', analysis_data)
+    and the model reply is streamed. documents and generated_results
+    replace the session uploads and generated rules, so the analysis can
+    run outside the script thread. With incremental (the
+    INCREMENTAL_ANALYSIS setting by default), only transactions without a
+    stored verdict for this rule set go to the model; stored verdicts are
+    merged back in. With cascade (the CASCADE_MODE setting by default), a
+    screening model (SCREEN_MODEL) looks at every transaction first and only
+    the ones it does not clear are escalated to the model (see cascade.py);
+    without a screening model the cascade is skipped.
+
+    Returns:
+        dict: {'analysis_data': ..., 'performance': stage timings} or None if failed
+    """
+    try:
+        with span("load_transactions"):
+            transactions = load_transactions(transaction_file)
+        columns = transactions.columns
+
+        if documents is None:
+            documents = {name: data['file'] for name, data in st.session_state.uploaded_rules.items()}
+        rules, raw_files = [], []
+        for filename in selected_files:
+            found = structured_rules(filename, generated_results, documents.get(filename), columns)
+            if found:
+                rules.extend(found)
+            else:
+                raw_files.append(filename)
+
+        local_data = None
+        leftover = []
+        if rules:
+            compiled, leftover = compile_rules(rules, columns)
+            if compiled:
+                # Only the columns the compiled rules read are converted
+                needed = [find_transaction_id_column(columns)] + [c for rule in compiled for c in rule.columns]
+                needed = list(dict.fromkeys(c for c in needed if c is not None))
+                with span("local_rules", rules=len(compiled), rows=transactions.num_rows):
+                    local_data = evaluate_rules(transactions.to_pandas(needed), compiled)
+                leftover.extend(local_data.pop('unsupported_rules'))
+                if on_event:
+                    on_event('local', local_data)
+
+        if local_data is not None and not raw_files and not leftover:
+            return {'analysis_data': local_data, 'performance': current_trace().to_dict()}
+
+        cascaded = _enabled(cascade, "CASCADE_MODE", False)
+        if cascaded:
+            from cascade import tier_settings
+            # Without a screening model nothing could be cleared, so there is no second tier
+            cascaded = bool(tier_settings("screen")["model"])
+        delta, cached, llm_transactions, screening = None, None, transactions, None
+        if _enabled(incremental, "INCREMENTAL_ANALYSIS", True):
+            delta = start_delta(transactions.to_pandas(), raw_files, leftover, documents, cascaded)
+            if delta is not None and delta.reused:
+                cached = delta.cached_data()
+                llm_transactions = TransactionTable(f"{transactions.key}:delta", transactions.name,
+                                                    df=delta.pending_frame(), schema=transactions.schema)
+                # The model still sees the statistics of the whole table
+                llm_transactions.data_profile = profile_of(transactions)
+                if on_event:
+                    on_event('local', cached)
+
+        if cached is not None and not len(delta.pending):
+            llm_data = {}  # nothing new or changed since the last run
+        else:
+            if cascaded:
+                from cascade import screen_transactions
+                llm_transactions, screening = screen_transactions(raw_files, llm_transactions, leftover,
+                                                                  documents, local_data, progress_callback)
+            if screening is not None and not screening['escalated']:
+                llm_data = {}  # the screening tier cleared every transaction
+            else:
+                tier = tier_settings("escalate") if cascaded else None
+                asked = ask_model(raw_files, llm_transactions, leftover, batch, progress_callback, on_event,
+                                  documents, tier)
+                if asked is None:
+                    return None
+                llm_data, batch = asked
+            if delta is not None:
+                delta.save(llm_data)
+        if cached is not None:
+            usage, shards = llm_data.get('usage'), llm_data.get('shards')
+            llm_data = merge_analysis(cached, delta.restrict(llm_data))
+            llm_data.update(usage=usage, shards=shards)
+        if delta is not None:
+            llm_data['incremental'] = {'reused': delta.reused, 'evaluated': len(delta.pending)}
+        analysis_data = merge_analysis(local_data, llm_data)
+        analysis_data['flagged_list'] = list(dict.fromkeys(str(t) for t in analysis_data['flagged_list']))
+        if local_data:
+            # Local and model verdicts for the same transaction are combined
+            analysis_data['transactions_list'] = _combine_transactions(analysis_data['transactions_list'])
+        if batch:
+            analysis_data['shards'] = llm_data.get('shards')
+        analysis_data['usage'] = llm_data.get('usage')
+        analysis_data['local_rules_checked'] = len(local_data['rules_list']) if local_data else 0
+        if 'incremental' in llm_data:
+            analysis_data['incremental'] = llm_data['incremental']
+        if screening is not None:
+            analysis_data['cascade'] = screening
+        return {'analysis_data': analysis_data, 'performance': current_trace().to_dict()}
+
+    except Exception as e:
+        logger.exception("Analysis failed: %s", e)
+        st.error(f"Analysis failed: {str(e)}")
+        return None
+
+
+def ask_model(raw_files, transactions, rules, batch, progress_callback=None, on_event=None, documents=None,
+              tier=None):
+    """
+    Get the model's verdicts on a table, in one request or in shards
+
+    tier (see cascade.tier_settings) sets the model, shard size and
+    concurrency; by default MODEL is asked with the batch-mode defaults.
+
+    Returns:
+        tuple: (analysis_data from the model, whether batch mode was used), or None if failed
+    """
+    tier = tier or {"model": None, "shard_tokens": DEFAULT_SHARD_TOKENS, "workers": DEFAULT_MAX_WORKERS}
+    batch_options = dict(rules=rules, token_budget=tier["shard_tokens"], max_workers=tier["workers"],
+                         progress_callback=progress_callback, documents=documents, model=tier["model"])
+    if batch:
+        llm_data = profile_batch(raw_files, transactions, **batch_options)
+        return None if llm_data is None else (llm_data, True)
+    try:
+        api_response = profile(raw_files, transactions, rules=rules, on_event=on_event,
+                               documents=documents, model=tier["model"])
+    except PromptTooLarge as e:
+        # Too big for one request: shard it instead of truncating
+        st.info(f"{str(e)}; switching to batch mode")
+        llm_data = profile_batch(raw_files, transactions, **batch_options)
+        return None if llm_data is None else (llm_data, True)
+    if api_response is None:
+        return None
+    content = api_response['choices'][0]['message']['content']
+    llm_data = extract_json_from_string(content)
+    llm_data['usage'] = api_response.get('usage')
+    return llm_data, False
+
+
+def _enabled(value, setting, default):
+    if value is None:
+        value = get_setting(setting, default)
+    return str(value).lower() not in ("0", "false", "no", "off")
+
+
+def start_delta(df, raw_files, rules, documents=None, cascade=False):
+    """
+    Split off the transactions whose verdicts are stored for this exact rule set
+
+    The rule set hash covers the prompts, the model, the columns, the
+    structured rules sent, the bytes of every raw rules document, the run
+    date (rules like 'older than 365 days' age with it) and, in cascade
+    mode, the tier models. Returns None when the table has no transaction
+    id column.
+    """
+    id_column = find_transaction_id_column(df.columns)
+    if id_column is None or not len(df):
+        return None
+    if documents is None:
+        documents = {name: data['file'] for name, data in st.session_state.uploaded_rules.items()}
+    prompt, systemPrompt = read_prompts()
+    parts = [prompt, systemPrompt, get_setting("MODEL"), json.dumps(list(df.columns)),
+             json.dumps(rules or [], sort_keys=True, default=str), date.today().isoformat()]
+    for filename in raw_files:
+        file_obj = documents.get(filename)
+        if file_obj is not None:
+            file_obj.seek(0)
+            parts += [filename, file_hash(file_obj.read())]
+            file_obj.seek(0)
+    if cascade:
+        from cascade import read_screening_prompt, tier_settings
+        screen, escalate = tier_settings("screen"), tier_settings("escalate")
+        parts += ["cascade", read_screening_prompt(), screen["model"] or "local rules", escalate["model"]]
+    with span("delta_split", rows=len(df)):
+        return Delta(get_outcome_store(), ruleset_hash(parts), df, id_column)
+
+
+def _combine_transactions(transactions):
+    combined = {}
+    for tx in transactions:
+        tx_id = str(transaction_id(tx))
+        if tx_id not in combined:
+            combined[tx_id] = dict(tx)
+            continue
+        current = combined[tx_id]
+        current['voilated_rules_list'] = list(current.get('voilated_rules_list', [])) + [
+            r for r in tx.get('voilated_rules_list', []) if r not in current.get('voilated_rules_list', [])]
+        current['flag'] = bool(current.get('flag')) or bool(tx.get('flag'))
+        current['risk_score'] = min(100, max(current.get('risk_score', 0), tx.get('risk_score', 0)))
+        if tx.get('flag'):
+            current['explanation'] = "; ".join(
+                e for e in (current.get('explanation'), tx.get('explanation'))
+                if e and e != "No rules violated.")
+            current['remediation'] = tx.get('remediation', current.get('remediation'))
+    return list(combined.values())
@@ -0,0 +1,145 @@
+"""
+PROMPT BUILDER
+Measures profiling payloads before they are sent and shrinks the
+transaction block: columns no rule mentions are dropped, repeated
+low-cardinality text is dictionary-encoded and verbose timestamps are
+shortened. Payloads that would overflow the model context are refused so
+the caller can shard them instead.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from llmclient import get_setting
+from metrics import count, emit
+from ruleengine import find_transaction_id_column, parse_datetimes
+from util import estimate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 64000
+# Columns with at most this many distinct values (and a repeat ratio below
+# DICTIONARY_RATIO) are sent as short codes plus a legend
+DICTIONARY_MAX_VALUES = 200
+DICTIONARY_RATIO = 0.5
+SHORT_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class PromptTooLarge(ValueError):
+    """Raised when a payload would not fit in the model context window"""
+
+    def __init__(self, estimate, limit):
+        super().__init__(f"prompt needs ~{estimate} tokens but only {limit} fit in the model context")
+        self.estimate = estimate
+        self.limit = limit
+
+
+def context_limit(max_tokens: int = 0) -> int:
+    """Prompt tokens available once the completion budget is reserved"""
+    return int(get_setting("MODEL_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS)) - int(max_tokens)
+
+
+def _words(name):
+    return re.sub(r"([a-z])([A-Z])", r"\1 \2", name).lower()
+
+
+def referenced_columns(columns: List[str], rules_content: str, rules: Optional[list] = None) -> List[str]:
+    """
+    Columns mentioned by the rules (by name or spaced-out name)
+
+    The transaction id column is always kept. If nothing matches, every
+    column is kept, since the rules may describe fields in other words.
+    """
+    text = (rules_content or "") + (json.dumps(rules) if rules else "")
+    lowered = text.lower()
+    keep = [c for c in columns if c.lower() in lowered or _words(c) in lowered]
+    id_column = find_transaction_id_column(columns)
+    if not keep:
+        return list(columns)
+    if id_column and id_column not in keep:
+        keep.insert(0, id_column)
+    return [c for c in columns if c in keep]
+
+
+def compact_transactions(df: pd.DataFrame, keep_columns: Optional[List[str]] = None):
+    """
+    Encode the transaction table compactly for the prompt
+
+    Returns:
+        tuple: (legend text explaining the encoding, compact CSV text)
+    """
+    df = df[keep_columns] if keep_columns else df
+    id_column = find_transaction_id_column(df.columns)
+    legend = []
+    out = {}
+    for column in df.columns:
+        series = df[column]
+        if column == id_column or not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            out[column] = series
+            continue
+        parsed = parse_datetimes(series)
+        if parsed.notna().mean() > 0.9:
+            # Values that are not timestamps are sent as they are
+            out[column] = parsed.dt.strftime(SHORT_TIME_FORMAT).where(parsed.notna(), series)
+            legend.append(f"{column}: timestamps shortened to YYYY-MM-DD HH:MM")
+            continue
+        codes, uniques = pd.factorize(series)
+        lengths = series.astype("string").str.len().dropna()
+        average_length = lengths.mean() if len(lengths) else 0
+        if (len(uniques) <= DICTIONARY_MAX_VALUES and len(uniques) <= DICTIONARY_RATIO * len(series)
+                and average_length > 3):
+            out[column] = pd.Series([f"@{c}" if c >= 0 else "" for c in codes], index=series.index)
+            pairs = " | ".join(f"@{i}={value}" for i, value in enumerate(uniques))
+            legend.append(f"{column}: {pairs}")
+        else:
+            out[column] = series
+    compact = pd.DataFrame(out, index=df.index)
+    legend_text = ("ENCODING (decode before applying rules):\n" + "\n".join(legend)) if legend else ""
+    return legend_text, compact.to_csv(index=False)
+
+
+def build_transaction_block(df: pd.DataFrame, rules_content: str, rules: Optional[list] = None):
+    """Return (legend, compact CSV) for the columns the rules use"""
+    return compact_transactions(df, referenced_columns(list(df.columns), rules_content, rules))
+
+
+def payload_tokens(payload: Dict[str, Any]) -> int:
+    """Estimated prompt tokens of a chat-completion payload"""
+    return sum(estimate_tokens(str(m.get("content", ""))) + 4 for m in payload.get("messages", []))
+
+
+def check_payload(payload: Dict[str, Any]) -> int:
+    """Return the token estimate, or raise PromptTooLarge if it overflows the context"""
+    estimate = payload_tokens(payload)
+    limit = context_limit(payload.get("max_tokens", 0))
+    if estimate > limit:
+        raise PromptTooLarge(estimate, limit)
+    return estimate
+
+
+def log_usage(label: str, estimate: int, api_response: Optional[Dict[str, Any]]):
+    """
+    Record the local token estimate next to the usage reported by the API
+
+    Both go to the metrics counters (performance panel, Prometheus file)
+    and one 'prompt_tokens' event per request to the metrics log.
+    """
+    usage = (api_response or {}).get("usage") or {}
+    actual = usage.get("prompt_tokens")
+    count("prompt_tokens_estimated_total", estimate)
+    if actual:
+        count("prompt_tokens_reported_total", actual)
+    emit("prompt_tokens", label=label, estimated=estimate, actual=actual,
+         completion=usage.get("completion_tokens"),
+         error=round((estimate - actual) / actual, 4) if actual else None)
+
+
+def add_usage(total: Optional[Dict[str, int]], usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """Add one API usage block to a running total (either may be None)"""
+    if not usage:
+        return total
+    total = dict(total or {})
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        total[key] = total.get(key, 0) + int(usage.get(key) or 0)
+    return total
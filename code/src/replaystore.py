@@ -0,0 +1,162 @@
+"""
+LLM RECORD / REPLAY
+Local store of chat-completion replies keyed by a fingerprint of the
+request (prompt hash, model and parameters), so re-running the same rules
+against the same data is answered from disk. Replies are kept zlib
+compressed in one SQLite file.
+
+Modes (LLM_REPLAY_MODE setting, or replay_mode() for one block of code):
+    off     every request goes to the API
+    record  every request goes to the API and its reply is saved
+    replay  saved replies answer matching requests; misses go to the API and are saved
+    strict  saved replies only; a miss raises ReplayMiss (offline tests, benchmarks)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from llmclient import get_setting
+from metrics import count
+
+DEFAULT_REPLAY_PATH = os.path.join(".cache", "replay", "replies.sqlite")
+MODES = ("off", "record", "replay", "strict")
+# Characters per chunk when a saved reply is played back as a stream
+STREAM_CHUNK_CHARS = 2048
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    fingerprint TEXT PRIMARY KEY,
+    model TEXT,
+    prompt_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    response BLOB NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ReplayMiss(LookupError):
+    """Raised in strict mode when no reply was recorded for a request"""
+
+    def __init__(self, fingerprint):
+        super().__init__(f"no recorded reply for request {fingerprint[:12]} (strict replay mode)")
+        self.fingerprint = fingerprint
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":"),
+                                     default=str).encode("utf-8")).hexdigest()
+
+
+def request_parts(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Model, prompt hash and the remaining parameters of a request"""
+    params = {k: v for k, v in payload.items() if k not in ("messages", "model", "stream")}
+    return {"model": payload.get("model"), "prompt_hash": _digest(payload.get("messages")), "params": params}
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    """Identity of a request; streamed and plain requests share it"""
+    return _digest(request_parts(payload))
+
+
+class ReplayStore:
+    """SQLite-backed map of request fingerprint -> compressed reply"""
+
+    def __init__(self, path: str = DEFAULT_REPLAY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The saved reply for a fingerprint, or None"""
+        with self.lock:
+            row = self.db.execute("SELECT response FROM replies WHERE fingerprint = ?", (key,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE replies SET hits = hits + 1, last_used = ? WHERE fingerprint = ?",
+                                (time.time(), key))
+                self.db.commit()
+        if row is None:
+            count("cache_misses_total", cache="replay")
+            return None
+        count("cache_hits_total", cache="replay")
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, payload: Dict[str, Any], response: Dict[str, Any]):
+        """Save (or replace) the reply to a request"""
+        parts = request_parts(payload)
+        blob = zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"), 6)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO replies (fingerprint, model, prompt_hash, params, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, parts["model"], parts["prompt_hash"], json.dumps(parts["params"], sort_keys=True),
+                 blob, now, now))
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, hits, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(LENGTH(response)), 0) FROM replies").fetchone()
+        return {"entries": entries, "hits": hits, "bytes": size}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_replay_store() -> ReplayStore:
+    """Return the process-wide store configured from settings"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReplayStore(get_setting("LLM_REPLAY_PATH", DEFAULT_REPLAY_PATH))
+        return _store
+
+
+# --------------------------
+# MODE SELECTION
+# --------------------------
+# Set per block of code (a session's analysis, a background job); worker
+# threads started with contextvars.copy_context().run inherit it
+_mode: ContextVar[Optional[str]] = ContextVar("llm_replay_mode", default=None)
+
+
+@contextmanager
+def replay_mode(mode: Optional[str]):
+    """Use a replay mode inside the block (None keeps the configured one)"""
+    token = _mode.set(mode)
+    try:
+        yield
+    finally:
+        _mode.reset(token)
+
+
+def current_mode() -> str:
+    mode = _mode.get() or get_setting("LLM_REPLAY_MODE", "off") or "off"
+    if mode not in MODES:
+        raise ValueError(f"unknown replay mode {mode!r}, expected one of {', '.join(MODES)}")
+    return mode
+
+
+def replay_chunks(response: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Play a saved reply back in the shape of server-sent stream chunks"""
+    content = response["choices"][0]["message"]["content"] or ""
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        yield {"choices": [{"delta": {"content": content[start:start + STREAM_CHUNK_CHARS]}}]}
+    yield {"choices": [], "usage": response.get("usage")}
@@ -0,0 +1,412 @@
+"""
+ANALYSIS RESULT MODEL
+Compact, typed representation of an 'analysis_data' reply. Rules are
+slotted records; transactions are stored column-wise (numpy arrays for
+ids, scores, flags and segment scores, CSR-style integer codes into the
+rules table for violated rules, and interned tables for repeated text).
+Parsing tolerates the misspelled keys the model uses and to_dict()
+round-trips back to the original JSON.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# canonical field -> accepted spellings (first one is the default on output)
+KEY_ALIASES = {
+    "transaction_id": ("transaction_id", "transactionid", "TransactionId", "id"),
+    "violated_rules": ("voilated_rules_list", "violated_rules_list", "violated_rules", "voilated_rules"),
+    "flag": ("flag", "flagged"),
+    "risk_score": ("risk_score", "riskscore", "score"),
+    "risk_segments": ("risk_segments", "risk_segment"),
+    "explanation": ("explanation", "explaination"),
+    "remediation": ("remediation", "remediations"),
+    "remarks": ("remarks", "remark"),
+    "suggestions": ("sugggestions", "suggestions", "suggestion"),
+}
+ALIAS_LOOKUP = {alias: canonical for canonical, spellings in KEY_ALIASES.items() for alias in spellings}
+TEXT_FIELDS = ("explanation", "remediation", "remarks", "suggestions")
+RULE_ID_KEYS = ("ruleid", "rule_id", "id")
+RULE_FIELDS = ("description", "origin", "severity", "remarks")
+LIST_KEYS = ("rules_list", "transactions_list", "flagged_list")
+
+
+def transaction_id(tx: Dict[str, Any]) -> Any:
+    """Id of a transaction dict under whichever spelling the reply used (None if missing)"""
+    for key in KEY_ALIASES["transaction_id"]:
+        if key in tx:
+            return tx[key]
+    return None
+
+
+@dataclass(slots=True)
+class RuleRecord:
+    """One rule; fields the reply left out stay None"""
+    ruleid: str
+    description: Optional[str] = None
+    origin: Optional[str] = None
+    severity: Optional[str] = None
+    remarks: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+    id_key: str = "ruleid"
+    implicit: bool = False  # referenced by a transaction but not listed
+
+    @classmethod
+    def from_dict(cls, rule: Dict[str, Any]) -> "RuleRecord":
+        id_key = next((k for k in RULE_ID_KEYS if k in rule), "ruleid")
+        return cls(
+            ruleid=rule.get(id_key, ""),
+            extra={k: v for k, v in rule.items() if k != id_key and k not in RULE_FIELDS},
+            id_key=id_key,
+            **{k: rule[k] for k in RULE_FIELDS if k in rule},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {self.id_key: self.ruleid}
+        out.update({k: getattr(self, k) for k in RULE_FIELDS if getattr(self, k) is not None})
+        out.update(self.extra)
+        return out
+
+
+class _Interned:
+    """Stores repeated values once; rows hold integer codes"""
+
+    __slots__ = ("values", "lookup")
+
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+
+    def code(self, value) -> int:
+        if isinstance(value, (list, dict)):
+            key = json.dumps(value, sort_keys=True, default=str)
+        else:
+            key = (type(value), value)
+        code = self.lookup.get(key)
+        if code is None:
+            code = self.lookup[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def value(self, code: int):
+        value = self.values[code]
+        return json.loads(json.dumps(value)) if isinstance(value, (list, dict)) else value
+
+    def __getstate__(self):
+        return self.values
+
+    def __setstate__(self, values):
+        self.values = []
+        self.lookup = {}
+        for value in values:
+            self.code(value)
+
+
+class AnalysisResult:
+    """Column-oriented analysis result"""
+
+    __slots__ = ("rules", "rule_codes", "ids", "scores", "flags", "segment_names", "segments",
+                 "violation_offsets", "violation_codes", "text", "text_codes", "key_names",
+                 "overrides", "flagged_list", "meta", "present")
+
+    def __init__(self):
+        self.rules: List[RuleRecord] = []
+        self.rule_codes: Dict[str, int] = {}
+        self.ids = np.array([], dtype=object)
+        self.scores = np.array([], dtype=np.float64)
+        self.flags = np.array([], dtype=bool)
+        self.segment_names: List[str] = []
+        self.segments = np.zeros((0, 0), dtype=np.float64)
+        self.violation_offsets = np.zeros(1, dtype=np.int64)
+        self.violation_codes = np.array([], dtype=np.int32)
+        self.text = {name: _Interned() for name in TEXT_FIELDS}
+        self.text_codes = {name: np.array([], dtype=np.int32) for name in TEXT_FIELDS}
+        self.key_names = {canonical: spellings[0] for canonical, spellings in KEY_ALIASES.items()}
+        # row position -> values that did not fit the typed columns, plus
+        # bookkeeping for keys spelled differently or left out on that row
+        self.overrides: Dict[int, Dict[str, Any]] = {}
+        self.flagged_list: List[Any] = []
+        self.meta: Dict[str, Any] = {}
+        self.present: Optional[List[str]] = None  # top-level lists the reply had
+
+    # --------------------------
+    # PARSING
+    # --------------------------
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalysisResult":
+        """Parse an 'analysis_data' dict (or the {'analysis_data': ...} wrapper)"""
+        if isinstance(data, AnalysisResult):
+            return data
+        if not isinstance(data, dict):
+            data = {}
+        if isinstance(data.get("analysis_data"), dict):
+            data = data["analysis_data"]
+        result = cls()
+        result.present = [k for k in LIST_KEYS if k in data]
+        for rule in data.get("rules_list") or []:
+            record = RuleRecord.from_dict(rule) if isinstance(rule, dict) else RuleRecord(ruleid=rule, id_key="")
+            result.rule_codes.setdefault(record.ruleid, len(result.rules))
+            result.rules.append(record)
+        result.flagged_list = list(data.get("flagged_list") or [])
+        result.meta = {k: v for k, v in data.items() if k not in LIST_KEYS}
+        result._parse_transactions([tx for tx in data.get("transactions_list") or [] if isinstance(tx, dict)])
+        return result
+
+    @classmethod
+    def from_json(cls, text: str) -> "AnalysisResult":
+        return cls.from_dict(json.loads(text))
+
+    def _resolve_keys(self, transactions):
+        for canonical, spellings in KEY_ALIASES.items():
+            self.key_names[canonical] = next(
+                (k for tx in transactions[:50] for k in spellings if k in tx), spellings[0])
+
+    def _layout(self, keys):
+        """Where each canonical field lives for rows with this key layout"""
+        found, extra, renamed = {}, [], {}
+        for key in keys:
+            canonical = ALIAS_LOOKUP.get(key)
+            if canonical is None or canonical in found:
+                extra.append(key)
+                continue
+            found[canonical] = key
+            if key != self.key_names[canonical]:
+                renamed[canonical] = key
+        missing = [c for c in KEY_ALIASES if c not in found and c not in TEXT_FIELDS]
+        return found, extra, renamed, missing
+
+    def _rule_code(self, ruleid: str) -> int:
+        code = self.rule_codes.get(ruleid)
+        if code is None:
+            code = self.rule_codes[ruleid] = len(self.rules)
+            self.rules.append(RuleRecord(ruleid=ruleid, implicit=True))
+        return code
+
+    def _parse_transactions(self, transactions):
+        n = len(transactions)
+        self._resolve_keys(transactions)
+
+        # filled as plain lists (cheaper per element) and frozen into arrays below
+        ids = [None] * n
+        scores = [np.nan] * n
+        flags = [False] * n
+        offsets = [0] * (n + 1)
+        codes: List[int] = []
+        text_codes = {name: [-1] * n for name in TEXT_FIELDS}
+        segment_index: Dict[str, int] = {}
+        segment_layouts: Dict[tuple, List[int]] = {}
+        segment_rows = []
+        layouts = {}
+
+        for i, tx in enumerate(transactions):
+            shape = tuple(tx)
+            layout = layouts.get(shape)
+            if layout is None:
+                layout = layouts[shape] = self._layout(shape)
+            found, extra, renamed, missing = layout
+            override = {key: tx[key] for key in extra}
+            if renamed:
+                override["_keys"] = renamed
+            if missing:
+                override["_missing"] = missing
+
+            key = found.get("transaction_id")
+            if key:
+                ids[i] = tx[key]
+            key = found.get("risk_score")
+            if key:
+                value = tx[key]
+                kind = type(value)
+                if kind is int or kind is float:
+                    scores[i] = value
+                    if kind is float:
+                        override["_float"] = True
+                else:
+                    override[key] = value
+            key = found.get("flag")
+            if key:
+                value = tx[key]
+                if value is True or value is False:
+                    flags[i] = value
+                else:
+                    override[key] = value
+            key = found.get("violated_rules")
+            if key:
+                value = tx[key]
+                if type(value) is list:
+                    rule_codes = self.rule_codes
+                    try:
+                        codes.extend([rule_codes[r] if r in rule_codes else self._rule_code(r) for r in value])
+                    except TypeError:  # unhashable entries (dicts): keep verbatim
+                        override[key] = value
+                else:
+                    override[key] = value
+            offsets[i + 1] = len(codes)
+            key = found.get("risk_segments")
+            if key:
+                value = tx[key]
+                if type(value) is dict and all(type(v) is int for v in value.values()):
+                    order = tuple(value)
+                    columns = segment_layouts.get(order)
+                    if columns is None:
+                        columns = [segment_index.setdefault(s, len(segment_index)) for s in order]
+                        segment_layouts[order] = columns
+                    segment_rows.append((i, order, columns, tuple(value.values())))
+                else:
+                    override[key] = value
+            for name in TEXT_FIELDS:
+                key = found.get(name)
+                if key:
+                    text_codes[name][i] = self.text[name].code(tx[key])
+            if override:
+                self.overrides[i] = override
+
+        self.ids = np.empty(n, dtype=object)
+        self.ids[:] = ids
+        self.scores = np.array(scores, dtype=np.float64)
+        self.flags = np.array(flags, dtype=bool)
+        self.violation_offsets = np.array(offsets, dtype=np.int64)
+        self.violation_codes = np.array(codes, dtype=np.int32)
+        self.text_codes = {name: np.array(values, dtype=np.int32) for name, values in text_codes.items()}
+        self.segment_names = list(segment_index)
+        self.segments = np.full((n, len(segment_index)), np.nan, dtype=np.float64)
+        for i, order, columns, values in segment_rows:
+            self.segments[i, columns] = values
+            if list(order) != self.segment_names:
+                self.overrides.setdefault(i, {})["_segments"] = list(order)
+
+    # --------------------------
+    # ACCESS
+    # --------------------------
+    def __len__(self):
+        return len(self.ids)
+
+    def violated_codes(self, position: int) -> np.ndarray:
+        return self.violation_codes[self.violation_offsets[position]:self.violation_offsets[position + 1]]
+
+    def violated_rules(self, position: int) -> List[str]:
+        return [self.rules[c].ruleid for c in self.violated_codes(position)]
+
+    def violation_counts(self) -> np.ndarray:
+        return np.diff(self.violation_offsets)
+
+    def text_value(self, name: str, position: int, default=""):
+        code = self.text_codes[name][position]
+        return self.text[name].value(code) if code >= 0 else default
+
+    def segment_scores(self, position: int) -> Dict[str, int]:
+        names = self.overrides.get(position, {}).get("_segments") or self.segment_names
+        row = self.segments[position]
+        return {name: int(row[self.segment_names.index(name)]) for name in names}
+
+    def rule_rows(self) -> Dict[str, np.ndarray]:
+        """Rule id -> positions of the transactions that violate it"""
+        if not len(self.violation_codes):
+            return {}
+        rows = np.repeat(np.arange(len(self.ids)), self.violation_counts())
+        order = np.argsort(self.violation_codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(self.violation_codes[order])) + 1
+        return {self.rules[self.violation_codes[group[0]]].ruleid: rows[group]
+                for group in np.split(order, bounds)}
+
+    def transaction(self, position: int) -> Dict[str, Any]:
+        """Rebuild one transaction dict as it was parsed"""
+        override = self.overrides.get(position, {})
+        keys = dict(self.key_names, **override.get("_keys", {}))
+        skip = set(override.get("_missing", ())) | {c for c, k in keys.items() if k in override}
+        out = {}
+        if "transaction_id" not in skip:
+            out[keys["transaction_id"]] = self.ids[position]
+        if "violated_rules" not in skip:
+            out[keys["violated_rules"]] = self.violated_rules(position)
+        if "flag" not in skip:
+            out[keys["flag"]] = bool(self.flags[position])
+        if "risk_score" not in skip:
+            score = float(self.scores[position])
+            out[keys["risk_score"]] = score if override.get("_float") else int(score)
+        if "risk_segments" not in skip:
+            out[keys["risk_segments"]] = self.segment_scores(position)
+        for name in TEXT_FIELDS:
+            code = self.text_codes[name][position]
+            if code >= 0:
+                out[keys[name]] = self.text[name].value(code)
+        out.update({k: v for k, v in override.items() if not k.startswith("_")})
+        return out
+
+    def transactions(self, positions: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        positions = range(len(self.ids)) if positions is None else positions
+        return [self.transaction(int(i)) for i in positions]
+
+    def rules_list(self) -> List[Dict[str, Any]]:
+        return [r.to_dict() if r.id_key else r.ruleid for r in self.rules if not r.implicit]
+
+    # --------------------------
+    # SERIALISATION
+    # --------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        """Lossless conversion back to the 'analysis_data' dict"""
+        out = dict(self.meta)
+        present = LIST_KEYS if self.present is None else self.present
+        if "rules_list" in present:
+            out["rules_list"] = self.rules_list()
+        if "transactions_list" in present:
+            out["transactions_list"] = self.transactions()
+        if "flagged_list" in present:
+            out["flagged_list"] = list(self.flagged_list)
+        return out
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), default=str, **kwargs)
+
+    def to_table(self, positions: Optional[np.ndarray] = None):
+        """Per-transaction verdicts (all, or the rows at `positions`) as a pyarrow Table"""
+        if pa is None:
+            raise ImportError("pyarrow is required for table output")
+        positions = np.arange(len(self.ids)) if positions is None else np.asarray(positions, dtype=np.int64)
+        labels = np.array([str(rule.ruleid) for rule in self.rules], dtype=object)
+        starts = self.violation_offsets[positions]
+        counts = self.violation_offsets[positions + 1] - starts
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        gather = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        codes = self.violation_codes[gather]
+        violated = pa.ListArray.from_arrays(
+            pa.array(offsets.astype(np.int32)),
+            pa.array(labels[codes] if len(codes) else [], type=pa.string()))
+        columns = {
+            "transaction_id": pa.array([None if v is None else str(v) for v in self.ids[positions]], type=pa.string()),
+            "risk_score": pa.array(self.scores[positions], from_pandas=True),
+            "flag": pa.array(self.flags[positions]),
+            "violated_rules": violated,
+        }
+        for name in TEXT_FIELDS:
+            # Only the texts these rows use are rendered
+            used, inverse = np.unique(self.text_codes[name][positions], return_inverse=True)
+            values = self.text[name].values
+            rendered = np.array([None if code < 0 else json.dumps(values[code])
+                                 if isinstance(values[code], (list, dict)) else str(values[code])
+                                 for code in used.tolist()], dtype=object)
+            columns[name] = pa.array(rendered[inverse] if len(used) else [], type=pa.string())
+        for i, segment in enumerate(self.segment_names):
+            columns[segment] = pa.array(self.segments[positions, i], from_pandas=True)
+        return pa.table(columns)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def parse_analysis(data) -> AnalysisResult:
+    """Parse model output (dict, wrapper dict or JSON text) into an AnalysisResult"""
+    if isinstance(data, str):
+        return AnalysisResult.from_json(data)
+    return AnalysisResult.from_dict(data or {})
@@ -0,0 +1,157 @@
+"""
+RULES DOCUMENT RETRIEVAL
+BM25 inverted index over paragraph/section chunks of a rules document.
+The index is queried with the transaction headers (plus field synonyms) so
+only the sections relevant to the uploaded CSV are sent to the model.
+"""
+
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List
+
+from util import estimate_tokens
+
+# Target chunk size in characters; paragraphs are merged up to this size
+CHUNK_CHARS = 1200
+K1 = 1.5
+B = 0.75
+MAX_INDEXES = 32
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "were",
+    "will", "with", "must", "should", "shall", "may", "all", "any", "each",
+}
+
+# Canonical field -> words a regulation may use for it
+FIELD_SYNONYMS = {
+    "user": ["customer", "client", "account", "holder", "beneficiary", "kyc"],
+    "transaction": ["payment", "transfer", "trade", "deal"],
+    "time": ["date", "timestamp", "day", "days", "hours", "period", "future", "older"],
+    "item": ["product", "goods", "merchandise", "sku"],
+    "description": ["text", "name", "narrative"],
+    "number": ["quantity", "count", "volume"],
+    "purchased": ["bought", "sale", "sold"],
+    "cost": ["amount", "price", "value", "threshold", "usd", "dollar"],
+    "country": ["jurisdiction", "nation", "region", "cross-border", "sanctioned", "high-risk", "fatf"],
+    "id": ["identifier", "unique", "duplicate"],
+    "code": ["identifier", "category"],
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with camelCase split and stopwords removed"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return [w for w in re.findall(r"[a-z0-9$%-]+", text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def expand_query(headers: List[str]) -> List[str]:
+    """Turn CSV headers into query terms, adding inferred field synonyms"""
+    terms = []
+    for header in headers:
+        for token in tokenize(header):
+            terms.append(token)
+            terms.extend(FIELD_SYNONYMS.get(token, []))
+    return list(dict.fromkeys(terms))
+
+
+def chunk_document(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """Split a document into paragraph/section chunks of roughly chunk_chars"""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n|\n(?=#+ |\d+(?:\.\d+)*[.)] )", text) if p.strip()]
+    chunks, current = [], ""
+    for paragraph in paragraphs:
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(". ", 0, chunk_chars)
+            cut = cut + 1 if cut > chunk_chars // 2 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one document"""
+
+    def __init__(self, text: str):
+        self.chunks = chunk_document(text)
+        self.postings: Dict[str, List[tuple]] = {}
+        self.lengths = []
+        for i, chunk in enumerate(self.chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def scores(self, terms: List[str]) -> List[float]:
+        """BM25 score of every chunk for the query terms"""
+        n = len(self.chunks)
+        scores = [0.0] * n
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, terms: List[str], token_budget: int, top_k: int = 20) -> List[str]:
+        """Top-k matching chunks that fit in the budget, in document order"""
+        scores = self.scores(terms)
+        ranked = sorted((i for i in range(len(scores)) if scores[i] > 0), key=lambda i: -scores[i])
+        picked, used = [], 0
+        for i in ranked[:top_k]:
+            cost = estimate_tokens(self.chunks[i])
+            if used + cost > token_budget:
+                continue
+            picked.append(i)
+            used += cost
+        return [self.chunks[i] for i in sorted(picked)]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(text: str) -> BM25Index:
+    """Return the index for a document's text, building it once per content"""
+    key = hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = BM25Index(text)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def relevant_sections(text: str, headers: List[str], token_budget: int, top_k: int = 20) -> str:
+    """
+    Return only the sections of a document that relate to the transaction columns
+
+    Documents that already fit in the budget are returned whole.
+    """
+    if estimate_tokens(text) <= token_budget or not headers:
+        return text
+    sections = get_index(text).search(expand_query(headers), token_budget, top_k)
+    if not sections:
+        # Nothing matched the columns; fall back to the start of the document
+        return text[:token_budget * 4]
+    return "\n\n[...]\n\n".join(sections)
@@ -0,0 +1,570 @@
+"""
+LOCAL RULE ENGINE
+Compiles the structured rule conditions produced by the model
+(e.g. "UserId >= 0 or UserId == -1") into a safe expression tree and
+evaluates them as vectorized pandas predicates over the transaction table.
+Rules that need windows, grouping or record age (structuring, uniqueness)
+are handed to the vectorized checks in analytics.py. Rules that neither
+can handle are returned separately so only those need to be sent to the LLM.
+"""
+
+import ast
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --------------------------
+# CONFIGURATION
+# --------------------------
+SEVERITY_WEIGHTS = {"critical": 60, "high": 40, "medium": 20, "low": 10}
+
+# Rule category keywords -> risk segment reported in 'risk_segments'
+SEGMENT_KEYWORDS = {
+    "credit_risk": ("credit", "loan", "ltv", "dti"),
+    "transaction_risk": ("aml", "fraud", "transaction", "sanction"),
+    "market_risk": ("market", "capital", "liquidity"),
+}
+DEFAULT_SEGMENT = "operational_risk"
+RISK_SEGMENTS = ("credit_risk", "transaction_risk", "market_risk", "operational_risk")
+
+TRANSACTION_ID_COLUMNS = ("transactionid", "transaction_id", "txnid", "txn_id", "id")
+
+_NOW_NAMES = {"current_date", "current_timestamp", "today", "now", "current_time"}
+_FUNCTIONS = {"days", "hours", "abs", "isnull", "notnull", "len", "lower", "upper"}
+
+
+class RuleCompileError(ValueError):
+    """Raised when a rule condition falls outside the supported grammar"""
+
+
+@dataclass
+class CompiledRule:
+    rule: Dict[str, Any]
+    ruleid: str
+    tree: ast.AST
+    columns: List[str] = field(default_factory=list)
+    mode: str = "assert"  # 'assert': violation when False, 'flag': violation when True
+    weight: float = 0.0
+    segment: str = DEFAULT_SEGMENT
+    analytic: Any = None  # analytics check used instead of the tree (see analytics.plan_analytic)
+
+
+# --------------------------
+# RULE HELPERS
+# --------------------------
+def rule_id(rule):
+    """Return the id of a rule regardless of the key spelling used by the model"""
+    return str(rule.get("ruleid") or rule.get("rule_id") or rule.get("id") or "")
+
+
+def rule_weight(rule):
+    """Risk points contributed by a violation of this rule"""
+    weight = rule.get("risk_weight")
+    if isinstance(weight, (int, float)) and not isinstance(weight, bool):
+        return float(weight)
+    return float(SEVERITY_WEIGHTS.get(str(rule.get("severity", "")).strip().lower(), 20))
+
+
+def rule_segment(rule):
+    """Map a rule category onto one of the dashboard risk segments"""
+    text = f"{rule.get('category', '')} {rule.get('ruleid') or rule.get('rule_id') or ''}".lower()
+    for segment, keywords in SEGMENT_KEYWORDS.items():
+        if any(word in text for word in keywords):
+            return segment
+    return DEFAULT_SEGMENT
+
+
+def rule_mode(rule):
+    """
+    Whether the condition describes a valid row ('assert') or a row to flag ('flag')
+
+    Taken from the rule's condition_type only; returns None when it is
+    missing, since the wording of a description is no reliable guide.
+    """
+    explicit = str(rule.get("condition_type") or "").strip().lower()
+    return explicit if explicit in ("assert", "flag") else None
+
+
+def dashboard_rule(rule):
+    """Normalize a rule dict to the 'rules_list' shape the dashboard reads"""
+    out = dict(rule)
+    out["ruleid"] = rule_id(rule)
+    out.setdefault("description", "")
+    out.setdefault("origin", "")
+    out.setdefault("severity", "Medium")
+    out.setdefault("remarks", rule.get("action") or rule.get("recommended_action") or "")
+    out.pop("rule_id", None)
+    return out
+
+
+def parse_rules(content):
+    """Pull the structured rule list out of a generate_rules() response"""
+    if isinstance(content, list):
+        return [r for r in content if isinstance(r, dict)]
+    rules = []
+    for block in re.findall(r"```json\s*(.*?)```", content or "", re.S):
+        try:
+            data = json.loads(block)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            data = data.get("rules_list") or data.get("rules") or data.get("validated_rules") or [data]
+        rules.extend(r for r in data if isinstance(r, dict) and r.get("condition"))
+    return rules
+
+
+# --------------------------
+# COMPILATION
+# --------------------------
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_PLACEHOLDER = re.compile(r"_STR(\d+)_")
+
+
+def _normalize(condition):
+    """
+    Rewrite SQL-ish condition text into Python expression syntax
+
+    Quoted literals are set aside first, so the rewrites only touch the
+    expression around them ('A=B' or '5 days' stay as written).
+    """
+    literals = []
+
+    def protect(match):
+        literals.append(match.group(0))
+        return f"_STR{len(literals) - 1}_"
+
+    text = _STRING.sub(protect, condition.strip())
+    text = re.sub(r"(\w+)\s+between\s+(\S+)\s+and\s+(\S+)", r"(\1 >= \2 and \1 <= \3)", text, flags=re.I)
+    text = re.sub(r"(\w+)\s+is\s+not\s+null\b", r"notnull(\1)", text, flags=re.I)
+    text = re.sub(r"(\w+)\s+is\s+null\b", r"isnull(\1)", text, flags=re.I)
+    text = re.sub(r"\b(and|or|not|in)\b", lambda m: m.group(1).lower(), text, flags=re.I)
+    text = re.sub(r"\b(\d+(?:\.\d+)?)\s*days?\b", r"days(\1)", text, flags=re.I)
+    text = re.sub(r"\b(\d+(?:\.\d+)?)\s*hours?\b", r"hours(\1)", text, flags=re.I)
+    text = text.replace("<>", "!=").replace("&&", " and ").replace("||", " or ")
+    text = re.sub(r"(?<![<>=!])=(?!=)", "==", text)
+    return _PLACEHOLDER.sub(lambda m: literals[int(m.group(1))], text)
+
+
+def _resolve_column(name, columns):
+    if columns is None:
+        return name
+    lookup = {c.lower(): c for c in columns}
+    return lookup.get(name.lower())
+
+
+def _validate(node, columns, used):
+    """Walk the parsed tree and reject anything outside the whitelist"""
+    if isinstance(node, ast.Expression):
+        return _validate(node.body, columns, used)
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _validate(value, columns, used)
+    elif isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, (ast.Not, ast.USub, ast.UAdd)):
+            raise RuleCompileError("unsupported unary operator")
+        _validate(node.operand, columns, used)
+    elif isinstance(node, ast.BinOp):
+        if not isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.FloorDiv)):
+            raise RuleCompileError("unsupported arithmetic operator")
+        _validate(node.left, columns, used)
+        _validate(node.right, columns, used)
+    elif isinstance(node, ast.Compare):
+        allowed = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.In, ast.NotIn)
+        if not all(isinstance(op, allowed) for op in node.ops):
+            raise RuleCompileError("unsupported comparison")
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)) and not isinstance(comparator, (ast.List, ast.Tuple, ast.Set)):
+                raise RuleCompileError("'in' needs a literal list")
+        _validate(node.left, columns, used)
+        for comparator in node.comparators:
+            _validate(comparator, columns, used)
+    elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        for element in node.elts:
+            if not isinstance(element, ast.Constant):
+                raise RuleCompileError("list elements must be literals")
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id.lower() not in _FUNCTIONS or node.keywords:
+            raise RuleCompileError("unsupported function call")
+        if len(node.args) != 1:
+            raise RuleCompileError("functions take exactly one argument")
+        _validate(node.args[0], columns, used)
+    elif isinstance(node, ast.Name):
+        if node.id.lower() in _NOW_NAMES:
+            return
+        column = _resolve_column(node.id, columns)
+        if column is None:
+            raise RuleCompileError(f"unknown column '{node.id}'")
+        node.id = column
+        if column not in used:
+            used.append(column)
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float, str, bool)):
+            raise RuleCompileError("unsupported literal")
+    else:
+        raise RuleCompileError(f"unsupported syntax: {type(node).__name__}")
+
+
+def compile_condition(condition, columns=None):
+    """Compile one condition string into a validated expression tree"""
+    if not isinstance(condition, str) or not condition.strip():
+        raise RuleCompileError("empty condition")
+    try:
+        tree = ast.parse(_normalize(condition), mode="eval")
+    except SyntaxError as e:
+        raise RuleCompileError(f"cannot parse condition: {e.msg}")
+    used = []
+    _validate(tree, columns, used)
+    return tree, used
+
+
+def compile_rules(rules_list, columns=None) -> Tuple[List[CompiledRule], List[Dict[str, Any]]]:
+    """
+    Compile every rule that has a supported condition
+
+    Args:
+        rules_list: Structured rules (dicts with 'condition', 'severity', ...)
+        columns: Transaction column names used to resolve identifiers
+
+    Returns:
+        tuple: (compiled rules, rules that must still go to the LLM)
+    """
+    from analytics import plan_analytic
+
+    compiled, unsupported = [], []
+    for rule in rules_list:
+        try:
+            tree, used = compile_condition(rule.get("condition"), columns)
+            mode = rule_mode(rule)
+            # Without a condition_type the condition could mean either
+            reason = None if mode else "no condition_type ('assert' or 'flag')"
+        except RuleCompileError as e:
+            tree, reason = None, str(e)
+        if reason is None:
+            compiled.append(CompiledRule(
+                rule=rule,
+                ruleid=rule_id(rule),
+                tree=tree,
+                columns=used,
+                mode=mode,
+                weight=rule_weight(rule),
+                segment=rule_segment(rule),
+            ))
+            continue
+        # Window, uniqueness and age rules can still be checked locally
+        analytic = plan_analytic(rule, columns)
+        if analytic is None:
+            unsupported.append(dict(rule, unsupported_reason=reason))
+            continue
+        compiled.append(CompiledRule(
+            rule=rule,
+            ruleid=rule_id(rule),
+            tree=None,
+            columns=list(analytic.columns),
+            mode="flag",  # checks return the violating rows
+            weight=rule_weight(rule),
+            segment=rule_segment(rule),
+            analytic=analytic,
+        ))
+    return compiled, unsupported
+
+
+# --------------------------
+# VECTORIZED EVALUATION
+# --------------------------
+def parse_datetimes(series):
+    """Parse timestamps such as 'Mon Sep 10 11:58:00 IST 2018' into datetime64"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    # Timestamps repeat heavily, so only the distinct values are parsed
+    codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques).astype("string").str.strip()
+    stripped = text.str.replace(r"\s[A-Z]{2,5}\s(\d{4})$", r" \1", regex=True)
+    parsed = pd.to_datetime(stripped, format="%a %b %d %H:%M:%S %Y", errors="coerce")
+    if parsed.isna().mean() > 0.5:
+        parsed = pd.to_datetime(text, errors="coerce", format="mixed")
+    # Missing values (code -1) pick the NaT appended at the end
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT"))[codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+class _Evaluator:
+    """Evaluate a validated expression tree against a DataFrame"""
+
+    def __init__(self, df, now):
+        self.df = df
+        self.now = now
+        self._dates = {}
+
+    def column(self, name):
+        return self.df[name]
+
+    def dates(self, name):
+        if name not in self._dates:
+            self._dates[name] = parse_datetimes(self.df[name])
+        return self._dates[name]
+
+    def _is_temporal(self, value):
+        if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+            return True
+        return isinstance(value, pd.Series) and (
+            pd.api.types.is_datetime64_any_dtype(value) or pd.api.types.is_timedelta64_dtype(value))
+
+    def _coerce(self, node, value, other):
+        # Text columns compared against dates are parsed on demand
+        if (isinstance(node, ast.Name) and isinstance(value, pd.Series)
+                and not self._is_temporal(value) and self._is_temporal(other)):
+            return self.dates(node.id)
+        if isinstance(value, str) and self._is_temporal(other):
+            return pd.to_datetime(value, errors="coerce")
+        return value
+
+    def eval(self, node):
+        method = getattr(self, f"_eval_{type(node).__name__}")
+        return method(node)
+
+    def _eval_Expression(self, node):
+        return self.eval(node.body)
+
+    def _eval_Name(self, node):
+        if node.id.lower() in _NOW_NAMES:
+            return self.now
+        return self.column(node.id)
+
+    def _eval_Constant(self, node):
+        return node.value
+
+    def _eval_BoolOp(self, node):
+        values = [_as_mask(self.eval(v), len(self.df)) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = (result & value) if isinstance(node.op, ast.And) else (result | value)
+        return result
+
+    def _eval_UnaryOp(self, node):
+        value = self.eval(node.operand)
+        if isinstance(node.op, ast.Not):
+            return ~_as_mask(value, len(self.df))
+        return -value if isinstance(node.op, ast.USub) else value
+
+    def _eval_BinOp(self, node):
+        left, right = self.eval(node.left), self.eval(node.right)
+        left = self._coerce(node.left, left, right)
+        right = self._coerce(node.right, right, left)
+        op = node.op
+        if isinstance(op, ast.Add):
+            return left + right
+        if isinstance(op, ast.Sub):
+            return left - right
+        if isinstance(op, ast.Mult):
+            return left * right
+        if isinstance(op, ast.Div):
+            return left / right
+        if isinstance(op, ast.FloorDiv):
+            return left // right
+        return left % right
+
+    def _eval_Compare(self, node):
+        result = None
+        left_node, left = node.left, self.eval(node.left)
+        for op, right_node in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                values = [e.value for e in right_node.elts]
+                series = left if isinstance(left, pd.Series) else pd.Series([left] * len(self.df), index=self.df.index)
+                part = series.isin(values)
+                if isinstance(op, ast.NotIn):
+                    part = ~part
+                right = None
+            else:
+                right = self.eval(right_node)
+                lhs = self._coerce(left_node, left, right)
+                rhs = self._coerce(right_node, right, lhs)
+                part = _compare(op, lhs, rhs)
+            part = _as_mask(part, len(self.df), self.df.index)
+            result = part if result is None else (result & part)
+            left_node, left = right_node, right
+        return result
+
+    def _eval_Call(self, node):
+        name = node.func.id.lower()
+        arg = self.eval(node.args[0])
+        if name == "days":
+            return pd.Timedelta(days=float(arg))
+        if name == "hours":
+            return pd.Timedelta(hours=float(arg))
+        if name == "abs":
+            return abs(arg)
+        if name == "isnull":
+            return pd.isna(arg) if not isinstance(arg, pd.Series) else arg.isna()
+        if name == "notnull":
+            return pd.notna(arg) if not isinstance(arg, pd.Series) else arg.notna()
+        if name == "len":
+            return arg.astype("string").str.len() if isinstance(arg, pd.Series) else len(str(arg))
+        text = arg.astype("string") if isinstance(arg, pd.Series) else str(arg)
+        if name == "lower":
+            return text.str.lower() if isinstance(arg, pd.Series) else text.lower()
+        return text.str.upper() if isinstance(arg, pd.Series) else text.upper()
+
+
+def _compare(op, left, right):
+    if isinstance(op, ast.Lt):
+        return left < right
+    if isinstance(op, ast.LtE):
+        return left <= right
+    if isinstance(op, ast.Gt):
+        return left > right
+    if isinstance(op, ast.GtE):
+        return left >= right
+    if isinstance(op, ast.Eq):
+        return left == right
+    return left != right
+
+
+def _as_mask(value, length, index=None):
+    """Turn a predicate result into a boolean Series where NA counts as False"""
+    if isinstance(value, pd.Series):
+        return value.fillna(False).astype(bool)
+    return pd.Series(np.full(length, bool(value)), index=index)
+
+
+def evaluate_condition(df, tree, now=None):
+    """Return a boolean Series telling for which rows the condition holds"""
+    now = now if now is not None else pd.Timestamp.now()
+    return _as_mask(_Evaluator(df, now).eval(tree), len(df), df.index)
+
+
+def find_transaction_id_column(columns):
+    """Pick the column that identifies a transaction, if there is one"""
+    lookup = {c.lower(): c for c in columns}
+    for candidate in TRANSACTION_ID_COLUMNS:
+        if candidate in lookup:
+            return lookup[candidate]
+    return None
+
+
+def violation_matrix(df, compiled, now=None):
+    """
+    Evaluate compiled rules over every row
+
+    Returns:
+        tuple: (bool ndarray of shape rows x rules, rules that failed at runtime)
+    """
+    now = now if now is not None else pd.Timestamp.now()
+    evaluator = _Evaluator(df, now)
+    columns, failed = [], []
+    for rule in compiled:
+        try:
+            if rule.analytic is not None:
+                holds = np.asarray(rule.analytic.violations(evaluator), dtype=bool)
+            else:
+                holds = _as_mask(evaluator.eval(rule.tree), len(df), df.index).to_numpy()
+        except Exception as e:
+            failed.append(dict(rule.rule, unsupported_reason=f"evaluation failed: {e}"))
+            continue
+        columns.append((rule, ~holds if rule.mode == "assert" else holds))
+    kept = [rule for rule, _ in columns]
+    matrix = np.column_stack([v for _, v in columns]) if columns else np.zeros((len(df), 0), dtype=bool)
+    return matrix, kept, failed
+
+
+def build_analysis(ids, matrix, rules):
+    """Convert a per-transaction violation matrix into the 'analysis_data' shape"""
+    weights = np.array([r.weight for r in rules], dtype=float)
+    scores = np.clip(matrix.astype(float) @ weights, 0, 100) if rules else np.zeros(len(ids))
+    segment_scores = {}
+    for segment in RISK_SEGMENTS:
+        idx = [i for i, r in enumerate(rules) if r.segment == segment]
+        values = (np.clip(matrix[:, idx].astype(float) @ weights[idx], 0, 100)
+                  if idx else np.zeros(len(ids)))
+        segment_scores[segment] = np.rint(values).astype(int).tolist()
+    scores = np.rint(scores).astype(int).tolist()
+    flags = matrix.any(axis=1).tolist() if rules else [False] * len(ids)
+
+    # Explanations only depend on which rules fired, so build them per pattern
+    patterns = {}
+
+    def describe(row):
+        key = row.tobytes()
+        if key not in patterns:
+            hit = [rules[j] for j in np.flatnonzero(row)]
+            patterns[key] = (
+                [r.ruleid for r in hit],
+                "; ".join(f"{r.ruleid}: {r.rule.get('description') or r.rule.get('condition')}" for r in hit),
+                [str(r.rule.get("action") or r.rule.get("recommended_action") or "Manual review") for r in hit],
+            )
+        return patterns[key]
+
+    clean = {
+        "voilated_rules_list": [],
+        "flag": False,
+        "risk_score": 0,
+        "explanation": "No rules violated.",
+        "remediation": "None",
+        "remarks": "Checked locally.",
+        "sugggestions": "",
+    }
+    zero_segments = {s: 0 for s in RISK_SEGMENTS}
+    transactions_list, flagged_list = [], []
+    for i, tx_id in enumerate(ids):
+        if not flags[i]:
+            transactions_list.append({"transaction_id": tx_id, **clean, "risk_segments": zero_segments.copy()})
+            continue
+        violated, explanation, remediation = describe(matrix[i])
+        flagged_list.append(tx_id)
+        transactions_list.append({
+            "transaction_id": tx_id,
+            "voilated_rules_list": list(violated),
+            "flag": True,
+            "risk_score": scores[i],
+            "explanation": explanation,
+            "remediation": list(remediation),
+            "remarks": "Checked locally.",
+            "risk_segments": {s: segment_scores[s][i] for s in RISK_SEGMENTS},
+            "sugggestions": "Review the violated rules listed above.",
+        })
+    return transactions_list, flagged_list
+
+
+def evaluate_rules(df: pd.DataFrame, rules_list, now=None) -> Dict[str, Any]:
+    """
+    Check structured rules against every transaction locally
+
+    Args:
+        df: Parsed transaction table
+        rules_list: Structured rules, or CompiledRule objects from compile_rules()
+        now: Reference time for 'current_date' (defaults to now)
+
+    Returns:
+        dict: 'analysis_data' with rules_list, transactions_list, flagged_list
+              and 'unsupported_rules' that still need the LLM
+    """
+    if rules_list and isinstance(rules_list[0], CompiledRule):
+        compiled, unsupported = list(rules_list), []
+    else:
+        compiled, unsupported = compile_rules(rules_list, list(df.columns))
+    matrix, kept, failed = violation_matrix(df, compiled, now)
+    unsupported.extend(failed)
+
+    id_column = find_transaction_id_column(df.columns)
+    if id_column is not None and len(df):
+        # A transaction spans several item rows; it violates a rule if any row does
+        keys = df[id_column].astype(str)
+        grouped = pd.DataFrame(matrix, index=keys.to_numpy()).groupby(level=0, sort=False).any()
+        ids = grouped.index.tolist()
+        matrix = grouped.to_numpy(dtype=bool)
+    else:
+        ids = [str(i) for i in range(len(df))]
+
+    transactions_list, flagged_list = build_analysis(ids, matrix, kept)
+    return {
+        "rules_list": [dashboard_rule(r.rule) for r in kept],
+        "transactions_list": transactions_list,
+        "flagged_list": flagged_list,
+        "risk_scoring_definition": (
+            "Risk score is the sum of the weights of the violated rules "
+            "(High=40, Medium=20, Low=10 unless the rule sets 'risk_weight'), capped at 100."),
+        "unsupported_rules": [dashboard_rule(r) for r in unsupported],
+    }
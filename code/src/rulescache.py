@@ -0,0 +1,139 @@
+"""
+GENERATED RULES CACHE
+Content-addressed on-disk cache for generate_rules() results. Entries are
+keyed by a hash of the document bytes, the rules prompt, the model name and
+the temperature, and are evicted by age and by total size (least recently
+used first).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from llmclient import get_setting
+from metrics import count
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "rules")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # seconds
+
+
+def cache_key(document: bytes, prompt: str, model: str, temperature: float) -> str:
+    """Hash everything that determines the generated rules"""
+    digest = hashlib.sha256()
+    for part in (document, prompt.encode("utf-8"), str(model).encode("utf-8"),
+                 repr(float(temperature)).encode("utf-8")):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class RulesCache:
+    """Persistent result store with size- and age-based eviction"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.max_age = float(max_age)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a key, or None"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            count("cache_misses_total", cache="rules")
+            return None
+        with self.lock:
+            self.hits += 1
+        count("cache_hits_total", cache="rules")
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a result atomically and evict old entries if over budget"""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            with self.lock:
+                self.evictions += 1
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones above max_bytes"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus on-disk usage"""
+        files = [f for f in os.listdir(self.directory) if f.endswith(".json")]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(files),
+            "bytes": sum(os.path.getsize(os.path.join(self.directory, f)) for f in files),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_rules_cache() -> RulesCache:
+    """Return the process-wide rules cache configured from settings"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RulesCache(
+                directory=get_setting("RULES_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_bytes=get_setting("RULES_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                max_age=get_setting("RULES_CACHE_MAX_AGE", DEFAULT_MAX_AGE),
+            )
+        return _cache
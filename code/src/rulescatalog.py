@@ -0,0 +1,193 @@
+"""
+RULES CATALOG
+Persistent SQLite catalog of the structured rules extracted from each rules
+document version (the hash of the document bytes). Rules are stored once
+with their id, description, condition, severity, category, origin and the
+columns they reference, indexed by category, severity and column, so an
+analysis pulls only the rules that concern its transaction columns instead
+of sending whole documents for the model to re-read.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from llmclient import get_setting
+from metrics import count
+from ruleengine import RuleCompileError, compile_condition, rule_id, rule_segment
+
+DEFAULT_CATALOG_PATH = os.path.join(".cache", "catalog", "rules.sqlite")
+DEFAULT_MAX_AGE = 180 * 24 * 3600  # seconds since a document version was last used
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    version TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    rules INTEGER NOT NULL,
+    added REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL,
+    ruleid TEXT NOT NULL,
+    description TEXT,
+    condition TEXT,
+    severity TEXT,
+    category TEXT,
+    origin TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_version ON rules (version);
+CREATE INDEX IF NOT EXISTS rules_category ON rules (category, version);
+CREATE INDEX IF NOT EXISTS rules_severity ON rules (severity, version);
+CREATE TABLE IF NOT EXISTS rule_columns (
+    column_name TEXT NOT NULL,
+    rule INTEGER NOT NULL,
+    PRIMARY KEY (column_name, rule)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rule_columns_rule ON rule_columns (rule);
+"""
+
+
+def referenced_columns(rule: Dict[str, Any]) -> List[str]:
+    """
+    Column names a rule refers to, lowercased
+
+    Taken from the compiled condition, plus any analytic key/time and an
+    explicit 'columns' list. A free-text condition names no columns, so the
+    rule is kept for every table.
+    """
+    try:
+        _, names = compile_condition(rule.get("condition"))
+    except RuleCompileError:
+        names = []
+    spec = rule.get("analytic") if isinstance(rule.get("analytic"), dict) else {}
+    names += [spec[k] for k in ("key", "time") if spec.get(k)]
+    if isinstance(rule.get("columns"), list):
+        names += [str(c) for c in rule["columns"]]
+    return list(dict.fromkeys(str(n).lower() for n in names))
+
+
+class RulesCatalog:
+    """SQLite-backed store of structured rules per document version"""
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = float(max_age)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+        self.prune()
+
+    def has(self, version: str) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM documents WHERE version = ?", (version,)).fetchone() is not None
+
+    def add(self, version: str, name: str, rules: List[Dict[str, Any]]):
+        """Store the rules extracted from one document version, replacing earlier ones"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("DELETE FROM rule_columns WHERE rule IN (SELECT id FROM rules WHERE version = ?)",
+                            (version,))
+            self.db.execute("DELETE FROM rules WHERE version = ?", (version,))
+            for rule in rules:
+                cursor = self.db.execute(
+                    "INSERT INTO rules (version, ruleid, description, condition, severity, category, origin, body) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (version, rule_id(rule), str(rule.get("description") or ""), str(rule.get("condition") or ""),
+                     str(rule.get("severity") or "").strip().lower(),
+                     str(rule.get("category") or rule_segment(rule)).strip().lower(),
+                     str(rule.get("origin") or ""), json.dumps(rule, default=str)))
+                self.db.executemany("INSERT OR IGNORE INTO rule_columns (column_name, rule) VALUES (?, ?)",
+                                    [(column, cursor.lastrowid) for column in referenced_columns(rule)])
+            self.db.execute("INSERT OR REPLACE INTO documents (version, name, rules, added, used) "
+                            "VALUES (?, ?, ?, ?, ?)", (version, name, len(rules), now, now))
+            self.db.commit()
+
+    def rules(self, version: str, columns: Optional[Iterable[str]] = None,
+              categories: Optional[Iterable[str]] = None,
+              severities: Optional[Iterable[str]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Rules of a document version, optionally narrowed down
+
+        With columns, only rules that reference one of them (or no column
+        at all) are returned; if none of the document's rules names any of
+        the columns, they all are, since the document may call the fields
+        something else. Returns None when the version is not catalogued or
+        has no rules.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT rules FROM documents WHERE version = ?", (version,)).fetchone()
+            if not row or not row[0]:
+                count("cache_misses_total", cache="catalog")
+                return None
+            self.db.execute("UPDATE documents SET used = ? WHERE version = ?", (time.time(), version))
+            self.db.commit()
+
+            where, params = ["version = ?"], [version]
+            for field, values in (("category", categories), ("severity", severities)):
+                values = [str(v).strip().lower() for v in values or []]
+                if values:
+                    where.append(f"{field} IN ({','.join('?' * len(values))})")
+                    params += values
+            found = self.db.execute(f"SELECT id, body FROM rules WHERE {' AND '.join(where)} ORDER BY id",
+                                    params).fetchall()
+
+            names = [str(c).lower() for c in columns or []]
+            if names:
+                join = "SELECT DISTINCT c.rule FROM rule_columns c JOIN rules r ON r.id = c.rule WHERE r.version = ?"
+                named = {rule for (rule,) in self.db.execute(
+                    f"{join} AND c.column_name IN ({','.join('?' * len(names))})", [version] + names)}
+                described = {rule for (rule,) in self.db.execute(join, (version,))}
+                if any(rule in named for rule, _ in found):
+                    found = [(rule, body) for rule, body in found if rule in named or rule not in described]
+        count("cache_hits_total", cache="catalog")
+        return [json.loads(body) for _, body in found]
+
+    def versions(self, name: str) -> List[Dict[str, Any]]:
+        """Catalogued versions of a document name, newest first"""
+        with self.lock:
+            rows = self.db.execute("SELECT version, rules, added FROM documents WHERE name = ? ORDER BY added DESC",
+                                   (name,)).fetchall()
+        return [{"version": version, "rules": rules, "added": added} for version, rules, added in rows]
+
+    def prune(self):
+        """Drop document versions not used within max_age, with their rules"""
+        cutoff = time.time() - self.max_age
+        with self.lock:
+            self.db.execute("DELETE FROM rule_columns WHERE rule IN (SELECT id FROM rules WHERE version IN "
+                            "(SELECT version FROM documents WHERE used < ?))", (cutoff,))
+            self.db.execute("DELETE FROM rules WHERE version IN (SELECT version FROM documents WHERE used < ?)",
+                            (cutoff,))
+            self.db.execute("DELETE FROM documents WHERE used < ?", (cutoff,))
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            documents = self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            rules = self.db.execute("SELECT COUNT(*) FROM rules").fetchone()[0]
+        return {"documents": documents, "rules": rules}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_rules_catalog() -> RulesCatalog:
+    """Return the process-wide catalog configured from settings"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RulesCatalog(
+                get_setting("RULES_CATALOG_PATH", DEFAULT_CATALOG_PATH),
+                max_age=get_setting("RULES_CATALOG_MAX_AGE", DEFAULT_MAX_AGE),
+            )
+        return _catalog
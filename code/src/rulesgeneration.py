@@ -5,11 +5,23 @@ from io import BytesIO
 import pandas as pd
 import time
 import json
+import logging
 import os
 import requests
 import random
 from util  import *
+from llmclient import chat_completion, get_setting
+from rulescache import cache_key, get_rules_cache
+from rulescatalog import get_rules_catalog
+from ruleengine import parse_rules
+from extraction import file_hash
+from metrics import trace
 
+logger = logging.getLogger(__name__)
+
+TEMPERATURE = 0.7
+
+@trace("rules")
 def generate_rules(file):
     """Send file to DeepSeek API with prompt from rules_prompt.txt"""
     # Read the prompt template
@@ -20,20 +32,27 @@ def generate_rules(file):
         prompt = "Please analyze this document and extract all relevant rules and regulations."
         st.warning("Using default prompt (rules_prompt.txt not found)")
 
+    # Serve repeated documents from the cache before doing any work
+    file.seek(0)
+    document = file.read()
+    file.seek(0)
+    cache = get_rules_cache()
+    key = cache_key(document, prompt, get_setting('MODEL'), TEMPERATURE)
+    cached = cache.get(key)
+    if cached:
+        catalog_rules(document, file.name, cached)
+        return dict(cached, filename=file.name, cached=True)
+
     # Extract text from file
     file_content = extract_text(file)
     if not file_content:
+        logger.error("Failed to extract text from %s", file.name)
         st.error(f"Failed to extract text from {file.name}")
         return None
 
     # Prepare API request using secrets
-    headers = {
-        "Authorization": f"Bearer {st.secrets['API_KEY']}",
-        "Content-Type": "application/json"
-    }
-
     payload = {
-        "model": st.secrets['MODEL'],
+        "model": get_setting('MODEL'),
         "messages": [
             {
                 "role": "user",
@@ -42,34 +61,40 @@ def generate_rules(file):
                 "file_content": file_content
             }
         ],
-        "temperature": 0.7,
+        "temperature": TEMPERATURE,
         "max_tokens": 8000
     }
 
     try:
         with st.spinner(f"Sending {file.name} to API..."):
-            response = requests.post(
-                st.secrets['API_URL'],
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            print(response.json())
-            return {
+            result = chat_completion(payload)
+            print(result)
+            generated = {
                 "filename": file.name,
                 "content": result['choices'][0]['message']['content'],
                 "usage": result['usage'],
                 "status": "success"
             }
+            cache.put(key, generated)
+            catalog_rules(document, file.name, generated)
+            return generated
             
     except requests.exceptions.RequestException as e:
+        logger.exception("API request failed for %s: %s", file.name, e)
         st.error(f"API request failed: {str(e)}")
         if hasattr(e, 'response') and e.response:
             st.error(f"API response: {e.response.text}")
         return None
     except Exception as e:
+        logger.exception("Error processing %s: %s", file.name, e)
         st.error(f"Error processing {file.name}: {str(e)}")
         return None
+
+
+def catalog_rules(document, filename, generated):
+    """Record the structured rules of a generated result in the rules catalog"""
+    catalog = get_rules_catalog()
+    version = file_hash(document)
+    if not catalog.has(version):
+        catalog.add(version, filename, parse_rules(generated.get('content')))
+    return version
@@ -0,0 +1,293 @@
+"""
+SCHEMA INFERENCE
+Works out the layout of a transaction CSV from a bounded sample of its
+bytes: delimiter, whether the first row is a header, the type of every
+column (including timestamps like 'Mon Sep 10 11:58:00 IST 2018') and the
+canonical field each column most likely holds, with a confidence score.
+The compact schema goes into the prompt so the model does not have to
+rediscover headers and types from the raw rows.
+"""
+
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ruleengine import parse_datetimes
+
+# Bytes read from the start of a file, and rows typed per column
+SAMPLE_BYTES = 256 * 1024
+SAMPLE_ROWS = 2000
+DELIMITERS = (",", ";", "\t", "|")
+# Share of non-empty sample values that must parse for a column to get a type
+TYPE_THRESHOLD = 0.95
+# Mappings below this confidence are shown to the model as guesses
+CONFIDENT = 0.6
+
+# Canonical field -> normalized column names that mean it (most specific first)
+SYNONYMS = {
+    "transaction_id": ("transactionid", "txnid", "txnref", "txnno", "transid", "tranid", "transactionref",
+                       "referenceno", "refno", "invoiceno", "invoice", "reference", "txn"),
+    "user_id": ("userid", "customerid", "custid", "clientid", "memberid", "customerno", "custno", "customer",
+                "client", "user", "cust"),
+    "account_id": ("accountid", "accountno", "accountnumber", "acctno", "acctid", "iban", "account"),
+    "timestamp": ("transactiontime", "transactiondate", "timestamp", "datetime", "txndate", "txntime",
+                  "postingdate", "valuedate", "invoicedate", "date", "time"),
+    "amount": ("transactionamount", "txnamount", "amount", "amt", "total", "value"),
+    "quantity": ("numberofitemspurchased", "quantity", "qty", "itemcount", "units"),
+    "unit_price": ("costperitem", "unitprice", "itemprice", "price", "unitcost", "cost", "rate"),
+    "item_code": ("itemcode", "stockcode", "productcode", "productid", "itemid", "sku"),
+    "description": ("itemdescription", "productname", "description", "narrative", "details", "memo", "desc"),
+    "country": ("countrycode", "country", "nation", "region", "location"),
+    "currency": ("currencycode", "currency", "ccy"),
+    "balance": ("accountbalance", "availablebalance", "closingbalance", "balance"),
+}
+# Column types each canonical field is expected to have
+EXPECTED_TYPES = {
+    "transaction_id": ("integer", "string"),
+    "user_id": ("integer", "string"),
+    "account_id": ("integer", "string"),
+    "timestamp": ("datetime",),
+    "amount": ("float", "integer"),
+    "quantity": ("integer", "float"),
+    "unit_price": ("float", "integer"),
+    "item_code": ("integer", "string"),
+    "description": ("string",),
+    "country": ("string",),
+    "currency": ("string",),
+    "balance": ("float", "integer"),
+}
+
+_INTEGER = re.compile(r"^[+-]?\d+$")
+_FLOAT = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+_BOOLEAN = {"true", "false", "yes", "no", "y", "n"}
+_DATETIME_FORMATS = (
+    (re.compile(r"^[A-Z][a-z]{2} [A-Z][a-z]{2} \d{1,2} \d{2}:\d{2}:\d{2} [A-Z]{2,5} \d{4}$"), "%a %b %d %H:%M:%S %Z %Y"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?"), "%Y-%m-%d %H:%M:%S"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "%Y-%m-%d"),
+    (re.compile(r"^\d{1,2}/\d{1,2}/\d{4}"), "%m/%d/%Y"),
+)
+
+
+@dataclass
+class ColumnSchema:
+    name: str
+    dtype: str                      # integer, float, boolean, datetime or string
+    canonical: Optional[str] = None
+    confidence: float = 0.0
+    nulls: int = 0                  # empty values in the sample
+    invalid: int = 0                # non-empty values that do not fit dtype
+    format: Optional[str] = None    # strftime pattern of datetime columns
+    example: str = ""
+
+
+@dataclass
+class Schema:
+    delimiter: str = ","
+    has_header: bool = True
+    sample_rows: int = 0
+    columns: List[ColumnSchema] = field(default_factory=list)
+
+    @property
+    def names(self) -> List[str]:
+        return [c.name for c in self.columns]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "delimiter": self.delimiter,
+            "has_header": self.has_header,
+            "sample_rows": self.sample_rows,
+            "columns": [vars(c).copy() for c in self.columns],
+        }
+
+    def to_prompt(self, columns: Optional[List[str]] = None) -> str:
+        """One line per column: name, type and canonical field with confidence"""
+        lines = []
+        for column in self.columns:
+            if columns is not None and column.name not in columns:
+                continue
+            kind = f"{column.dtype} ({column.format})" if column.format else column.dtype
+            if column.canonical:
+                guess = "" if column.confidence >= CONFIDENT else " guess"
+                kind += f" -> {column.canonical} {column.confidence:.2f}{guess}"
+            lines.append(f"{column.name}: {kind}")
+        return "SCHEMA (inferred locally: name: type -> canonical field confidence):\n" + "\n".join(lines)
+
+
+# --------------------------
+# LAYOUT
+# --------------------------
+def _sample_text(content: bytes, sample_bytes: int) -> str:
+    """Decoded start of the file, cut back to the last complete line"""
+    sample = content[:sample_bytes]
+    if len(content) > sample_bytes and b"\n" in sample:
+        sample = sample[:sample.rfind(b"\n")]
+    return sample.decode("utf-8", errors="replace").lstrip("\ufeff")
+
+
+def sniff_delimiter(text: str) -> str:
+    """Delimiter that splits the sample lines into the most consistent field count"""
+    lines = text.splitlines()[:200]
+    best, best_score = ",", (0.0, 0)
+    for delimiter in DELIMITERS:
+        counts = pd.Series([len(row) for row in csv.reader(lines, delimiter=delimiter) if row])
+        if counts.empty:
+            continue
+        fields = int(counts.mode().iloc[0])
+        if fields < 2:
+            continue
+        score = (float((counts == fields).mean()), fields)
+        if score > best_score:
+            best, best_score = delimiter, score
+    return best
+
+
+def _value_type(value: str) -> str:
+    if _INTEGER.match(value):
+        return "integer"
+    if _FLOAT.match(value):
+        return "float"
+    if any(pattern.match(value) for pattern, _ in _DATETIME_FORMATS):
+        return "datetime"
+    return "string"
+
+
+def _has_header(rows: List[List[str]], types: List[str]) -> bool:
+    """A first row of distinct text cells above typed (or differently valued) columns"""
+    first = rows[0]
+    if any(not cell.strip() or _value_type(cell.strip()) != "string" for cell in first):
+        return False
+    if len(set(first)) < len(first):
+        return False
+    if any(kind != "string" for kind in types):
+        return True
+    if any(_normalize(cell) in _SYNONYM_INDEX for cell in first):
+        return True
+    body = rows[1:]
+    return not any(first[i] in {row[i] for row in body if i < len(row)} for i in range(len(first)))
+
+
+# --------------------------
+# COLUMN TYPES
+# --------------------------
+def column_type(values: pd.Series) -> Tuple[str, int, int, Optional[str]]:
+    """
+    Type of a column of sample strings
+
+    Returns:
+        tuple: (dtype, empty count, invalid count, datetime format or None)
+    """
+    text = values.astype("string").str.strip()
+    empty = text.isna() | (text == "")
+    present = text[~empty]
+    nulls = int(empty.sum())
+    if present.empty:
+        return "string", nulls, 0, None
+    total = len(present)
+
+    integer = present.str.match(_INTEGER.pattern)
+    if integer.mean() >= TYPE_THRESHOLD:
+        return "integer", nulls, int(total - integer.sum()), None
+    number = present.str.match(_FLOAT.pattern)
+    if number.mean() >= TYPE_THRESHOLD:
+        return "float", nulls, int(total - number.sum()), None
+    boolean = present.str.lower().isin(_BOOLEAN)
+    if boolean.mean() >= TYPE_THRESHOLD:
+        return "boolean", nulls, int(total - boolean.sum()), None
+    parsed = parse_datetimes(present.astype(object))
+    if parsed.notna().mean() >= TYPE_THRESHOLD:
+        first = present.iloc[0]
+        pattern = next((fmt for regex, fmt in _DATETIME_FORMATS if regex.match(first)), None)
+        return "datetime", nulls, int(parsed.isna().sum()), pattern
+    return "string", nulls, 0, None
+
+
+# --------------------------
+# CANONICAL FIELDS
+# --------------------------
+def _normalize(name) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+_SYNONYM_INDEX = {synonym: canonical for canonical, synonyms in SYNONYMS.items() for synonym in synonyms}
+
+
+def canonical_field(name: str, dtype: str) -> Tuple[Optional[str], float]:
+    """
+    Canonical field a column name stands for, with a confidence in [0, 1]
+
+    An exact synonym scores 1.0; a synonym contained in the name (or the
+    name in a synonym) scores by how much of the longer one it covers. A
+    type that does not fit the field halves the score.
+    """
+    normalized = _normalize(name)
+    best, score = None, 0.0
+    if normalized in _SYNONYM_INDEX:
+        best, score = _SYNONYM_INDEX[normalized], 1.0
+    elif len(normalized) >= 3:
+        for synonym, canonical in _SYNONYM_INDEX.items():
+            if synonym in normalized or normalized in synonym:
+                covered = min(len(synonym), len(normalized)) / max(len(synonym), len(normalized))
+                candidate = 0.5 + 0.4 * covered
+                if candidate > score:
+                    best, score = canonical, candidate
+    if best is None:
+        # Nameless or unrecognised columns: timestamps are still recognisable by value
+        return ("timestamp", 0.5) if dtype == "datetime" else (None, 0.0)
+    if dtype not in EXPECTED_TYPES[best]:
+        score *= 0.5
+    return best, round(score, 2)
+
+
+# --------------------------
+# ENTRY POINTS
+# --------------------------
+def _columns(names: List[str], rows: List[List[str]]) -> List[ColumnSchema]:
+    frame = pd.DataFrame([row[:len(names)] + [""] * (len(names) - len(row)) for row in rows], columns=names)
+    columns = []
+    for name in names:
+        dtype, nulls, invalid, fmt = column_type(frame[name])
+        canonical, confidence = canonical_field(name, dtype)
+        present = frame[name][frame[name].astype(str).str.strip() != ""]
+        columns.append(ColumnSchema(name=name, dtype=dtype, canonical=canonical, confidence=confidence,
+                                    nulls=nulls, invalid=invalid, format=fmt,
+                                    example=str(present.iloc[0]) if len(present) else ""))
+    return columns
+
+
+def infer_schema(content: bytes, sample_bytes: int = SAMPLE_BYTES, sample_rows: int = SAMPLE_ROWS) -> Schema:
+    """Infer delimiter, header and column types from the start of a CSV file"""
+    text = _sample_text(content, sample_bytes)
+    delimiter = sniff_delimiter(text)
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=delimiter) if row][:sample_rows + 1]
+    if not rows:
+        return Schema(delimiter=delimiter)
+    width = max(len(row) for row in rows)
+    placeholder = [f"column_{i + 1}" for i in range(width)]
+    body_types = [c.dtype for c in _columns(placeholder, rows[1:])] if len(rows) > 1 else []
+    has_header = _has_header(rows, body_types)
+    if has_header:
+        names = [cell.strip() or placeholder[i] for i, cell in enumerate(rows[0])] + placeholder[len(rows[0]):]
+        rows = rows[1:]
+    else:
+        names = placeholder
+    return Schema(delimiter=delimiter, has_header=has_header, sample_rows=len(rows), columns=_columns(names, rows))
+
+
+def infer_frame_schema(df: pd.DataFrame, sample_rows: int = SAMPLE_ROWS) -> Schema:
+    """Schema of an already-parsed table, typed from its first rows as text"""
+    sample = df.head(sample_rows)
+    rows = sample.astype(object).where(sample.notna(), "").astype(str).values.tolist()
+    return Schema(sample_rows=len(rows), columns=_columns([str(c) for c in df.columns], rows))
+
+
+def schema_of(transactions) -> Schema:
+    """The schema inferred when a TransactionTable was parsed, or one from its rows"""
+    schema = getattr(transactions, "schema", None)
+    if schema is None:
+        schema = infer_frame_schema(transactions.head(SAMPLE_ROWS))
+        transactions.schema = schema
+    return schema
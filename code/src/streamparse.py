@@ -0,0 +1,111 @@
+"""
+INCREMENTAL ANALYSIS PARSER
+Parses a streamed 'analysis_data' JSON reply piece by piece and emits each
+rule, transaction and flagged id as soon as its JSON element is complete,
+so results can be shown before the whole completion has arrived.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+LIST_EVENTS = {
+    "rules_list": "rule",
+    "transactions_list": "transaction",
+    "flagged_list": "flagged",
+}
+_KEY_RE = re.compile(r'"(rules_list|transactions_list|flagged_list)"\s*:\s*\[')
+# How far back to re-search for a key whose text arrived split across chunks
+_KEY_OVERLAP = 64
+
+
+def element_end(text: str, start: int) -> Optional[int]:
+    """Index just past the JSON value starting at `start`, or None if incomplete"""
+    first = text[start]
+    if first == '"':
+        i, escaped = start + 1, False
+        while i < len(text):
+            char = text[i]
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                return i + 1
+            i += 1
+        return None
+    if first in "{[":
+        depth, in_string, escaped = 0, False, False
+        for i in range(start, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        return None
+    # number / true / false / null
+    match = re.compile(r"[^\s,\]}]+").match(text, start)
+    if match and match.end() < len(text):
+        return match.end()
+    return None
+
+
+class AnalysisStreamParser:
+    """Feed streamed text in, get (kind, item) events out"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.current = None
+        self.items = {key: [] for key in LIST_EVENTS}
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Add a chunk of the reply and return the elements it completed"""
+        self.buffer += text
+        events = []
+        buffer = self.buffer
+        while True:
+            if self.current is None:
+                match = _KEY_RE.search(buffer, self.pos)
+                if not match:
+                    self.pos = max(self.pos, len(buffer) - _KEY_OVERLAP)
+                    break
+                self.current = match.group(1)
+                self.pos = match.end()
+                continue
+            i = self.pos
+            while i < len(buffer) and buffer[i] in " \t\r\n,":
+                i += 1
+            self.pos = i
+            if i >= len(buffer):
+                break
+            if buffer[i] == "]":
+                self.current = None
+                self.pos = i + 1
+                continue
+            end = element_end(buffer, i)
+            if end is None:
+                break
+            self.pos = end
+            try:
+                item = json.loads(buffer[i:end])
+            except ValueError:
+                continue
+            self.items[self.current].append(item)
+            events.append((LIST_EVENTS[self.current], item))
+        return events
+
+    def partial_result(self) -> dict:
+        """Everything parsed so far, in the 'analysis_data' shape"""
+        return {key: list(values) for key, values in self.items.items()}
@@ -0,0 +1,153 @@
+"""
+SYNTHETIC TRANSACTIONS
+Generates transaction CSVs in the schema of the sample analysis
+(UserId, TransactionId, TransactionTime, ItemCode, ItemDescription,
+NumberOfItemsPurchased, CostPerItem, Country) with a controllable share of
+rows that break the sample rules. Rows are produced in vectorised chunks,
+so 10M-row files stream to disk in bounded memory.
+
+    python synthdata.py --rows 1000000 --violation-rate 0.02 --output data/1m.csv
+"""
+
+import argparse
+from datetime import datetime
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["UserId", "TransactionId", "TransactionTime", "ItemCode", "ItemDescription",
+           "NumberOfItemsPurchased", "CostPerItem", "Country"]
+CHUNK_ROWS = 500_000
+
+ITEMS = [
+    "WASHROOM METAL SIGN", "SKULLS WRITING SET ", "LUNCH BAG RED RETROSPOT", "FAMILY ALBUM WHITE PICTURE FRAME",
+    "LONDON BUS COFFEE MUG", "SET 12 COLOUR PENCILS DOLLY GIRL ", "UNION JACK FLAG LUGGAGE TAG",
+    "CUT GLASS T-LIGHT HOLDER OCTAGON", "NATURAL SLATE CHALKBOARD LARGE ", "MULTI COLOUR SILVER T-LIGHT HOLDER",
+    "SET OF 6 RIBBONS PERFECTLY PRETTY  ", "RED  HARMONICA IN BOX ", "WOODEN BOX OF DOMINOES",
+    "SET OF 5 MINI GROCERY MAGNETS",
+]
+COUNTRIES = ["United Kingdom", "France", "Germany", "EIRE", "Spain", "Netherlands", "Belgium", "Switzerland"]
+HIGH_RISK_COUNTRIES = ["Iran", "North Korea", "Syria", "Myanmar"]
+
+# Violation kinds, matched to the sample rules (GEN001..GEN005, AML001..AML003)
+VIOLATIONS = {
+    "negative_user": "GEN001",        # UserId < 0 and not -1
+    "future_time": "GEN002",
+    "duplicate_id": "GEN003",
+    "large_amount": "AML001",         # NumberOfItemsPurchased * CostPerItem > 10000
+    "structuring": "AML002",          # several just-under-limit buys by one user in 24h
+    "high_risk_country": "AML003",
+    "numeric_description": "GEN004",
+    "stale_time": "GEN005",           # older than 365 days
+}
+
+
+_CLOCK = np.array([f"{m // 60:02d}:{m % 60:02d}:00" for m in range(24 * 60)], dtype=object)
+
+
+def format_times(now: datetime, offsets: np.ndarray) -> np.ndarray:
+    """
+    Format `now - offsets` seconds as 'Mon Sep 10 11:58:00 IST 2018'
+
+    Only the distinct days go through strftime; clock times come from a
+    lookup table, which is far quicker than formatting every row.
+    """
+    minutes = (np.datetime64(now, "m") - offsets // 60).astype("datetime64[m]")
+    days = minutes.astype("datetime64[D]")
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    stamps = pd.DatetimeIndex(unique_days)
+    prefix = np.array(stamps.strftime("%a %b %d "), dtype=object)
+    suffix = np.array(stamps.strftime(" IST %Y"), dtype=object)
+    clock = _CLOCK[(minutes - days).astype(np.int64)]
+    return prefix[day_index] + clock + suffix[day_index]
+
+
+def generate_chunk(rows: int, start_id: int, violation_rate: float, rng: np.random.Generator,
+                   now: datetime) -> pd.DataFrame:
+    """One chunk of rows; about violation_rate of them break exactly one rule"""
+    user = rng.integers(100_000, 400_000, rows)
+    txid = np.arange(start_id, start_id + rows)
+    offsets = rng.integers(0, 300 * 24 * 3600, rows)  # within the last 300 days
+    item = rng.integers(0, len(ITEMS), rows)
+    count = rng.choice([1, 2, 3, 6, 12, 24, 36, 72, 120], rows)
+    cost = np.round(rng.gamma(2.0, 2.0, rows) + 0.1, 2)
+    country = rng.choice(len(COUNTRIES), rows, p=[0.7] + [0.3 / (len(COUNTRIES) - 1)] * (len(COUNTRIES) - 1))
+    descriptions = np.array(ITEMS, dtype=object)[item]
+    countries = np.array(COUNTRIES, dtype=object)[country]
+
+    bad = np.flatnonzero(rng.random(rows) < violation_rate)
+    kinds = rng.integers(0, len(VIOLATIONS), len(bad))
+    kind_names = list(VIOLATIONS)
+    for k, name in enumerate(kind_names):
+        rows_k = bad[kinds == k]
+        if not len(rows_k):
+            continue
+        if name == "negative_user":
+            user[rows_k] = -rng.integers(2, 1000, len(rows_k))
+        elif name == "future_time":
+            offsets[rows_k] = -rng.integers(3600, 30 * 24 * 3600, len(rows_k))
+        elif name == "duplicate_id":
+            txid[rows_k] = txid[np.maximum(rows_k - 1, 0)]
+        elif name == "large_amount":
+            count[rows_k] = 1000
+            cost[rows_k] = np.round(rng.uniform(10.5, 50, len(rows_k)), 2)
+        elif name == "structuring":
+            # the row and its successor: same user, a few hours apart, just under the limit
+            pairs = rows_k[rows_k + 1 < rows]
+            user[pairs + 1] = user[pairs]
+            offsets[pairs + 1] = offsets[pairs] + rng.integers(600, 6 * 3600, len(pairs))
+            count[pairs] = count[pairs + 1] = 1000
+            cost[pairs] = cost[pairs + 1] = 9.5
+        elif name == "high_risk_country":
+            countries[rows_k] = rng.choice(HIGH_RISK_COUNTRIES, len(rows_k))
+        elif name == "numeric_description":
+            descriptions[rows_k] = rng.integers(1000, 99999, len(rows_k)).astype(str)
+        elif name == "stale_time":
+            offsets[rows_k] = rng.integers(366 * 24 * 3600, 700 * 24 * 3600, len(rows_k))
+
+    return pd.DataFrame({
+        "UserId": user,
+        "TransactionId": txid,
+        "TransactionTime": format_times(now, offsets),
+        "ItemCode": 400_000 + item * 1000 + rng.integers(0, 1000, rows),
+        "ItemDescription": descriptions,
+        "NumberOfItemsPurchased": count,
+        "CostPerItem": cost,
+        "Country": countries,
+    }, columns=COLUMNS)
+
+
+def generate_transactions(rows: int, violation_rate: float = 0.05, seed: int = 0,
+                          now: Optional[datetime] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield DataFrame chunks totalling `rows` rows"""
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now().replace(microsecond=0)
+    start_id = 6_000_000
+    for offset in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - offset)
+        yield generate_chunk(size, start_id + offset, violation_rate, rng, now)
+
+
+def write_csv(path: str, rows: int, violation_rate: float = 0.05, seed: int = 0,
+              now: Optional[datetime] = None) -> str:
+    """Write a synthetic transaction CSV and return its path"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(generate_transactions(rows, violation_rate, seed, now)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic transaction CSV")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--violation-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+    write_csv(args.output, args.rows, args.violation_rate, args.seed)
+    print(args.output)
+
+
+if __name__ == "__main__":
+    main()
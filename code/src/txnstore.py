@@ -0,0 +1,216 @@
+"""
+TRANSACTION STORE
+Parses an uploaded transaction CSV once into a columnar Arrow table and
+shares it between every consumer (preview, prompt building, local rule
+checks, dashboard). Tables are keyed by a hash of the file bytes, so the
+same upload from any session maps to one parsed copy; large tables are
+spilled to a memory-mapped Arrow IPC file, which is deleted when the table
+is evicted (the spill directory is also capped, for files left by earlier
+processes). The delimiter and header row come from the schema inferred on
+a sample of the file (schemainfer.py).
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
+from llmclient import get_setting
+from metrics import span
+from schemainfer import Schema, infer_schema
+
+DEFAULT_TABLE_DIR = os.path.join(".cache", "tables")
+# Tables whose in-memory size exceeds this are spilled to disk and memory-mapped
+SPILL_BYTES = 64 * 1024 * 1024
+MAX_TABLES = 8
+DEFAULT_TABLE_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+_tables = OrderedDict()
+_file_keys = {}
+_lock = threading.Lock()
+
+
+class TransactionTable:
+    """One parsed transaction file"""
+
+    def __init__(self, key: str, name: str, table=None, df: Optional[pd.DataFrame] = None, path: Optional[str] = None,
+                 schema: Optional[Schema] = None):
+        self.key = key
+        self.name = name
+        self.table = table
+        self.path = path
+        self.schema = schema
+        self.data_profile = None  # set by dataprofile.profile_of()
+        self._df = df
+        self._df_lock = threading.Lock()
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows if self.table is not None else len(self._df)
+
+    @property
+    def columns(self) -> list:
+        return list(self.table.column_names) if self.table is not None else list(self._df.columns)
+
+    def to_pandas(self, columns: Optional[list] = None) -> pd.DataFrame:
+        """
+        The table, or only some of its columns, as a DataFrame
+
+        An in-memory table is converted once and the DataFrame shared. A
+        spilled table is converted on every call and the DataFrame is not
+        kept, so the cached table stays backed by its memory map; ask for
+        the columns that are needed.
+        """
+        if self.path is not None and self._df is None:
+            return (self.table if columns is None else self.table.select(columns)).to_pandas()
+        with self._df_lock:
+            if self._df is None:
+                self._df = self.table.to_pandas()
+        return self._df if columns is None else self._df[columns]
+
+    def take(self, positions, columns: Optional[list] = None) -> pd.DataFrame:
+        """Rows at the given positions as a DataFrame, without converting the rest"""
+        if self._df is not None:
+            df = self._df.iloc[positions]
+            return (df if columns is None else df[columns]).reset_index(drop=True)
+        table = self.table if columns is None else self.table.select(columns)
+        return table.take(pa.array(positions, type=pa.int64())).to_pandas()
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        """First rows without materialising the whole DataFrame"""
+        if self._df is not None:
+            return self._df.head(n)
+        return self.table.slice(0, n).to_pandas()
+
+
+def _read_bytes(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(), os.path.basename(str(source))
+    if hasattr(source, "getvalue"):
+        return source.getvalue(), source.name
+    source.seek(0)
+    content = source.read()
+    source.seek(0)
+    return content, source.name
+
+
+def _parse(content: bytes, key: str, name: str) -> TransactionTable:
+    with span("schema_infer", file=name):
+        schema = infer_schema(content)
+    names = None if schema.has_header else schema.names
+    if pa is None:
+        df = pd.read_csv(BytesIO(content), sep=schema.delimiter, header=0 if names is None else None, names=names)
+        return TransactionTable(key, name, df=df, schema=schema)
+    table = pa_csv.read_csv(pa.BufferReader(content),
+                            read_options=pa_csv.ReadOptions(column_names=names),
+                            parse_options=pa_csv.ParseOptions(delimiter=schema.delimiter),
+                            # Empty and NA-like text cells are null, as with pd.read_csv
+                            convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+    if table.nbytes < SPILL_BYTES:
+        return TransactionTable(key, name, table=table, schema=schema)
+    # Spill to an IPC file and read it back memory-mapped, so pages are only
+    # resident while in use and every session shares the same mapping
+    directory = get_setting("TABLE_CACHE_DIR", DEFAULT_TABLE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}.arrow")
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa_ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    mapped = pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+    trim_spills(directory, int(get_setting("TABLE_CACHE_MAX_BYTES", DEFAULT_TABLE_CACHE_MAX_BYTES)), keep={path})
+    return TransactionTable(key, name, table=mapped, path=path, schema=schema)
+
+
+# --------------------------
+# SPILL FILES
+# --------------------------
+def _remove(path: str):
+    # An open mapping keeps the pages readable after the unlink (POSIX); where
+    # the file is still in use and cannot go, the directory cap retries later
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def trim_spills(directory: str, max_bytes: int, keep=()):
+    """Delete the least recently written spill files above max_bytes, except tables still loaded"""
+    with _lock:
+        loaded = {os.path.abspath(table.path) for table in _tables.values() if table.path}
+    loaded.update(os.path.abspath(path) for path in keep)
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".arrow")]
+    except OSError:
+        return
+    files = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue  # removed by another process
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in loaded:
+            continue
+        _remove(path)
+        total -= size
+
+
+def load_transactions(source) -> TransactionTable:
+    """
+    Return the parsed table for an uploaded file, path or file-like object
+
+    Parsing only happens the first time a given file content is seen.
+    """
+    if isinstance(source, TransactionTable):
+        return source
+    file_id = getattr(source, "file_id", None)
+    with _lock:
+        key = _file_keys.get(file_id) if file_id else None
+        if key in _tables:
+            _tables.move_to_end(key)
+            return _tables[key]
+
+    content, name = _read_bytes(source)
+    key = hashlib.sha256(content).hexdigest()
+    with _lock:
+        if file_id:
+            _file_keys[file_id] = key
+        if key in _tables:
+            _tables.move_to_end(key)
+            return _tables[key]
+
+    loaded = _parse(content, key, name)
+    evicted = []
+    with _lock:
+        loaded = _tables.setdefault(key, loaded)
+        while len(_tables) > MAX_TABLES:
+            evicted.append(_tables.popitem(last=False)[1])
+    for table in evicted:
+        if table.path:
+            _remove(table.path)
+    return loaded
+
+
+def get_transactions(key: str) -> Optional[TransactionTable]:
+    """Look up an already-parsed table by its content key"""
+    with _lock:
+        return _tables.get(key)
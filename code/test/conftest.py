@@ -0,0 +1,126 @@
+import json
+import re
+import shutil
+import sys
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+import blobstore  # noqa: E402
+import extraction  # noqa: E402
+import jobqueue  # noqa: E402
+import llmclient  # noqa: E402
+import metrics  # noqa: E402
+import outcomestore  # noqa: E402
+import replaystore  # noqa: E402
+import rulescache  # noqa: E402
+import rulescatalog  # noqa: E402
+import txnstore  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run each test in its own directory, with the prompts and fresh stores"""
+    for prompt in SRC.glob("*.txt"):
+        shutil.copy(prompt, tmp_path)  # prompts are read relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(llmclient, "_overrides", {})
+    monkeypatch.setattr(llmclient, "_use_secrets", False)
+    for module, name in ((blobstore, "_store"), (extraction, "_pool"), (jobqueue, "_queue"),
+                         (llmclient, "_client"), (outcomestore, "_store"), (replaystore, "_store"),
+                         (rulescache, "_cache"), (rulescatalog, "_catalog")):
+        monkeypatch.setattr(module, name, None)
+    monkeypatch.setattr(txnstore, "_tables", OrderedDict())
+    monkeypatch.setattr(txnstore, "_file_keys", {})
+    metrics.REGISTRY.reset()
+    return tmp_path
+
+
+class FakeClient:
+    """Stands in for the shared LLM client; replies come from a function of the payload"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.payloads = []
+
+    def chat(self, payload):
+        self.payloads.append(payload)
+        return {"choices": [{"message": {"content": self.reply(payload)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+
+    def stream(self, payload, chunk_chars=7):
+        self.payloads.append(payload)
+        content = self.reply(payload)
+        for start in range(0, len(content), chunk_chars):
+            yield {"choices": [{"delta": {"content": content[start:start + chunk_chars]}}]}
+        yield {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Install a FakeClient; call it with the reply function"""
+
+    def install(reply):
+        client = FakeClient(reply)
+        monkeypatch.setattr(llmclient, "_client", client)
+        return client
+
+    return install
+
+
+@pytest.fixture
+def transactions_csv():
+    """A small transaction CSV, written to the working directory"""
+
+    def write(rows, name="transactions.csv"):
+        pd.DataFrame(rows).to_csv(name, index=False)
+        return name
+
+    return write
+
+
+@pytest.fixture
+def document():
+    """An uploaded rules document: a named binary file object"""
+
+    def make(text, name="rules.txt"):
+        file_obj = BytesIO(text.encode("utf-8"))
+        file_obj.name = name
+        return file_obj
+
+    return make
+
+
+def analysis_reply(flagged=()):
+    """Reply function: a verdict for every transaction (T<n>) in the rows of the request"""
+
+    def reply(payload):
+        content = payload["messages"][-1]["content"]
+        rows = content.split("TRANSACTION DATA:", 1)[-1].split("RULES DOCUMENTS:", 1)[0]
+        ids = list(dict.fromkeys(re.findall(r"^(T\d+),", rows, re.M)))
+        return json.dumps({"analysis_data": {
+            "rules_list": [{"ruleid": "M1", "description": "Model rule"}],
+            "transactions_list": [{"transaction_id": tx_id, "flag": tx_id in flagged,
+                                   "risk_score": 70 if tx_id in flagged else 0,
+                                   "voilated_rules_list": ["M1"] if tx_id in flagged else []}
+                                  for tx_id in ids],
+            "flagged_list": [tx_id for tx_id in ids if tx_id in flagged],
+        }})
+
+    return reply
+
+
+@pytest.fixture
+def model_reply():
+    return analysis_reply
+
+
+def counter(name, **labels):
+    """Current value of a metrics counter (0 if it was never counted)"""
+    return metrics.REGISTRY.counters.get((name, metrics._label_key(labels)), 0.0)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from analytics import OlderThan, Unique, WindowSum, duplicated, plan_analytic, rolling_window, spread_windows
+from ruleengine import evaluate_rules
+
+COLUMNS = ["UserId", "TransactionId", "TransactionTime", "NumberOfItemsPurchased", "CostPerItem"]
+NOW = pd.Timestamp("2024-06-01 12:00")
+
+
+def frame():
+    return pd.DataFrame({
+        "UserId": [1, 1, 1, 2, 2, 3],
+        "TransactionId": [10, 11, 12, 13, 13, 14],
+        "TransactionTime": ["2024-05-01 00:00", "2024-05-01 10:00", "2024-05-03 00:00",
+                            "2024-05-01 00:00", "2024-05-01 01:00", "2022-01-01 00:00"],
+        "NumberOfItemsPurchased": [1000, 1000, 1000, 1, 1, 5],
+        "CostPerItem": [6.0, 6.0, 9.0, 3.0, 3.0, 2.0],
+    })
+
+
+def test_rolling_window_stays_within_each_key():
+    keys = np.array(["a", "b", "a", "a"], dtype=object)
+    times = np.array(["2024-01-01T00", "2024-01-01T01", "2024-01-01T05", "2024-01-02T06"], dtype="datetime64[h]")
+    sums, counts, starts, order = rolling_window(keys, times, np.array([1.0, 2.0, 3.0, 4.0]),
+                                                 np.timedelta64(24, "h"))
+    # sorted by key then time: a@0, a@5, a@30, b@1
+    assert order.tolist() == [0, 2, 3, 1]
+    assert sums.tolist() == [1.0, 4.0, 4.0, 2.0]
+    assert counts.tolist() == [1, 2, 1, 1]
+    assert spread_windows(starts, np.array([False, True, False, False])).tolist() == [True, True, False, False]
+
+
+def test_duplicates_by_hash_grouping():
+    df = pd.DataFrame({"a": [1, 2, 1, None, None], "b": ["x", "y", "z", "w", "w"]})
+    assert duplicated(df, ["a"]).tolist() == [True, False, True, False, False]
+    assert duplicated(df, ["a", "b"]).tolist() == [False, False, False, True, True]
+
+
+def test_rules_are_planned_from_their_text():
+    structuring = plan_analytic({"description": "Multiple transactions under $10,000 by the same UserId "
+                                                "within 24 hours (NumberOfItemsPurchased * CostPerItem)"}, COLUMNS)
+    assert isinstance(structuring, WindowSum)
+    assert (structuring.key, structuring.time, structuring.limit) == ("UserId", "TransactionTime", 10000.0)
+    assert structuring.window == np.timedelta64(24 * 3600, "s")
+    assert plan_analytic({"condition": "TransactionId must be unique"}, COLUMNS) == Unique(["TransactionId"])
+    stale = plan_analytic({"description": "Transactions older than 365 days raise an alert"}, COLUMNS)
+    assert isinstance(stale, OlderThan) and stale.max_age == np.timedelta64(365 * 86400, "s")
+    assert plan_analytic({"description": "Items must be described"}, COLUMNS) is None
+    assert plan_analytic({"analytic": {"type": "unique", "columns": ["Missing"]}}, COLUMNS) is None
+
+
+def test_analytic_rules_are_evaluated_locally():
+    rules = [
+        {"ruleid": "AML002", "analytic": {"type": "window_sum", "key": "UserId", "time": "TransactionTime",
+                                          "value": "NumberOfItemsPurchased * CostPerItem", "window_hours": 24,
+                                          "limit": 10000}},
+        {"ruleid": "GEN003", "condition": "duplicate TransactionId"},
+        {"ruleid": "GEN005", "analytic": {"type": "older_than", "days": 365}},
+    ]
+    data = evaluate_rules(frame(), rules, now=NOW)
+    violated = [(tx["transaction_id"], tx["voilated_rules_list"]) for tx in data["transactions_list"]]
+    # 6000 + 6000 within 10 hours reaches the limit; the third buy is two days later
+    assert violated == [("10", ["AML002"]), ("11", ["AML002"]), ("12", []), ("13", ["GEN003"]), ("14", ["GEN005"])]
+    assert data["unsupported_rules"] == []
+
+
+def test_line_items_of_one_transaction_are_not_structuring():
+    """Regression: two items of one TransactionId counted as two transactions in the window"""
+    rule = {"ruleid": "AML002", "analytic": {"type": "window_sum", "key": "UserId", "time": "TransactionTime",
+                                             "value": "NumberOfItemsPurchased * CostPerItem", "window_hours": 24,
+                                             "limit": 10000}}
+    df = pd.DataFrame({
+        "UserId": [1, 1, 2, 2, 2],
+        "TransactionId": [10, 10, 20, 20, 21],
+        "TransactionTime": ["2024-05-01 00:00", "2024-05-01 00:00", "2024-05-01 00:00", "2024-05-01 00:00",
+                            "2024-05-01 05:00"],
+        "NumberOfItemsPurchased": [1000, 1000, 1000, 1000, 1000],
+        "CostPerItem": [6.0, 6.0, 3.0, 3.0, 5.0],
+    })
+    data = evaluate_rules(df, [rule], now=NOW)
+    # 10 is one 12000 purchase (a single transaction over the limit, not structuring);
+    # 20 (6000 in two items) and 21 (5000) are two sub-limit transactions reaching it
+    assert sorted(data["flagged_list"]) == ["20", "21"]
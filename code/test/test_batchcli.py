@@ -0,0 +1,103 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batchcli
+
+
+@pytest.mark.parametrize("workers, api_concurrency, expected", [
+    (4, 8, (4, 2)),
+    (4, 4, (4, 1)),
+    (8, 2, (2, 1)),   # regression: used to start 8 processes with one request slot each
+    (3, 1, (1, 1)),
+    (0, 0, (1, 1)),
+])
+def test_split_budget_keeps_the_api_cap(workers, api_concurrency, expected):
+    processes, per_process = batchcli.split_budget(workers, api_concurrency)
+    assert (processes, per_process) == expected
+    assert processes * per_process <= max(1, api_concurrency)
+
+
+def test_find_inputs_expands_directories_and_globs(tmp_path):
+    for name in ("a.csv", "nested/b.csv", "notes.txt"):
+        os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+        (tmp_path / name).write_text("x\n")
+    found = batchcli.find_inputs([str(tmp_path), str(tmp_path / "*.csv")])
+    assert [os.path.relpath(p, tmp_path) for p in found] == ["a.csv", os.path.join("nested", "b.csv")]
+
+
+def test_resume_skips_only_finished_unchanged_files(tmp_path):
+    lines = [
+        {"file": "/data/a.csv", "sha256": "aaa", "status": "done"},
+        {"file": "/data/b.csv", "sha256": "bbb", "status": "failed"},
+    ]
+    with open(tmp_path / batchcli.RESULTS_FILE, "w") as f:
+        f.write("\n".join(json.dumps(line) for line in lines) + '\n{"file": "/data/c.cs')
+    assert batchcli.load_done(str(tmp_path)) == {"/data/a.csv": "aaa"}
+
+
+def test_summary_totals():
+    records = [
+        {"status": "done", "rows": 10, "flagged": 2, "usage": {"total_tokens": 100},
+         "cascade": {"screened": 10, "escalated": 2}},
+        {"status": "done", "rows": 30, "flagged": 1, "usage": None,
+         "cascade": {"screened": 30, "escalated": 6}},
+        {"status": "failed"},
+    ]
+    summary = batchcli.summarize(records, skipped=1, elapsed=2.0)
+    assert summary["files"] == {"processed": 3, "done": 2, "failed": 1, "skipped": 1}
+    assert summary["rows_per_second"] == 20.0
+    assert summary["tokens"]["total_tokens"] == 100
+    assert summary["escalated_share"] == 0.2
+
+
+def test_process_file_writes_a_record_and_parquet(transactions_csv, tmp_path):
+    rules = [{"ruleid": "R1", "condition": "Amount < 100", "condition_type": "assert"}]
+    path = os.path.abspath(transactions_csv({"Transaction_ID": ["T1", "T2"], "Amount": [5, 500]}))
+    with open("rules.txt", "w") as f:
+        f.write("Amounts stay below 100.")
+
+    record = batchcli.process_file(path, "0" * 64, [os.path.abspath("rules.txt")],
+                                   {"rules.txt": {"content": rules}}, False, str(tmp_path))
+
+    assert record["status"] == "done"
+    assert record["flagged_list"] == ["T2"]
+    assert os.path.exists(record["table"])
+
+
+class InlinePool(ThreadPoolExecutor):
+    """Thread pool standing in for the process pool"""
+
+    def __init__(self, max_workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(max_workers=max_workers)
+
+
+def test_a_worker_that_raises_fails_only_its_file(monkeypatch, transactions_csv, tmp_path):
+    """Regression: an exception out of future.result() used to abort the whole run"""
+    good = transactions_csv({"Transaction_ID": ["T1"], "Amount": [5]}, name="good.csv")
+    bad = transactions_csv({"Transaction_ID": ["T2"], "Amount": [6]}, name="bad.csv")
+    with open("rules.txt", "w") as f:
+        f.write("Amounts stay below 100.")
+
+    def process_file(path, digest, *args):
+        if path.endswith("bad.csv"):
+            raise RuntimeError("A process in the process pool was terminated abruptly")
+        return {"file": path, "sha256": digest, "status": "done", "rows": 1, "seconds": 0.1}
+
+    monkeypatch.setattr(batchcli, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(batchcli, "init_worker", lambda settings: None)
+    monkeypatch.setattr(batchcli, "process_file", process_file)
+    output = tmp_path / "run"
+
+    status = batchcli.main(["--rules", "rules.txt", "--input", good, bad, "--output", str(output)])
+
+    assert status == 1
+    with open(output / batchcli.RESULTS_FILE) as f:
+        records = {os.path.basename(r["file"]): r for r in map(json.loads, f)}
+    assert records["good.csv"]["status"] == "done"
+    assert records["bad.csv"]["status"] == "failed"
+    assert "terminated abruptly" in records["bad.csv"]["error"]
+    with open(output / batchcli.SUMMARY_FILE) as f:
+        assert json.load(f)["files"] == {"processed": 2, "done": 1, "failed": 1, "skipped": 0}
@@ -0,0 +1,77 @@
+import json
+
+from profiliing import analyze, profile_batch, shard_csv
+from util import estimate_tokens, merge_analysis
+
+
+def test_shards_repeat_the_header_and_fit_the_budget():
+    rows = [f"T{i},{i * 10},United Kingdom" for i in range(200)]
+    content = "\n".join(["Transaction_ID,Amount,Country"] + rows)
+    shards = shard_csv(content, token_budget=200)
+    assert len(shards) > 1
+    assert all(shard.startswith("Transaction_ID,Amount,Country\n") for shard in shards)
+    assert all(estimate_tokens(shard) <= 200 for shard in shards)
+    assert [line for shard in shards for line in shard.splitlines()[1:]] == rows
+
+
+def test_quoted_multiline_records_stay_in_one_shard():
+    content = 'id,note\n1,"first\nsecond"\n2,plain'
+    assert shard_csv(content, token_budget=5) == ['id,note\n1,"first\nsecond"', "id,note\n2,plain"]
+
+
+def test_merge_deduplicates_rules_and_flagged_ids():
+    merged = merge_analysis(
+        {"analysis_data": {"rules_list": [{"ruleid": "R1"}], "transactions_list": [{"transaction_id": "1"}],
+                           "flagged_list": ["1"], "risk_scoring_definition": "sum"}},
+        None,
+        {"rules_list": [{"ruleid": "R1"}, {"ruleid": "R2"}], "transactions_list": [{"transaction_id": "2"}],
+         "flagged_list": ["1", "2"]})
+    assert [r["ruleid"] for r in merged["rules_list"]] == ["R1", "R2"]
+    assert [t["transaction_id"] for t in merged["transactions_list"]] == ["1", "2"]
+    assert merged["flagged_list"] == ["1", "2"]
+    assert merged["risk_scoring_definition"] == "sum"
+
+
+def test_batch_profile_merges_every_shard(fake_client, model_reply, transactions_csv, document):
+    client = fake_client(model_reply(flagged={"T3", "T40"}))
+    ids = [f"T{i}" for i in range(60)]
+    path = transactions_csv({"Transaction_ID": ids, "Amount": range(60)})
+    progress = []
+
+    data = profile_batch(["rules.txt"], path, token_budget=60, max_workers=3,
+                         documents={"rules.txt": document("Amount must be positive.")},
+                         progress_callback=lambda done, total: progress.append((done, total)))
+
+    assert len(client.payloads) > 1
+    assert data["shards"] == {"total": len(client.payloads), "failed": 0}
+    assert sorted(tx["transaction_id"] for tx in data["transactions_list"]) == sorted(ids)
+    assert sorted(data["flagged_list"]) == ["T3", "T40"]
+    assert progress[-1] == (len(client.payloads), len(client.payloads))
+    assert data["usage"]["total_tokens"] == 15 * len(client.payloads)
+
+
+def test_failed_shards_are_counted_not_fatal(fake_client, model_reply, transactions_csv, document):
+    good = model_reply()
+
+    def flaky(payload):
+        if "T0," in payload["messages"][-1]["content"]:
+            raise TimeoutError("read timeout")
+        return good(payload)
+
+    fake_client(flaky)
+    path = transactions_csv({"Transaction_ID": [f"T{i}" for i in range(60)], "Amount": range(60)})
+    data = profile_batch(["rules.txt"], path, token_budget=60,
+                         documents={"rules.txt": document("Amount must be positive.")})
+    assert data["shards"]["failed"] == 1
+    assert "T0" not in {tx["transaction_id"] for tx in data["transactions_list"]}
+
+
+def test_analyze_in_batch_mode_reports_shards(fake_client, model_reply, transactions_csv, document):
+    fake_client(model_reply(flagged={"T1"}))
+    path = transactions_csv({"Transaction_ID": [f"T{i}" for i in range(30)], "Amount": range(30)})
+    result = analyze(["rules.txt"], path, batch=True, documents={"rules.txt": document("Amounts.")},
+                     generated_results={}, incremental=False)
+    data = result["analysis_data"]
+    assert data["flagged_list"] == ["T1"]
+    assert data["shards"]["failed"] == 0
+    assert json.dumps(result["performance"])  # stage timings are plain data
@@ -0,0 +1,96 @@
+import json
+
+import pandas as pd
+
+import cascade
+from llmclient import configure
+from profiliing import analyze
+from txnstore import load_transactions
+
+
+def test_transaction_shards_keep_transactions_together():
+    df = pd.DataFrame({"Transaction_ID": ["A", "B", "A", "C", "B", "C"], "Amount": range(6)})
+    shards = cascade.transaction_shards(df, "Transaction_ID", 2)
+    assert sorted(p for shard in shards for p in shard) == list(range(6))
+    owners = [set(df["Transaction_ID"].iloc[shard]) for shard in shards]
+    assert all(sum(tx_id in ids for ids in owners) == 1 for tx_id in "ABC")
+
+
+def test_screening_model_escalates_only_what_it_flags(fake_client, transactions_csv):
+    configure(use_secrets=False, SCREEN_MODEL="fast-model")
+    fake_client(lambda payload: json.dumps({"suspicious_list": ["T2"], "uncertain_list": ["T9"]}))
+    table = load_transactions(transactions_csv({"Transaction_ID": ["T1", "T2", "T3"], "Amount": [5, 50000, 7]}))
+
+    subset, report = cascade.screen_transactions([], table, [{"ruleid": "R1", "description": "x"}], documents={})
+
+    assert list(subset.to_pandas()["Transaction_ID"]) == ["T2"]
+    assert report["screen_model"] == "fast-model"
+    assert (report["screened"], report["escalated"], report["share"]) == (3, 1, round(1 / 3, 4))
+
+
+def test_failed_screening_shard_is_escalated(fake_client, transactions_csv):
+    configure(use_secrets=False, SCREEN_MODEL="fast-model")
+
+    def broken(payload):
+        raise RuntimeError("timeout")
+
+    fake_client(broken)
+    table = load_transactions(transactions_csv({"Transaction_ID": ["T1", "T2"], "Amount": [5, 6]}))
+    subset, report = cascade.screen_transactions([], table, [{"ruleid": "R1"}], documents={})
+    assert subset.num_rows == 2
+    assert report["failed_shards"] == 1
+
+
+def test_cascade_without_a_screening_model_is_skipped(fake_client, model_reply, transactions_csv, document):
+    """Regression: every row used to be 'escalated' to the model, reporting a 100% cascade"""
+    client = fake_client(model_reply(flagged={"T2"}))
+    path = transactions_csv({"Transaction_ID": ["T1", "T2"], "Country": ["US", ""]})
+
+    result = analyze(selected_files=["rules.txt"], transaction_file=path,
+                     documents={"rules.txt": document("Country must be known.")},
+                     generated_results={}, cascade=True)
+
+    data = result["analysis_data"]
+    assert len(client.payloads) == 1
+    assert "cascade" not in data
+    assert data["flagged_list"] == ["T2"]
+
+
+def test_screening_model_cascade_runs_in_analyze(fake_client, model_reply, transactions_csv, document):
+    configure(use_secrets=False, SCREEN_MODEL="fast-model")
+    analysis = model_reply(flagged={"T2"})
+
+    def reply(payload):
+        if payload["model"] == "fast-model":
+            return json.dumps({"suspicious_list": ["T2"], "uncertain_list": []})
+        return analysis(payload)
+
+    client = fake_client(reply)
+    path = transactions_csv({"Transaction_ID": ["T1", "T2", "T3"], "Country": ["US", "", "FR"]})
+
+    result = analyze(selected_files=["rules.txt"], transaction_file=path,
+                     documents={"rules.txt": document("Country must be known.")},
+                     generated_results={}, cascade=True)
+
+    data = result["analysis_data"]
+    assert len(client.payloads) == 2
+    assert (data["cascade"]["screen_model"], data["cascade"]["escalated"]) == ("fast-model", 1)
+    assert data["flagged_list"] == ["T2"]
+
+
+def test_local_screening_escalates_every_row_for_rules_it_cannot_check(transactions_csv):
+    """Regression: raw documents used to be applied to no row at all"""
+    table = load_transactions(transactions_csv({"Transaction_ID": ["T1", "T2"], "Country": ["US", ""]}))
+    subset, report = cascade.screen_transactions(["rules.txt"], table, [], documents={})
+    assert subset.num_rows == 2
+    assert (report["escalated"], report["share"]) == (2, 1.0)
+
+
+def test_local_screening_escalates_rows_for_leftover_rules(transactions_csv):
+    table = load_transactions(transactions_csv({"Transaction_ID": ["T1", "T2", "T3"], "Amount": [1, 2, 3]}))
+    local_data = {"flagged_list": ["T1"], "transactions_list": []}
+
+    subset, report = cascade.screen_transactions([], table, [{"ruleid": "R9", "condition": "free text"}],
+                                                 documents={}, local_data=local_data)
+    assert subset.num_rows == 3
+    assert report["escalated"] == 3
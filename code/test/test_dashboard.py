@@ -0,0 +1,68 @@
+import numpy as np
+
+from dashboard import build_transaction_view, filter_positions, sort_positions
+
+DATA = {
+    "rules_list": [{"ruleid": "R1"}, {"ruleid": "R2"}],
+    "transactions_list": [
+        {"transaction_id": "T1", "risk_score": 90, "flag": True, "voilated_rules_list": ["R1", "R2"],
+         "explanation": "Large transfer", "risk_segments": {"amount": 60, "country": 30}},
+        {"transaction_id": "T2", "risk_score": 10, "flag": False, "voilated_rules_list": [],
+         "explanation": "", "risk_segments": {"amount": 0, "country": 10}},
+        {"transaction_id": "T3", "risk_score": 45, "flag": True, "voilated_rules_list": ["R2"],
+         "explanation": "Sanctioned country", "risk_segments": {"amount": 5, "country": 40}},
+        {"transaction_id": "T4", "risk_score": "n/a", "flag": "yes", "voilated_rules_list": ["R2"]},
+    ],
+    "flagged_list": ["T1", "T3"],
+}
+
+
+def test_view_is_built_from_the_result_columns():
+    view = build_transaction_view(DATA)
+    frame = view["frame"]
+    assert list(frame["Transaction ID"]) == ["T1", "T2", "T3", "T4"]
+    assert list(frame["Risk Level"]) == ["High", "Low", "Medium", "Low"]
+    assert list(frame["Violated Rules"]) == ["R1, R2", "", "R2", "R2"]
+    assert list(frame["Explanation"]) == ["Large transfer", "", "Sanctioned country", ""]
+    assert frame["Risk Score"].iloc[3] == 0  # unparseable scores count as zero
+    assert list(frame["Flagged"]) == ["Yes", "No", "Yes", "Yes"]
+    assert view["positions"] == {"T1": 0, "T2": 1, "T3": 2, "T4": 3}
+    assert list(view["rule_rows"]["R2"]) == [0, 2, 3]
+
+
+def test_filters_combine_risk_level_and_rule():
+    view = build_transaction_view(DATA)
+    assert list(filter_positions(view, [], "All")) == [0, 1, 2, 3]
+    assert list(filter_positions(view, ["Low"], "All")) == [1, 3]
+    assert list(filter_positions(view, ["Low"], "R2")) == [3]
+    assert list(filter_positions(view, [], "R9")) == []
+
+
+def test_sorting_orders_positions_not_rows():
+    frame = build_transaction_view(DATA)["frame"]
+    positions = np.array([0, 1, 2])
+    assert list(sort_positions(frame, positions, "Risk Score", True)) == [0, 2, 1]
+    # Risk levels sort by the underlying score, not alphabetically
+    assert list(sort_positions(frame, positions, "Risk Level", False)) == [1, 2, 0]
+    assert list(sort_positions(frame, positions, "Transaction ID", True)) == [2, 1, 0]
+
+
+def test_summary_is_aggregated_once():
+    summary = build_transaction_view(DATA)["summary"]
+    assert summary["total"] == 4 and summary["flagged"] == 3
+    assert summary["risk_counts"] == {"High": 1, "Medium": 1, "Low": 2}
+    assert sum(summary["histogram"]["counts"]) == 4
+    assert summary["histogram"]["edges"][0] == 0 and summary["histogram"]["edges"][-1] == 100
+    assert summary["quantiles"]["p50"] == 27.5
+    assert summary["rule_counts"] == [("R2", 3), ("R1", 1)]
+    # T4 has no segment scores, so it is left out of the segment statistics
+    assert summary["segments"]["country"] == {"mean": 80 / 3, "max": 40.0, "median": 30.0,
+                                              "p90": 38.0, "nonzero": 3}
+    assert summary["segments"]["amount"]["nonzero"] == 2
+
+
+def test_summary_of_an_empty_result():
+    summary = build_transaction_view({"rules_list": [], "transactions_list": []})["summary"]
+    assert summary["total"] == 0
+    assert summary["quantiles"]["p99"] == 0.0
+    assert summary["segments"] == {} and summary["rule_counts"] == []
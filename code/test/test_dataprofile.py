@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from dataprofile import DataProfile, HyperLogLog, TDigest, TopK, profile_file, profile_frames
+from schemainfer import infer_schema
+
+
+def test_distinct_counts_are_estimated_within_a_few_percent():
+    sketch = HyperLogLog()
+    sketch.add_hashes(pd.util.hash_pandas_object(pd.Series(np.arange(50_000)), index=False).to_numpy())
+    assert abs(sketch.estimate() - 50_000) < 2_500
+    small = HyperLogLog()
+    small.add_hashes(pd.util.hash_pandas_object(pd.Series(["a", "b", "a"]), index=False).to_numpy())
+    assert small.estimate() == 2
+
+
+def test_quantiles_of_merged_digests():
+    rng = np.random.default_rng(0)
+    values = rng.normal(100, 15, 40_000)
+    left, right = TDigest(), TDigest()
+    left.add(values[:20_000])
+    right.add(np.r_[values[20_000:], np.nan])
+    left.merge(right)
+    assert left.count == 40_000
+    assert len(left.means) <= 200
+    for q in (0.01, 0.5, 0.99):
+        assert abs(left.quantile(q) - np.quantile(values, q)) < 1.0
+    histogram = left.histogram(bins=10)
+    assert len(histogram["edges"]) == 11 and abs(sum(histogram["counts"]) - 40_000) <= 10
+
+
+def test_frequent_values_in_bounded_memory():
+    top = TopK(capacity=3)
+    top.add(pd.Series(list("aaaaabbbbcccdde")))
+    top.add(pd.Series(list("aaf")))
+    assert top.top(2) == [("a", 7), ("b", 4)]
+    assert len(top.counts) == 3
+    assert top.error > 0
+
+
+def test_chunked_profiles_equal_the_merged_profile():
+    df = pd.DataFrame({"amount": np.arange(1000) % 97, "country": ["UK", "FR", "UK", ""] * 250})
+    whole = profile_frames([df]).to_dict()["columns"]
+    parts = profile_frames([df.iloc[:300]]).merge(profile_frames([df.iloc[300:]]))
+    assert parts.rows == 1000 and parts.chunks == 2
+    for expected, merged in zip(whole, parts.to_dict()["columns"]):
+        for key in ("count", "nulls", "invalid", "distinct", "min", "max", "top"):
+            assert merged[key] == expected[key]
+    country = whole[1]
+    assert (country["nulls"], country["distinct"], country["measure"]) == (250, 2, "length")
+    assert country["top"][0] == ("UK", 500)
+
+
+def test_profile_of_a_csv_file(tmp_path):
+    path = tmp_path / "t.csv"
+    path.write_text("TransactionId,Cost,TransactionTime\n"
+                    + "".join(f"{i},{i / 2},2024-01-{i % 28 + 1:02d}\n" for i in range(500))
+                    + "x,oops,never\n")
+    profile = profile_file(str(path), chunk_rows=100)
+    assert profile.rows == 501 and profile.chunks == 6
+    columns = {c["name"]: c for c in profile.to_dict()["columns"]}
+    assert columns["TransactionId"]["dtype"] == "integer" and columns["TransactionId"]["invalid"] == 1
+    assert columns["Cost"]["max"] == 249.5 and columns["Cost"]["invalid"] == 1
+    assert columns["TransactionTime"]["min"] == "2024-01-01 00:00:00"
+    text = profile.to_prompt(["Cost"])
+    assert text.startswith("DATA PROFILE (all 501 rows") and "TransactionId" not in text
+
+
+def test_schema_types_are_used_when_given():
+    schema = infer_schema(b"code\n001\n002\n")
+    profile = DataProfile(schema)
+    profile.update(pd.DataFrame({"code": ["001", "002", "002"]}))
+    assert profile.columns["code"].dtype == "integer"
+    assert profile.to_dict()["columns"][0]["top"][0] == ("2", 2)
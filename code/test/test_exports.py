@@ -0,0 +1,81 @@
+import json
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import exports
+from exports import FORMATS, export, export_name, rules_csv
+
+DATA = {
+    "rules_list": [{"ruleid": "R1", "description": "Amount limit", "severity": "High"},
+                   {"ruleid": "R2", "description": "Country check", "condition": "Country != 'X'"}],
+    "transactions_list": [
+        {"transaction_id": "1", "flag": True, "risk_score": 80, "voilated_rules_list": ["R1"],
+         "explanation": "Over the limit", "remediation": ["Review"]},
+        {"transaction_id": "2", "flag": False, "risk_score": 90.0, "voilated_rules_list": ["R1", "R2"],
+         "explanation": "Listed only"},
+        {"transaction_id": "3", "flag": False, "risk_score": 5, "voilated_rules_list": []},
+    ],
+    "flagged_list": ["1", "2"],
+}
+
+
+def test_flagged_only_csv_writes_the_combined_flag():
+    """Regression: a transaction only in flagged_list was exported with flag=False"""
+    frame = pd.read_csv(export(DATA, "csv", "out.csv", flagged_only=True), dtype={"transaction_id": str})
+    assert frame["transaction_id"].tolist() == ["1", "2"]
+    assert frame["flag"].tolist() == [True, True]
+    assert frame.loc[1, "violated_rules"] == "R1; R2"
+
+
+def test_full_csv_keeps_every_transaction():
+    frame = pd.read_csv(export(DATA, "csv", "out.csv"), dtype={"transaction_id": str})
+    assert frame["transaction_id"].tolist() == ["1", "2", "3"]
+    assert frame["flag"].tolist() == [True, True, False]
+
+
+def test_empty_selection_still_writes_a_header():
+    data = dict(DATA, flagged_list=[], transactions_list=DATA["transactions_list"][2:])
+    with open(export(data, "csv", "out.csv", flagged_only=True)) as f:
+        assert f.read().startswith("transaction_id,")
+
+
+def test_csv_without_pyarrow_matches_the_arrow_path(monkeypatch):
+    """Regression: CSV export failed with a NameError when pyarrow was missing"""
+    with open(export(DATA, "csv", "arrow.csv")) as f:
+        expected = f.read()
+    monkeypatch.setattr(exports, "pa", None)
+    with open(export(DATA, "csv", "pandas.csv")) as f:
+        assert f.read() == expected
+    with open(export(DATA, "csv", "flagged.csv", flagged_only=True)) as f:
+        assert f.read().startswith("transaction_id,")
+
+
+def test_parquet_carries_rules_and_flagged_ids():
+    table = pq.read_table(export(DATA, "parquet", "out.parquet"))
+    assert table.column("flag").to_pylist() == [True, True, False]
+    metadata = table.schema.metadata
+    assert json.loads(metadata[b"flagged_list"]) == ["1", "2"]
+    assert [rule["ruleid"] for rule in json.loads(metadata[b"rules_list"])] == ["R1", "R2"]
+
+
+def test_pdf_report_lists_flagged_transactions():
+    fitz = pytest.importorskip("pymupdf")
+    with fitz.open(export(DATA, "pdf", "out.pdf", source="t.csv")) as doc:
+        text = "".join(page.get_text() for page in doc)
+    assert "Flagged transactions: 2" in text
+    assert text.index("2 · risk 90") < text.index("1 · risk 80")   # highest risk first
+    assert "Page 1 of" in text
+
+
+def test_rules_exports():
+    text = rules_csv(DATA["rules_list"])
+    assert text.splitlines()[0] == "ruleid,description,condition,severity,origin,remarks"
+    assert json.loads(open(export(DATA, "rules_json", "rules.json")).read())["rules_list"][1]["ruleid"] == "R2"
+
+
+def test_export_names():
+    assert export_name("data/tx.csv", "csv", flagged_only=True) == "tx-flagged.csv"
+    assert export_name("tx.csv", "rules_json") == "tx-rules.json"
+    assert set(FORMATS) >= {"csv", "parquet", "pdf"}
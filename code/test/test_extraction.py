@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+import extraction
+from conftest import counter
+from extraction import extract_bytes, extract_text
+
+fitz = pytest.importorskip("pymupdf")
+
+
+@pytest.fixture(autouse=True)
+def empty_memo(monkeypatch):
+    monkeypatch.setattr(extraction, "_memo", OrderedDict())
+    monkeypatch.setattr(extraction, "_memo_chars", 0)
+
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def test_pdf_pages_are_extracted_in_order():
+    text = extract_bytes(make_pdf(["first page", "second page"]), "rules.PDF")
+    assert text.index("first page") < text.index("second page")
+
+
+def test_large_pdfs_are_split_across_processes(monkeypatch):
+    monkeypatch.setattr(extraction, "PARALLEL_PAGE_THRESHOLD", 3)
+    monkeypatch.setattr(extraction, "MAX_WORKERS", 2)
+    pages = [f"page {i}" for i in range(5)]
+    try:
+        text = extract_bytes(make_pdf(pages), "big.pdf")
+        assert extraction._pool is not None
+    finally:
+        if extraction._pool is not None:
+            extraction._pool.shutdown()
+    assert [line for line in text.splitlines() if line.startswith("page")] == pages
+
+
+def test_docx_and_text_files():
+    doc = Document()
+    doc.add_paragraph("Rule one")
+    doc.add_paragraph("Rule two")
+    buffer = BytesIO()
+    doc.save(buffer)
+    assert extract_bytes(buffer.getvalue(), "rules.docx") == "Rule one\nRule two"
+    assert extract_bytes("café".encode("latin-1"), "rules.txt") == "café"
+
+
+def test_repeated_content_comes_from_the_memo(monkeypatch):
+    content = make_pdf(["memo me"])
+    first = extract_bytes(content, "a.pdf")
+    monkeypatch.setattr(extraction, "extract_pdf", lambda content: pytest.fail("extracted twice"))
+    assert extract_bytes(content, "b.pdf") == first
+    assert counter("cache_hits_total", cache="extraction") == 1
+
+
+def test_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(extraction, "MEMO_MAX_CHARS", 10)
+    for word in ("aaaaaa", "bbbbbb", "cccccc"):
+        extract_bytes(word.encode(), f"{word}.txt")
+    assert list(extraction._memo.values()) == ["cccccc"]
+    assert extraction._memo_chars == 6
+
+
+def test_unreadable_files_return_none(document):
+    assert extract_text(document("not a pdf", name="broken.pdf")) is None
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+
+import pytest
+
+import jobqueue
+from jobqueue import JobQueue, job_handler
+
+
+@job_handler("echo")
+def run_echo(context):
+    with open(context.path("data.txt"), "rb") as f:
+        return {"text": f.read().decode(), "value": context.inputs["value"]}
+
+
+@job_handler("broken")
+def run_broken(context):
+    logging.getLogger("profiliing").error("Analysis failed: upstream returned 503")
+    raise RuntimeError("analysis failed")
+
+
+def wait(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.status(job_id)
+        if job["status"] in jobqueue.FINISHED:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def backdate(queue, job_id, seconds):
+    with queue.lock:
+        queue.db.execute("UPDATE jobs SET updated = updated - ? WHERE id = ?", (seconds, job_id))
+        queue.db.commit()
+
+
+@pytest.fixture
+def queue():
+    return JobQueue("jobs", workers=1)
+
+
+def test_job_runs_with_its_saved_inputs(queue):
+    job_id = queue.submit("echo", {"value": 3}, files={"data.txt": b"hello"}, owner="a")
+    job = wait(queue, job_id)
+    assert job["status"] == "done"
+    assert queue.result(job_id) == {"text": "hello", "value": 3}
+
+
+def test_unknown_kind_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit("nope", {})
+
+
+def test_failed_job_stores_the_logged_cause(queue):
+    """Regression: st.error() is lost in worker threads, so the cause never reached jobs.error"""
+    job = wait(queue, queue.submit("broken", {}))
+    assert job["status"] == "failed"
+    assert job["error"] == "Analysis failed: upstream returned 503"
+
+
+def test_failed_analysis_reports_why(queue, fake_client, transactions_csv, document):
+    def unavailable(payload):
+        raise ConnectionError("model endpoint unreachable")
+
+    fake_client(unavailable)
+    path = transactions_csv({"Transaction_ID": ["T1"], "Amount": [5]})
+    with open("rules.txt", "wb") as f:
+        f.write(b"Amount must be positive.")
+    job_id = queue.submit("analysis", {"selected_files": ["rules.txt"], "transaction_file": path,
+                                       "generated_results": {}},
+                          files={"rules.txt": open("rules.txt", "rb"), path: open(path, "rb")})
+    job = wait(queue, job_id)
+    assert job["status"] == "failed"
+    assert "model endpoint unreachable" in job["error"]
+
+
+def test_prune_drops_old_finished_jobs_and_their_files(queue):
+    old = wait(queue, queue.submit("echo", {"value": 1}, files={"data.txt": b"x"}))["id"]
+    recent = wait(queue, queue.submit("echo", {"value": 2}, files={"data.txt": b"y"}))["id"]
+    backdate(queue, old, queue.max_age + 1)
+    queue.prune()
+    assert queue.status(old) is None and not os.path.exists(queue.job_dir(old))
+    assert queue.status(recent)["status"] == "done"
+
+
+def test_queued_jobs_are_not_pruned(monkeypatch):
+    queue = JobQueue("jobs", workers=1, max_age=0)
+    monkeypatch.setattr(queue, "_start_workers", lambda: None)
+    job_id = queue.submit("echo", {"value": 1}, files={"data.txt": b"x"})
+    backdate(queue, job_id, 60)
+    queue.prune()
+    assert queue.status(job_id) is not None
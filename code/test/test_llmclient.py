@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import llmclient
+from llmclient import LLMClient, TokenBucket, configure, get_setting
+from conftest import counter
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=None, headers=None, lines=()):
+        self.status_code = status
+        self.body = body if body is not None else {"choices": [], "usage": None}
+        self.headers = headers or {}
+        self.lines = list(lines)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code), response=self)
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    """Plays back a list of responses (or exceptions), one per POST"""
+
+    def __init__(self, responses, delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            outcome = self.responses.pop(0) if self.responses else FakeResponse()
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_client(responses, **options):
+    options = {"rate_per_sec": 0, "backoff_base": 0, **options}
+    client = LLMClient("http://llm.invalid/v1/chat", "key", model="m", **options)
+    client.session = FakeSession(responses)
+    return client
+
+
+def test_settings_prefer_overrides_then_environment(monkeypatch):
+    monkeypatch.setenv("LLM_BURST", "9")
+    assert get_setting("LLM_BURST") == "9"
+    configure(use_secrets=False, LLM_BURST=2, MODEL=None)
+    assert get_setting("LLM_BURST") == 2
+    assert "MODEL" not in llmclient._overrides
+    assert get_setting("UNKNOWN", "fallback") == "fallback"
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    # Two tokens come from the burst, two more take ~1/50 s each
+    assert 0.03 <= time.monotonic() - start < 1.0
+
+
+def test_retryable_statuses_are_retried():
+    reply = {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 3}}
+    client = make_client([FakeResponse(503), FakeResponse(429, headers={"Retry-After": "0"}), FakeResponse(body=reply)])
+    assert client.chat({"messages": []}) == reply
+    assert client.session.calls == 3
+    assert counter("llm_retries_total") == 2
+
+
+def test_connection_errors_are_retried_until_the_limit():
+    client = make_client([requests.exceptions.ConnectTimeout("slow")] * 3, max_retries=2)
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        client.post({"messages": []})
+    assert client.session.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    client = make_client([FakeResponse(400)])
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post({"messages": []})
+    assert client.session.calls == 1
+
+
+def test_backoff_honours_retry_after_up_to_the_maximum():
+    client = make_client([], backoff_base=1, backoff_max=5)
+    assert client._backoff(0, FakeResponse(429, headers={"Retry-After": "2"})) == 2
+    assert client._backoff(0, FakeResponse(429, headers={"Retry-After": "60"})) == 5
+    assert all(0 <= client._backoff(10) <= 5 for _ in range(20))
+
+
+def test_concurrency_is_capped():
+    client = make_client([], max_concurrency=2)
+    client.session.delay = 0.05
+    threads = [threading.Thread(target=client.post, args=({"messages": []},)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.session.calls == 6
+    assert client.session.peak <= 2
+
+
+def test_model_is_filled_in_and_usage_recorded():
+    usage = {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9}
+    client = make_client([FakeResponse(body={"choices": [], "usage": usage})])
+    seen = []
+    post = client.session.post
+    client.session.post = lambda url, json=None, **kwargs: seen.append(json) or post(url, json, **kwargs)
+    client.chat({"messages": []})
+    assert seen[0]["model"] == "m"
+    assert counter("llm_tokens_total", kind="prompt") == 7
+    assert counter("llm_tokens_total", kind="completion") == 2
+
+
+def test_stream_yields_server_sent_events():
+    lines = [": keep-alive", 'data: {"choices": [{"delta": {"content": "a"}}]}', "",
+             'data: {"choices": [{"delta": {"content": "b"}}], "usage": {"total_tokens": 4}}', "data: [DONE]",
+             'data: {"ignored": true}']
+    client = make_client([FakeResponse(lines=lines)])
+    chunks = list(client.stream({"messages": []}))
+    assert [c["choices"][0]["delta"]["content"] for c in chunks] == ["a", "b"]
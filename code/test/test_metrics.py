@@ -0,0 +1,63 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+from conftest import counter
+from metrics import REGISTRY, count, current_trace, span, trace, write_prometheus
+
+
+def test_spans_are_timed_and_grouped_by_trace():
+    with trace("analysis") as run:
+        with span("csv_load", rows=3):
+            pass
+        with span("csv_load"):
+            pass
+        count("cache_hits_total", cache="rules")
+    summary = run.to_dict()
+    assert summary["stages"]["csv_load"]["count"] == 2
+    assert summary["counters"] == {"cache_hits_total/rules": 1.0}
+    assert current_trace() is None
+    snapshot = REGISTRY.snapshot()
+    assert {h["name"] for h in snapshot["histograms"]} == {"stage_seconds", "run_seconds"}
+    assert counter("cache_hits_total", cache="rules") == 1
+
+
+def test_failed_spans_are_still_recorded(caplog):
+    caplog.set_level(logging.INFO, logger="metrics")
+    with pytest.raises(ValueError):
+        with span("request"):
+            raise ValueError("boom")
+    events = [json.loads(record.getMessage()) for record in caplog.records]
+    assert events[-1]["stage"] == "request" and events[-1]["failed"] is True
+
+
+def test_trace_decorates_functions_and_reaches_worker_threads():
+    seen = []
+
+    @trace("rules")
+    def run():
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(lambda: seen.append(current_trace()),))
+        worker.start()
+        worker.join()
+        return current_trace()
+
+    assert run().name == "rules"
+    assert seen[0].name == "rules"
+
+
+def test_prometheus_export(tmp_path):
+    count("llm_requests_total", status=200)
+    count("llm_requests_total", 2, status=429)
+    REGISTRY.observe("stage_seconds", 0.02, stage="prompt_build")
+    path = write_prometheus(str(tmp_path / "metrics.prom"))
+    text = open(path, encoding="utf-8").read()
+    assert "# TYPE auditor_llm_requests_total counter" in text
+    assert 'auditor_llm_requests_total{status="429"} 2' in text
+    assert 'auditor_stage_seconds_bucket{stage="prompt_build",le="0.01"} 0' in text
+    assert 'auditor_stage_seconds_bucket{stage="prompt_build",le="0.05"} 1' in text
+    assert 'auditor_stage_seconds_count{stage="prompt_build"} 1' in text
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,135 @@
+from datetime import date
+
+import pandas as pd
+
+import profiliing
+from outcomestore import Delta, OutcomeStore, row_fingerprints, ruleset_hash, transaction_fingerprints
+from profiliing import analyze
+
+
+def frame():
+    return pd.DataFrame({"Transaction_ID": ["T1", "T2", "T2", "T3"],
+                         "Amount": [10.0, 20.0, 30.0, 40.0],
+                         "Country": ["US", "DE", "DE", "FR"]})
+
+
+def reply(*tx_ids, flagged=()):
+    return {"analysis_data": {
+        "rules_list": [{"ruleid": "R1"}],
+        "transactions_list": [{"transaction_id": tx_id, "flag": tx_id in flagged, "risk_score": 50}
+                              for tx_id in tx_ids],
+        "flagged_list": list(flagged),
+    }}
+
+
+def test_row_fingerprints_ignore_column_order_and_padding():
+    df = frame()
+    padded = df[["Country", "Amount", "Transaction_ID"]].assign(Country=lambda d: " " + d["Country"])
+    assert (row_fingerprints(df) == row_fingerprints(padded)).all()
+
+
+def test_transaction_fingerprint_covers_all_its_rows():
+    df = frame()
+    _, before, _ = transaction_fingerprints(df, "Transaction_ID")
+    edited = df.copy()
+    edited.loc[2, "Amount"] = 31.0
+    _, after, _ = transaction_fingerprints(edited, "Transaction_ID")
+    assert before[0] == after[0] and before[2] == after[2]
+    assert before[1] != after[1]
+
+
+def test_ruleset_hash_separates_parts():
+    assert ruleset_hash(["ab", "c"]) != ruleset_hash(["a", "bc"])
+
+
+def test_second_run_only_sends_new_or_changed_transactions():
+    store = OutcomeStore("outcomes.sqlite")
+    first = Delta(store, "rs", frame(), "Transaction_ID")
+    assert first.reused == 0
+    first.save(reply("T1", "T2", "T3", flagged=("T2",)))
+
+    changed = frame()
+    changed.loc[3, "Amount"] = 41.0
+    second = Delta(store, "rs", changed, "Transaction_ID")
+    assert second.reused == 2
+    assert list(second.pending_frame()["Transaction_ID"]) == ["T3"]
+    cached = second.cached_data()
+    assert cached["flagged_list"] == ["T2"]
+    assert {tx["transaction_id"] for tx in cached["transactions_list"]} == {"T1", "T2"}
+    assert cached["rules_list"] == [{"ruleid": "R1"}]
+
+
+def test_other_rule_set_reuses_nothing():
+    store = OutcomeStore("outcomes.sqlite")
+    Delta(store, "rs", frame(), "Transaction_ID").save(reply("T1", "T2", "T3"))
+    assert Delta(store, "other", frame(), "Transaction_ID").reused == 0
+
+
+def test_transactions_missing_from_the_reply_stay_pending():
+    """Regression: a reply covering a subset used to store the rest as clean"""
+    store = OutcomeStore("outcomes.sqlite")
+    Delta(store, "rs", frame(), "Transaction_ID").save(reply("T1"))
+
+    second = Delta(store, "rs", frame(), "Transaction_ID")
+    assert second.reused == 1
+    assert sorted(second.pending_frame()["Transaction_ID"].unique()) == ["T2", "T3"]
+
+
+def test_flagged_only_transactions_are_stored_as_flagged():
+    store = OutcomeStore("outcomes.sqlite")
+    Delta(store, "rs", frame(), "Transaction_ID").save(
+        {"rules_list": [], "transactions_list": [], "flagged_list": ["T3"]})
+    second = Delta(store, "rs", frame(), "Transaction_ID")
+    assert second.reused == 1
+    assert second.cached_data()["flagged_list"] == ["T3"]
+
+
+def test_restrict_drops_verdicts_on_transactions_not_sent():
+    store = OutcomeStore("outcomes.sqlite")
+    Delta(store, "rs", frame(), "Transaction_ID").save(reply("T1", "T2"))
+    delta = Delta(store, "rs", frame(), "Transaction_ID")
+    restricted = delta.restrict(reply("T1", "T3", flagged=("T1", "T3")))
+    assert [tx["transaction_id"] for tx in restricted["transactions_list"]] == ["T3"]
+    assert restricted["flagged_list"] == ["T3"]
+
+
+def test_transaction_id_spellings_are_resolved():
+    """Regression: verdicts keyed 'transactionid' or 'TransactionId' were neither stored nor kept"""
+    store = OutcomeStore("outcomes.sqlite")
+    Delta(store, "rs", frame(), "Transaction_ID").save({
+        "rules_list": [],
+        "transactions_list": [{"transactionid": "T1", "flag": False, "risk_score": 5},
+                              {"TransactionId": "T2", "flag": True, "risk_score": 80}],
+        "flagged_list": ["T2"],
+    })
+    second = Delta(store, "rs", frame(), "Transaction_ID")
+    assert second.reused == 2
+    cached = second.cached_data()["transactions_list"]
+    assert sorted(tx["transaction_id"] for tx in cached) == ["T1", "T2"]
+    assert all(set(tx) == {"transaction_id", "flag", "risk_score"} for tx in cached)
+    restricted = second.restrict({"transactions_list": [{"TransactionId": "T3", "flag": False}]})
+    assert restricted["transactions_list"] == [{"TransactionId": "T3", "flag": False}]
+
+
+def test_verdicts_are_not_reused_on_another_day(monkeypatch, fake_client, model_reply, transactions_csv, document):
+    """Regression: time-relative verdicts ('older than 365 days') were reused after the date moved on"""
+    client = fake_client(model_reply(flagged={"T1"}))
+    path = transactions_csv({"Transaction_ID": ["T1", "T2"], "TransactionTime": ["2024-03-01", "2025-02-01"]})
+    documents = {"rules.txt": document("Transactions older than 365 days must be reviewed.")}
+
+    def run():
+        return analyze(selected_files=["rules.txt"], transaction_file=path, documents=documents,
+                       generated_results={})
+
+    run()
+    assert run()["analysis_data"]["incremental"]["reused"] == 2
+    assert len(client.payloads) == 1
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date(2099, 1, 1)
+
+    monkeypatch.setattr(profiliing, "date", Tomorrow)
+    assert run()["analysis_data"]["incremental"]["reused"] == 0
+    assert len(client.payloads) == 2
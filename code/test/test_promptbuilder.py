@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from llmclient import configure
+from metrics import REGISTRY, trace
+from promptbuilder import (PromptTooLarge, add_usage, check_payload, compact_transactions, log_usage,
+                           referenced_columns)
+
+
+def test_referenced_columns_keep_the_id_and_named_columns():
+    columns = ["TransactionId", "CostPerItem", "Country", "ItemDescription"]
+    assert referenced_columns(columns, "Cost per item must be positive") == ["TransactionId", "CostPerItem"]
+    assert referenced_columns(columns, "nothing relevant") == columns
+
+
+def test_compact_encoding_uses_a_legend_for_repeated_text():
+    df = pd.DataFrame({"TransactionId": [1, 2, 3, 4],
+                       "Country": ["United Kingdom"] * 3 + ["France"],
+                       "Amount": [1.5, 2.5, 3.5, 4.5]})
+    legend, csv = compact_transactions(df)
+    assert "Country: @0=United Kingdom | @1=France" in legend
+    assert csv.splitlines()[1:3] == ["1,@0,1.5", "2,@0,2.5"]
+
+
+def test_column_without_values_is_sent_as_is():
+    """Regression: a text column with only missing values raised 'boolean value of NA is ambiguous'"""
+    df = pd.DataFrame({"TransactionId": [1, 2], "Country": pd.Series([None, None], dtype=object)})
+    legend, csv = compact_transactions(df)
+    assert legend == ""
+    assert csv.splitlines() == ["TransactionId,Country", "1,", "2,"]
+
+
+def test_malformed_values_in_a_timestamp_column_are_kept():
+    """Regression: values that did not parse were sent as empty cells"""
+    times = [f"2025-01-{day:02d} 10:30:00" for day in range(1, 20)] + ["pending"]
+    df = pd.DataFrame({"TransactionId": range(20), "Time": times})
+    legend, csv = compact_transactions(df)
+    assert "Time: timestamps shortened" in legend
+    lines = csv.splitlines()
+    assert lines[1] == "0,2025-01-01 10:30"
+    assert lines[-1] == "19,pending"
+
+
+def test_oversized_payload_is_refused():
+    configure(use_secrets=False, MODEL_CONTEXT_TOKENS=1000)
+    payload = {"messages": [{"role": "user", "content": "word " * 5000}], "max_tokens": 200}
+    with pytest.raises(PromptTooLarge) as error:
+        check_payload(payload)
+    assert error.value.limit == 800
+
+
+def test_token_estimate_and_actual_reach_the_metrics():
+    """Regression: the estimate-vs-actual line went to an unconfigured logger only"""
+    with trace("analysis") as run:
+        log_usage("t.csv", 120, {"usage": {"prompt_tokens": 100, "completion_tokens": 7}})
+        log_usage("t.csv", 30, None)
+    assert run.counters["prompt_tokens_estimated_total"] == 150
+    assert run.counters["prompt_tokens_reported_total"] == 100
+    assert "auditor_prompt_tokens_estimated_total 150" in REGISTRY.render()
+
+
+def test_add_usage_sums_blocks():
+    total = add_usage(None, {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4})
+    total = add_usage(total, None)
+    assert add_usage(total, {"prompt_tokens": 2, "total_tokens": 2}) == {
+        "prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
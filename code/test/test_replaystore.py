@@ -0,0 +1,79 @@
+import pytest
+
+from llmclient import LLMClient, configure
+from mockllm import MockLLM
+from replaystore import ReplayMiss, ReplayStore, current_mode, fingerprint, replay_chunks, replay_mode
+
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "analyse"}], "temperature": 0.1}
+
+
+@pytest.fixture
+def mock():
+    server = MockLLM(transactions=3)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(mock):
+    return LLMClient(mock.url, "key", rate_per_sec=0, max_retries=0)
+
+
+def test_fingerprint_covers_prompt_model_and_parameters():
+    key = fingerprint(PAYLOAD)
+    assert fingerprint(dict(PAYLOAD, stream=True)) == key
+    assert fingerprint(dict(PAYLOAD, temperature=0.2)) != key
+    assert fingerprint(dict(PAYLOAD, model="other")) != key
+    assert fingerprint(dict(PAYLOAD, messages=[{"role": "user", "content": "other"}])) != key
+
+
+def test_store_round_trip(tmp_path):
+    store = ReplayStore(str(tmp_path / "replies.sqlite"))
+    assert store.get("k") is None
+    store.put("k", PAYLOAD, {"choices": [{"message": {"content": "x" * 1000}}]})
+    assert store.get("k")["choices"][0]["message"]["content"] == "x" * 1000
+    stats = store.stats()
+    assert stats["entries"] == 1 and stats["hits"] == 1 and stats["bytes"] < 1000
+
+
+def test_record_then_replay(client, mock):
+    with replay_mode("record"):
+        recorded = client.chat(PAYLOAD)
+        client.chat(PAYLOAD)
+    assert mock.requests == 2
+    with replay_mode("replay"):
+        assert client.chat(PAYLOAD) == recorded
+        client.chat(dict(PAYLOAD, temperature=0.9))  # a miss goes to the API and is saved
+        client.chat(dict(PAYLOAD, temperature=0.9))
+    assert mock.requests == 3
+
+
+def test_strict_mode_never_calls_the_api(client, mock):
+    configure(use_secrets=False, LLM_REPLAY_MODE="strict")
+    assert current_mode() == "strict"
+    with pytest.raises(ReplayMiss):
+        client.chat(PAYLOAD)
+    assert mock.requests == 0
+
+
+def test_streams_are_recorded_and_replayed(client, mock):
+    with replay_mode("record"):
+        live = "".join(chunk["choices"][0]["delta"]["content"] for chunk in client.stream(PAYLOAD)
+                       if chunk["choices"])
+    with replay_mode("strict"):
+        replayed = list(client.stream(PAYLOAD))
+        assert client.chat(PAYLOAD)["choices"][0]["message"]["content"] == live
+    assert "".join(chunk["choices"][0]["delta"]["content"] for chunk in replayed if chunk["choices"]) == live
+    assert replayed[-1]["usage"]["total_tokens"] > 0
+    assert mock.requests == 1
+
+
+def test_unknown_modes_are_rejected():
+    with replay_mode("sometimes"), pytest.raises(ValueError):
+        current_mode()
+
+
+def test_replayed_chunks_cover_the_whole_reply():
+    chunks = list(replay_chunks({"choices": [{"message": {"content": "y" * 5000}}], "usage": None}))
+    assert [len(c["choices"][0]["delta"]["content"]) for c in chunks[:-1]] == [2048, 2048, 904]
@@ -0,0 +1,64 @@
+import json
+import pickle
+
+from resultmodel import AnalysisResult, parse_analysis
+
+DATA = {
+    "risk_scoring_definition": "sum of segment scores",
+    "rules_list": [{"ruleid": "R1", "description": "Amount cap", "severity": "high", "condition": "Amount < 100"},
+                   {"rule_id": "R2", "origin": "policy.pdf"}],
+    "transactions_list": [
+        {"transaction_id": "T1", "voilated_rules_list": ["R1", "R2"], "flag": True, "risk_score": 90,
+         "risk_segments": {"amount": 60, "country": 30}, "explanation": "Large", "remediation": ["Review"]},
+        {"transactionid": "T2", "violated_rules": [], "flagged": False, "riskscore": 5,
+         "explaination": "Large", "extra_field": 1},
+        {"transaction_id": "T3", "voilated_rules_list": ["R9"], "flag": "yes", "risk_score": "high",
+         "risk_segments": {"country": 10, "amount": 0}},
+        {"transaction_id": None, "voilated_rules_list": ["R1"]},
+    ],
+    "flagged_list": ["T1", "T3"],
+}
+
+
+def test_round_trip_is_lossless():
+    result = parse_analysis(DATA)
+    assert result.to_dict() == DATA
+    assert parse_analysis(json.dumps({"analysis_data": DATA})).to_dict() == DATA
+
+
+def test_transactions_are_stored_column_wise():
+    result = parse_analysis(DATA)
+    assert len(result) == 4
+    assert list(result.ids) == ["T1", "T2", "T3", None]
+    assert result.scores[:2].tolist() == [90.0, 5.0]
+    assert result.flags.tolist()[:2] == [True, False]
+    assert result.violated_rules(0) == ["R1", "R2"]
+    assert result.violated_rules(2) == ["R9"]  # referenced but not listed
+    assert [rule["ruleid"] if "ruleid" in rule else rule["rule_id"] for rule in result.rules_list()] == ["R1", "R2"]
+    assert result.violation_counts().tolist() == [2, 0, 1, 1]
+    assert {rule: rows.tolist() for rule, rows in result.rule_rows().items()} == {"R1": [0, 3], "R2": [0], "R9": [2]}
+    # Repeated text is stored once
+    assert result.text["explanation"].values.count("Large") == 1
+
+
+def test_misspelled_keys_are_recognised():
+    result = parse_analysis(DATA)
+    assert result.transaction(1)["explaination"] == "Large"
+    assert result.text_value("explanation", 1) == "Large"
+    assert result.segment_scores(2) == {"country": 10, "amount": 0}
+
+
+def test_partial_replies_keep_their_shape():
+    data = {"transactions_list": [{"transaction_id": "T1", "flag": False}]}
+    assert parse_analysis(data).to_dict() == data
+    assert parse_analysis(None).to_dict() == {}
+
+
+def test_pickles_and_tables():
+    result = pickle.loads(pickle.dumps(parse_analysis(DATA)))
+    assert isinstance(result, AnalysisResult) and result.to_dict() == DATA
+    table = result.to_table([2, 0])
+    assert table.column("transaction_id").to_pylist() == ["T3", "T1"]
+    assert table.column("violated_rules").to_pylist() == [["R9"], ["R1", "R2"]]
+    assert table.column("remediation").to_pylist() == [None, '["Review"]']
+    assert table.column("amount").to_pylist() == [0.0, 60.0]
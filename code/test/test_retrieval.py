@@ -0,0 +1,47 @@
+from profiliing import rules_text
+from retrieval import chunk_document, expand_query, relevant_sections, tokenize
+from util import estimate_tokens
+
+# Paragraphs longer than half a chunk, so each one is a chunk of its own
+FILLER = "\n\n".join(f"Section {i}. " + "Staff training records are kept for audits of branch premises. " * 10
+                       for i in range(20))
+DOCUMENT = (FILLER + "\n\nSection 99. " + "A customer payment above 10000 USD in amount must be reported. " * 10
+            + "\n\n" + FILLER)
+
+
+def test_tokens_split_camel_case_and_drop_stopwords():
+    assert tokenize("TransactionAmount of the User_ID") == ["transaction", "amount", "user", "id"]
+
+
+def test_headers_expand_to_field_synonyms():
+    terms = expand_query(["User_ID", "Cost"])
+    assert {"customer", "amount", "identifier"} <= set(terms)
+    assert len(terms) == len(set(terms))
+
+
+def test_chunks_stay_under_the_target_size():
+    chunks = chunk_document("First sentence. " * 200 + "\n\nShort paragraph.", chunk_chars=300)
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert chunks[-1].endswith("Short paragraph.")
+
+
+def test_only_matching_sections_are_kept():
+    text = relevant_sections(DOCUMENT, ["User_ID", "Cost"], token_budget=200)
+    assert "10000 USD" in text
+    assert "training records" not in text
+    assert estimate_tokens(text) <= 200
+
+
+def test_small_documents_and_unmatched_queries():
+    assert relevant_sections("Short rules.", ["Cost"], token_budget=200) == "Short rules."
+    assert relevant_sections(DOCUMENT, ["Zzz"], token_budget=50) == DOCUMENT[:200]
+
+
+def test_rules_text_splits_the_budget_between_documents(document):
+    documents = {"a.txt": document(DOCUMENT, name="a.txt"), "b.txt": document("Country must not be sanctioned.")}
+    text = rules_text(["a.txt", "b.txt"], rules=[{"ruleid": "R1"}], headers=["Cost", "Country"],
+                      token_budget=400, documents=documents)
+    assert text.startswith("=== a.txt ===")
+    assert "10000 USD" in text and "training records" not in text
+    assert "=== b.txt ===\nCountry must not be sanctioned." in text
+    assert '"ruleid": "R1"' in text.split("=== STRUCTURED RULES ===")[1]
@@ -0,0 +1,118 @@
+import pandas as pd
+import pytest
+
+from ruleengine import (RuleCompileError, compile_condition, compile_rules, evaluate_rules,
+                        find_transaction_id_column, parse_datetimes, parse_rules, rule_mode)
+
+COLUMNS = ["TransactionId", "UserId", "Amount", "Country", "TransactionTime"]
+
+
+def frame():
+    return pd.DataFrame({
+        "TransactionId": [1, 1, 2, 3],
+        "UserId": [10, 10, -1, 12],
+        "Amount": [50.0, 20000.0, 5.0, None],
+        "Country": ["US", "US", "Iran", "FR"],
+        "TransactionTime": ["2024-01-01", "2024-01-01", "2030-01-01", "2024-02-01"],
+    })
+
+
+@pytest.mark.parametrize("condition, used", [
+    ("UserId >= 0 or UserId == -1", ["UserId"]),
+    ("amount BETWEEN 10 AND 100", ["Amount"]),
+    ("Country is not null AND Country <> 'Iran'", ["Country"]),
+    ("Country in ('Iran', 'Syria')", ["Country"]),
+    ("TransactionTime <= current_date", ["TransactionTime"]),
+])
+def test_supported_conditions_compile(condition, used):
+    _, found = compile_condition(condition, COLUMNS)
+    assert found == used
+
+
+@pytest.mark.parametrize("condition", [
+    "__import__('os').system('rm -rf /')",
+    "Amount.real > 0",
+    "Balance > 0",
+    "Country in high-risk list",
+    "",
+])
+def test_anything_else_is_rejected(condition):
+    with pytest.raises(RuleCompileError):
+        compile_condition(condition, COLUMNS)
+
+
+def test_quoted_literals_are_not_rewritten():
+    """Regression: '=', keywords and 'N days' inside quotes were rewritten like the expression around them"""
+    df = pd.DataFrame({"TransactionId": [1, 2, 3],
+                       "Code": ["A=B", "A==B", "A=B"],
+                       "Status": ["IN STOCK", "IN STOCK", "in STOCK"],
+                       "Note": ["5 days", "days(5)", "5 days"]})
+    rule = {"ruleid": "R1", "condition": "Code = 'A=B' AND Status IN ('IN STOCK', 'ON ORDER') and Note = \"5 days\"",
+            "condition_type": "flag"}
+    assert evaluate_rules(df, [rule])["flagged_list"] == ["1"]
+
+
+def test_parse_datetimes_handles_missing_values():
+    """Regression: a column with no values at all raised an IndexError"""
+    parsed = parse_datetimes(pd.Series([None, "2025-01-02 10:00", None], dtype=object))
+    assert parsed.isna().tolist() == [True, False, True]
+    assert parse_datetimes(pd.Series([None, None], dtype=object)).isna().all()
+
+
+def test_assert_and_flag_rules_are_evaluated_per_transaction():
+    rules = [
+        {"ruleid": "R1", "condition": "UserId >= 0", "condition_type": "assert", "severity": "High"},
+        {"ruleid": "R2", "condition": "Amount > 10000", "condition_type": "flag", "severity": "Low"},
+    ]
+    data = evaluate_rules(frame(), rules)
+    verdicts = {tx["transaction_id"]: tx for tx in data["transactions_list"]}
+    assert sorted(data["flagged_list"]) == ["1", "2"]
+    assert verdicts["1"]["voilated_rules_list"] == ["R2"]   # one of its two rows is over the limit
+    assert verdicts["2"]["voilated_rules_list"] == ["R1"]
+    assert verdicts["2"]["risk_score"] == 40
+    assert not verdicts["3"]["flag"]
+    assert data["unsupported_rules"] == []
+
+
+def test_rule_without_condition_type_goes_to_the_model():
+    """Regression: a neutral description used to turn a 'flag' condition into an assertion"""
+    rule = {"ruleid": "R1", "description": "Sanctioned country", "condition": "Country == 'Iran'"}
+    assert rule_mode(rule) is None
+    compiled, unsupported = compile_rules([rule], COLUMNS)
+    assert compiled == []
+    assert [r["ruleid"] for r in unsupported] == ["R1"]
+
+
+def test_rule_without_condition_type_still_takes_the_analytic_path():
+    """Regression: a compilable condition without condition_type skipped plan_analytic"""
+    rule = {"ruleid": "GEN005", "condition": "TransactionTime >= current_date - 365 days",
+            "description": "Transactions older than 365 days should trigger an alert"}
+    compiled, unsupported = compile_rules([rule], COLUMNS)
+    assert unsupported == []
+    assert compiled[0].analytic is not None and compiled[0].tree is None
+    data = evaluate_rules(frame(), [rule], now=pd.Timestamp("2025-03-01"))
+    assert sorted(data["flagged_list"]) == ["1", "3"]
+
+
+def test_condition_type_decides_the_meaning():
+    flag = {"ruleid": "R1", "condition": "Country == 'Iran'", "condition_type": "flag"}
+    assert evaluate_rules(frame(), [flag])["flagged_list"] == ["2"]
+    valid = dict(flag, condition_type="assert", description="Flag and report anything else")
+    assert sorted(evaluate_rules(frame(), [valid])["flagged_list"]) == ["1", "3"]
+
+
+def test_future_dates_are_flagged_against_now():
+    rule = {"ruleid": "R1", "condition": "TransactionTime <= current_date", "condition_type": "assert"}
+    data = evaluate_rules(frame(), [rule], now=pd.Timestamp("2025-01-01"))
+    assert data["flagged_list"] == ["2"]
+
+
+def test_parse_rules_reads_json_blocks():
+    content = ('Rules:\n```json\n{"rules_list": [{"ruleid": "R1", "condition": "Amount > 0"},'
+               ' {"ruleid": "R2"}]}\n```\n```json\nnot json\n```')
+    assert parse_rules(content) == [{"ruleid": "R1", "condition": "Amount > 0"}]
+
+
+def test_transaction_id_column_is_found_by_name():
+    assert find_transaction_id_column(["Amount", "Transaction_ID"]) == "Transaction_ID"
+    assert find_transaction_id_column(["Amount"]) is None
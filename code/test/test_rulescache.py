@@ -0,0 +1,59 @@
+import os
+import time
+
+from conftest import counter
+from rulescache import RulesCache, cache_key
+from rulesgeneration import generate_rules
+
+
+def test_key_depends_on_every_input():
+    base = cache_key(b"doc", "prompt", "model-a", 0.7)
+    assert base == cache_key(b"doc", "prompt", "model-a", 0.7)
+    assert len({base, cache_key(b"doc2", "prompt", "model-a", 0.7), cache_key(b"doc", "prompt2", "model-a", 0.7),
+                cache_key(b"doc", "prompt", "model-b", 0.7), cache_key(b"doc", "prompt", "model-a", 0.2)}) == 5
+    # Length-prefixed parts: moving bytes between fields changes the key
+    assert cache_key(b"ab", "c", "m", 0) != cache_key(b"a", "bc", "m", 0)
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = RulesCache(str(tmp_path / "rules"))
+    assert cache.get("k") is None
+    cache.put("k", {"content": "x"})
+    assert cache.get("k") == {"content": "x"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert counter("cache_hits_total", cache="rules") == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = RulesCache(str(tmp_path / "rules"), max_age=60)
+    cache.put("k", {"content": "x"})
+    old = time.time() - 120
+    os.utime(cache._path("k"), (old, old))
+    assert cache.get("k") is None
+    assert not os.path.exists(cache._path("k"))
+
+
+def test_least_recently_used_entries_are_evicted_over_budget(tmp_path):
+    cache = RulesCache(str(tmp_path / "rules"), max_bytes=1000)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, {"content": "x" * 90})
+        stamp = time.time() - 100 + i
+        os.utime(cache._path(key), (stamp, stamp))
+    cache.get("a")  # now the most recently used
+    cache.max_bytes = 3 * os.path.getsize(cache._path("a"))
+    cache.put("d", {"content": "x" * 90})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+
+
+def test_repeated_documents_skip_the_api(fake_client, document):
+    client = fake_client(lambda payload: '{"rules_list": [{"ruleid": "R1", "description": "Amount > 0", '
+                                         '"condition": "Amount > 0", "condition_type": "assert"}]}')
+    first = generate_rules(document("Amounts must be positive."))
+    second = generate_rules(document("Amounts must be positive.", name="copy.txt"))
+    assert len(client.payloads) == 1
+    assert second["cached"] and second["filename"] == "copy.txt"
+    assert second["content"] == first["content"]
+    generate_rules(document("Amounts must be below 100."))
+    assert len(client.payloads) == 2
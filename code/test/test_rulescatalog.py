@@ -0,0 +1,59 @@
+import json
+import time
+
+from extraction import file_hash
+from profiliing import structured_rules
+from rulescatalog import RulesCatalog, get_rules_catalog, referenced_columns
+from rulesgeneration import generate_rules
+
+RULES = [
+    {"ruleid": "R1", "condition": "Amount > 10000", "severity": "High", "category": "AML"},
+    {"ruleid": "R2", "condition": "Country in ('Iran', 'Syria')", "severity": "high", "category": "Sanctions"},
+    {"ruleid": "R3", "description": "Report anything unusual", "severity": "low"},
+    {"ruleid": "R4", "analytic": {"type": "window_sum", "key": "UserId", "time": "TransactionTime"},
+     "columns": ["Amount"]},
+]
+
+
+def test_columns_come_from_the_condition_and_analytic_spec():
+    assert referenced_columns(RULES[0]) == ["amount"]
+    assert referenced_columns(RULES[2]) == []
+    assert referenced_columns(RULES[3]) == ["userid", "transactiontime", "amount"]
+
+
+def test_rules_are_narrowed_by_column_category_and_severity(tmp_path):
+    catalog = RulesCatalog(str(tmp_path / "rules.sqlite"))
+    catalog.add("v1", "aml.txt", RULES)
+    assert catalog.has("v1") and catalog.rules("v2") is None
+    assert [r["ruleid"] for r in catalog.rules("v1")] == ["R1", "R2", "R3", "R4"]
+    # Rules naming other columns are dropped; rules naming none are kept
+    assert [r["ruleid"] for r in catalog.rules("v1", columns=["COUNTRY"])] == ["R2", "R3"]
+    # No rule names any of the columns: the document may call them something else
+    assert len(catalog.rules("v1", columns=["Betrag"])) == 4
+    assert [r["ruleid"] for r in catalog.rules("v1", severities=["HIGH"])] == ["R1", "R2"]
+    assert [r["ruleid"] for r in catalog.rules("v1", categories=["sanctions"], columns=["Amount"])] == ["R2"]
+    assert catalog.rules("v1")[3] == RULES[3]
+
+
+def test_versions_are_replaced_and_pruned(tmp_path):
+    catalog = RulesCatalog(str(tmp_path / "rules.sqlite"), max_age=60)
+    catalog.add("v1", "aml.txt", RULES)
+    catalog.add("v1", "aml.txt", RULES[:1])
+    catalog.add("v2", "aml.txt", RULES[1:2])
+    assert catalog.stats() == {"documents": 2, "rules": 2}
+    assert [v["version"] for v in catalog.versions("aml.txt")] == ["v2", "v1"]
+    catalog.db.execute("UPDATE documents SET used = ? WHERE version = 'v1'", (time.time() - 120,))
+    catalog.prune()
+    assert catalog.stats() == {"documents": 1, "rules": 1}
+    assert catalog.db.execute("SELECT COUNT(*) FROM rule_columns").fetchone()[0] == 1
+
+
+def test_generated_rules_are_catalogued_and_reused(fake_client, document):
+    reply = "Extracted rules:\n```json\n" + json.dumps({"rules_list": RULES}) + "\n```"
+    fake_client(lambda payload: reply)
+    generate_rules(document("AML policy"))
+    rules = structured_rules("rules.txt", generated_results={}, document=document("AML policy"),
+                             columns=["Amount", "UserId"])
+    # Only rules with a condition are catalogued, then narrowed to the columns
+    assert [r["ruleid"] for r in rules] == ["R1"]
+    assert get_rules_catalog().versions("rules.txt")[0]["version"] == file_hash(b"AML policy")
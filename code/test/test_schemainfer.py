@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from profiliing import profile
+from schemainfer import canonical_field, column_type, infer_schema, sniff_delimiter
+
+SAMPLE = (b"\xef\xbb\xbfUserId;TransactionId;TransactionTime;CostPerItem;Country;Flagged\n"
+          b"278166;6355745;Sat Feb 02 12:50:00 IST 2019;1.38;United Kingdom;yes\n"
+          b"337701;6283376;Wed Dec 26 09:06:00 IST 2018;3.52;France;no\n"
+          b"267099;6385599;Fri Feb 15 09:45:00 IST 2019;;EIRE;no\n")
+
+
+def test_layout_types_and_fields_of_a_csv():
+    schema = infer_schema(SAMPLE)
+    assert (schema.delimiter, schema.has_header, schema.sample_rows) == (";", True, 3)
+    columns = {c.name: c for c in schema.columns}
+    assert columns["UserId"].dtype == "integer" and columns["UserId"].canonical == "user_id"
+    assert columns["TransactionTime"].dtype == "datetime"
+    assert columns["TransactionTime"].format == "%a %b %d %H:%M:%S %Z %Y"
+    assert columns["CostPerItem"].dtype == "float" and columns["CostPerItem"].nulls == 1
+    assert columns["CostPerItem"].canonical == "unit_price" and columns["CostPerItem"].confidence == 1.0
+    assert columns["Flagged"].dtype == "boolean"
+    assert columns["Country"].example == "United Kingdom"
+
+
+def test_headerless_files_get_placeholder_names():
+    schema = infer_schema(b"1,2024-01-05,10.5\n2,2024-01-06,7.25\n3,2024-01-07,1\n")
+    assert not schema.has_header
+    assert schema.names == ["column_1", "column_2", "column_3"]
+    assert schema.columns[1].canonical == "timestamp" and schema.columns[1].confidence == 0.5
+
+
+def test_the_sample_is_cut_at_a_line_boundary():
+    content = b"id,amount\n" + b"".join(b"%d,%d.5\n" % (i, i) for i in range(1000))
+    schema = infer_schema(content, sample_bytes=100)
+    assert schema.sample_rows < 1000
+    assert schema.columns[1].dtype == "float" and schema.columns[1].invalid == 0
+
+
+@pytest.mark.parametrize("text, delimiter", [
+    ("a|b|c\n1|2|3", "|"),
+    ("a\tb\n1\t2", "\t"),
+    ('a,b\n"x;y",2', ","),
+])
+def test_delimiters(text, delimiter):
+    assert sniff_delimiter(text) == delimiter
+
+
+def test_partial_names_and_unexpected_types_lower_the_confidence():
+    assert canonical_field("Txn Amount (USD)", "float")[0] == "amount"
+    assert 0.5 <= canonical_field("Txn Amount (USD)", "float")[1] < 1.0
+    assert canonical_field("Amount", "string") == ("amount", 0.5)
+    assert canonical_field("zz", "integer") == (None, 0.0)
+
+
+def test_mostly_numeric_columns_count_invalid_values():
+    dtype, nulls, invalid, _ = column_type(pd.Series([str(i) for i in range(40)] + ["n/a", ""]))
+    assert (dtype, nulls, invalid) == ("integer", 1, 1)
+
+
+def test_schema_is_sent_with_the_prompt(fake_client, model_reply, transactions_csv, document):
+    client = fake_client(model_reply())
+    path = transactions_csv({"TransactionId": ["T1", "T2"], "CostPerItem": [1.5, 2.0]})
+    profile(["rules.txt"], path, documents={"rules.txt": document("Costs must be positive.")})
+    content = client.payloads[0]["messages"][-1]["content"]
+    assert "SCHEMA (inferred locally" in content
+    assert "CostPerItem: float -> unit_price 1.00" in content
@@ -0,0 +1,54 @@
+import json
+
+from profiliing import profile
+from streamparse import AnalysisStreamParser, element_end
+
+REPLY = json.dumps({"analysis_data": {
+    "rules_list": [{"ruleid": "R1", "description": 'Amount "over" 10000 ] or [ }'}, {"ruleid": "R2"}],
+    "transactions_list": [{"transaction_id": "T1", "risk_score": 80, "flag": True, "nested": {"a": [1, {"b": 2}]}},
+                          {"transaction_id": "T2", "risk_score": 0, "flag": False}],
+    "flagged_list": ["T1", 7, None],
+}}, indent=1)
+
+
+def feed_in_pieces(text, size):
+    parser, events = AnalysisStreamParser(), []
+    for start in range(0, len(text), size):
+        events += parser.feed(text[start:start + size])
+    return parser, events
+
+
+def test_elements_are_emitted_whole_whatever_the_chunking():
+    expected = json.loads(REPLY)["analysis_data"]
+    for size in (1, 3, 17, len(REPLY)):
+        parser, events = feed_in_pieces(REPLY, size)
+        assert parser.partial_result() == expected
+        assert [kind for kind, _ in events] == ["rule", "rule", "transaction", "transaction",
+                                                "flagged", "flagged", "flagged"]
+
+
+def test_elements_wait_until_they_are_complete():
+    parser = AnalysisStreamParser()
+    assert parser.feed('{"rules_list": [{"ruleid": "R1"}, {"ruleid": "R') == [("rule", {"ruleid": "R1"})]
+    assert parser.feed('2"}], "flagged_list": [12') == [("rule", {"ruleid": "R2"})]
+    # A number is only known to be complete once something follows it
+    assert parser.feed("3") == []
+    assert parser.feed("]}") == [("flagged", 123)]
+
+
+def test_element_end():
+    assert element_end('"a\\"b" tail', 0) == 6
+    assert element_end('{"a": "}"} tail', 0) == 10
+    assert element_end('[1, [2]', 0) is None
+    assert element_end("true,", 0) == 4
+
+
+def test_streamed_profile_reports_events_and_the_whole_reply(fake_client, transactions_csv, document):
+    fake_client(lambda payload: REPLY)
+    path = transactions_csv({"Transaction_ID": ["T1", "T2"], "Amount": [20000, 5]})
+    events = []
+    response = profile(["rules.txt"], path, on_event=lambda kind, item: events.append((kind, item)),
+                       documents={"rules.txt": document("Amount over 10000 is flagged.")})
+    assert response["choices"][0]["message"]["content"] == REPLY
+    assert response["usage"]["total_tokens"] == 15
+    assert [item["transaction_id"] for kind, item in events if kind == "transaction"] == ["T1", "T2"]
@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+import requests
+
+from llmclient import LLMClient
+from mockllm import MockLLM
+from synthdata import COLUMNS, HIGH_RISK_COUNTRIES, format_times, generate_transactions, write_csv
+
+NOW = datetime(2024, 3, 1, 12, 0)
+
+
+def test_rows_are_generated_in_chunks_with_running_ids():
+    chunks = list(generate_transactions(2500, violation_rate=0, now=NOW, chunk_rows=1000))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+    frame = pd.concat(chunks)
+    assert list(frame.columns) == COLUMNS
+    assert frame["TransactionId"].is_unique and frame["TransactionId"].is_monotonic_increasing
+    assert (frame["UserId"] > 0).all()
+    assert not frame["Country"].isin(HIGH_RISK_COUNTRIES).any()
+
+
+def test_violation_rate_and_seed():
+    first = next(generate_transactions(20000, violation_rate=0.1, seed=3, now=NOW))
+    again = next(generate_transactions(20000, violation_rate=0.1, seed=3, now=NOW))
+    pd.testing.assert_frame_equal(first, again)
+    broken = ((first["UserId"] < 0) | first["Country"].isin(HIGH_RISK_COUNTRIES)
+              | first["ItemDescription"].str.isdigit() | (first["NumberOfItemsPurchased"] == 1000))
+    # four of the eight violation kinds are counted here
+    assert 0.03 < broken.mean() < 0.08
+
+
+def test_times_are_formatted_like_the_sample():
+    offsets = pd.Series([0, 90, 24 * 3600]).to_numpy()
+    assert list(format_times(NOW, offsets)) == [
+        "Fri Mar 01 12:00:00 IST 2024", "Fri Mar 01 11:59:00 IST 2024", "Thu Feb 29 12:00:00 IST 2024"]
+
+
+def test_csv_has_a_single_header(tmp_path):
+    path = write_csv(str(tmp_path / "t.csv"), 1200, now=NOW)
+    frame = pd.read_csv(path)
+    assert len(frame) == 1200 and list(frame.columns) == COLUMNS
+
+
+@pytest.fixture
+def mock():
+    server = MockLLM(transactions=12)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_mock_endpoint_answers_plain_and_streamed(mock):
+    client = LLMClient(mock.url, "key", model="mock", rate_per_sec=0)
+    reply = client.chat({"messages": [{"role": "user", "content": "analyse"}]})
+    data = json.loads(reply["choices"][0]["message"]["content"])["analysis_data"]
+    assert len(data["transactions_list"]) == 12
+    assert data["flagged_list"] == ["6000000", "6000005", "6000010"]
+    assert reply["usage"]["total_tokens"] > 0
+
+    pieces = [chunk["choices"][0]["delta"]["content"]
+              for chunk in client.stream({"messages": [{"role": "user", "content": "analyse"}]})
+              if chunk["choices"]]
+    assert "".join(pieces) == reply["choices"][0]["message"]["content"]
+
+    screen = client.chat({"messages": [{"role": "user", "content": 'reply {"suspicious_list": []}'}]})
+    assert json.loads(screen["choices"][0]["message"]["content"])["uncertain_list"] == ["6000003", "6000010"]
+    assert mock.requests == 3
+
+
+def test_mock_endpoint_can_fail(mock):
+    mock.status = 400
+    with pytest.raises(requests.exceptions.HTTPError):
+        LLMClient(mock.url, "key", rate_per_sec=0).chat({"messages": []})
@@ -0,0 +1,100 @@
+import os
+
+import txnstore
+from ruleengine import compile_rules, evaluate_rules
+from txnstore import load_transactions
+
+CSV = b"Transaction_ID,Country,Amount\nT1,US,10\nT2,,20\nT3,NA,30\n"
+
+
+def test_empty_text_cells_are_null():
+    """Regression: with pyarrow, empty text cells were read as '' instead of null"""
+    df = load_transactions(write("t.csv", CSV)).to_pandas()
+    assert df["Country"].isna().tolist() == [False, True, True]
+
+
+def test_null_semantics_match_the_pandas_fallback(monkeypatch):
+    arrow = load_transactions(write("a.csv", CSV)).to_pandas()
+    monkeypatch.setattr(txnstore, "pa", None)
+    plain = load_transactions(write("b.csv", CSV + b"T4,DE,1\n")).to_pandas().head(3)
+    assert arrow["Country"].isna().tolist() == plain["Country"].isna().tolist()
+
+
+def test_not_null_rule_flags_an_empty_country():
+    df = load_transactions(write("t.csv", CSV)).to_pandas()
+    compiled, leftover = compile_rules(
+        [{"ruleid": "R1", "condition": "Country is not null", "condition_type": "assert"}], list(df.columns))
+    assert not leftover
+    assert sorted(evaluate_rules(df, compiled)["flagged_list"]) == ["T2", "T3"]
+
+
+def test_same_content_is_parsed_once():
+    first = load_transactions(write("a.csv", CSV))
+    assert load_transactions(write("b.csv", CSV)) is first
+    assert txnstore.get_transactions(first.key) is first
+
+
+def test_head_does_not_materialise_the_table():
+    table = load_transactions(write("t.csv", CSV))
+    assert list(table.head(2)["Transaction_ID"]) == ["T1", "T2"]
+    assert table._df is None
+
+
+def write(name, content):
+    with open(name, "wb") as f:
+        f.write(content)
+    return name
+
+
+def spilled(monkeypatch):
+    monkeypatch.setattr(txnstore, "SPILL_BYTES", 1)
+    table = load_transactions(write("t.csv", CSV))
+    assert table.path is not None
+    return table
+
+
+def test_spilled_table_does_not_keep_a_dataframe(monkeypatch):
+    """Regression: to_pandas() cached the whole DataFrame on the shared table"""
+    table = spilled(monkeypatch)
+    assert len(table.to_pandas()) == 3
+    assert table._df is None
+    assert list(table.to_pandas(["Amount"]).columns) == ["Amount"]
+
+
+def test_take_converts_only_the_given_rows(monkeypatch):
+    table = spilled(monkeypatch)
+    assert table.take([2, 0])["Transaction_ID"].tolist() == ["T3", "T1"]
+    assert table.take([1], columns=["Amount"]).to_dict("list") == {"Amount": [20]}
+    assert table._df is None
+
+
+def test_analysis_leaves_a_spilled_table_unconverted(monkeypatch):
+    from profiliing import analyze
+
+    table = spilled(monkeypatch)
+    rules = [{"ruleid": "R1", "condition": "Amount < 25", "condition_type": "assert"}]
+    result = analyze(["rules.txt"], table, documents={}, generated_results={"rules.txt": {"content": rules}})
+    assert result["analysis_data"]["flagged_list"] == ["T3"]
+    assert table._df is None
+
+
+def test_evicted_spill_file_is_deleted(monkeypatch):
+    """Regression: spilled IPC files stayed in .cache after their table was evicted"""
+    monkeypatch.setattr(txnstore, "MAX_TABLES", 1)
+    first = spilled(monkeypatch)
+    second = load_transactions(write("u.csv", CSV + b"T4,DE,40\n"))
+    assert not os.path.exists(first.path)
+    assert os.path.exists(second.path)
+    assert first.to_pandas()["Amount"].tolist() == [10, 20, 30]  # the mapping outlives the file
+
+
+def test_spill_directory_is_capped_but_keeps_loaded_tables(monkeypatch):
+    table = spilled(monkeypatch)
+    directory = os.path.dirname(table.path)
+    stale = os.path.join(directory, "stale.arrow")
+    with open(stale, "wb") as f:
+        f.write(b"x" * 100)
+    os.utime(stale, (0, 0))
+    txnstore.trim_spills(directory, max_bytes=0)
+    assert not os.path.exists(stale)
+    assert os.path.exists(table.path)